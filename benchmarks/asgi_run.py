@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""Compares how many concurrent connections the sync and async views sustain.
+
+The benchmark project is served by uvicorn, once with the sync views and once
+with the async ones (``drf_auth.async_urls``), and loaded over HTTP/1.1
+keep-alive connections at increasing concurrency. Each level reports
+requests/sec, p50/p99 latency, errors and timeouts; a level is within capacity
+when it has no errors or timeouts and its p99 stays under ``--slo-ms``. Needs
+``pip install uvicorn``.
+
+Usage::
+
+    python benchmarks/asgi_run.py --scenarios login,me --connections 10,100,500
+    python benchmarks/asgi_run.py --views async --duration 30 --output asgi.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run import (  # noqa: E402
+    PREFIX,
+    SCENARIOS,
+    Dataset,
+    percentile,
+    setup_django,
+)
+
+URLCONFS = {"sync": "benchmarks.urls", "async": "benchmarks.async_urls"}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scenarios",
+        default="login,me",
+        help="Comma separated scenarios of run.py (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--views",
+        default="sync,async",
+        help="Comma separated views to serve (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--connections",
+        default="1,10,50,100,200",
+        help="Comma separated numbers of concurrent connections.",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Seconds per level."
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=20, help="Unmeasured requests per server."
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=10.0, help="Seconds before a request fails."
+    )
+    parser.add_argument(
+        "--slo-ms",
+        type=float,
+        default=1000.0,
+        help="p99 latency a level must stay under to be within capacity.",
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument(
+        "--database", choices=("sqlite", "postgresql"), default="sqlite"
+    )
+    parser.add_argument("--hasher", help="Dotted path of the only password hasher.")
+    parser.add_argument(
+        "--authentication", help="Dotted path of the DRF authentication class."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of uvicorn worker processes."
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def get_server_env(views: str) -> dict:
+    """Environment making the server use the benchmark database and `views`."""
+    from django.db import connection
+
+    env = dict(os.environ, BENCH_URLCONF=URLCONFS[views])
+    if connection.vendor == "sqlite":
+        env["BENCH_DB_PATH"] = connection.settings_dict["NAME"]
+    else:
+        env["BENCH_DB_NAME"] = connection.settings_dict["NAME"]
+    return env
+
+
+def start_server(views: str, args) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "benchmarks.asgi:application",
+            "--host",
+            args.host,
+            "--port",
+            str(args.port),
+            "--workers",
+            str(args.workers),
+            "--no-access-log",
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=get_server_env(views),
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit("uvicorn exited with status %d." % server.returncode)
+        try:
+            socket.create_connection((args.host, args.port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit("uvicorn did not start listening on %s:%d." % (args.host, args.port))
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def build_request(method: str, path: str, data, headers: dict, host: str) -> bytes:
+    """Encodes a request of a run.py scenario as HTTP/1.1."""
+    body = json.dumps(data).encode() if data is not None else b""
+    lines = ["%s %s%s HTTP/1.1" % (method.upper(), PREFIX, path), "Host: " + host]
+    if data is not None:
+        lines.append("Content-Type: application/json")
+    lines.append("Content-Length: %d" % len(body))
+    for name, value in headers.items():
+        # run.py uses WSGI names, e.g. HTTP_AUTHORIZATION.
+        lines.append("%s: %s" % (name[5:].replace("_", "-").title(), value))
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple:
+    """
+    Reads one response.
+
+    Returns
+    -------
+    response: tuple
+        The status code, and whether the server keeps the connection open.
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers.get("connection", "").lower() != "close"
+
+
+async def run_connection(
+    scenario: str, dataset: Dataset, counter, deadline: float, args, limit=None
+):
+    """
+    Sends requests over one keep-alive connection.
+
+    Stops at `deadline`, or after `limit` requests.
+    """
+    expected, factory = SCENARIOS[scenario]
+    host = "%s:%d" % (args.host, args.port)
+    samples, errors, timeouts = [], 0, 0
+    reader = writer = None
+    sent = 0
+    while time.monotonic() < deadline and (limit is None or sent < limit):
+        sent += 1
+        request = build_request(*factory(dataset, next(counter)), host)
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(args.host, args.port), args.timeout
+                )
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(
+                read_response(reader), args.timeout
+            )
+        except asyncio.TimeoutError:
+            timeouts += 1
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors += 1
+        else:
+            samples.append(time.perf_counter() - start)
+            if status not in expected:
+                errors += 1
+            if keep_alive:
+                continue
+        # Reconnect after a failure, which leaves the connection in an unknown
+        # state, or when the server closes it.
+        if writer is not None:
+            writer.close()
+        reader = writer = None
+    if writer is not None:
+        writer.close()
+    return samples, errors, timeouts
+
+
+async def run_level(scenario, dataset, counter, connections: int, args) -> dict:
+    deadline = time.monotonic() + args.duration
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[
+            run_connection(scenario, dataset, counter, deadline, args)
+            for _ in range(connections)
+        ]
+    )
+    wall = time.perf_counter() - start
+    latencies = sorted(
+        elapsed * 1000 for samples, _, _ in results for elapsed in samples
+    )
+    errors = sum(errors for _, errors, _ in results)
+    timeouts = sum(timeouts for _, _, timeouts in results)
+    return {
+        "connections": connections,
+        "requests": len(latencies),
+        "errors": errors,
+        "timeouts": timeouts,
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def get_capacity(levels: list, slo_ms: float) -> int:
+    """Most connections of a level without failures and within the SLO."""
+    capacity = 0
+    for level in levels:
+        if level["errors"] or level["timeouts"] or level["p99_ms"] > slo_ms:
+            break
+        capacity = level["connections"]
+    return capacity
+
+
+def run_views(views: str, scenarios: list, dataset: Dataset, counter, args) -> dict:
+    server = start_server(views, args)
+    try:
+        results = {}
+        for scenario in scenarios:
+            asyncio.run(
+                run_connection(
+                    scenario,
+                    dataset,
+                    counter,
+                    time.monotonic() + args.timeout * args.warmup,
+                    args,
+                    limit=args.warmup,
+                )
+            )
+            levels = [
+                asyncio.run(run_level(scenario, dataset, counter, connections, args))
+                for connections in args.connection_levels
+            ]
+            results[scenario] = {
+                "levels": levels,
+                "capacity": get_capacity(levels, args.slo_ms),
+            }
+        return results
+    finally:
+        stop_server(server)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        sys.exit("Unknown scenario(s): %s" % ", ".join(unknown))
+    views = [name.strip() for name in args.views.split(",") if name.strip()]
+    unknown = [name for name in views if name not in URLCONFS]
+    if unknown:
+        sys.exit("Unknown views: %s" % ", ".join(unknown))
+    args.connection_levels = sorted(
+        int(level) for level in args.connections.split(",") if level.strip()
+    )
+    if importlib.util.find_spec("uvicorn") is None:
+        sys.exit("This benchmark needs uvicorn: pip install uvicorn")
+
+    setup_django(args)
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        dataset = Dataset(args.users, args.tokens)
+        dataset.create()
+        connection.close()
+        # Shared by every server and level, so no registration or OTP
+        # destination is used twice.
+        counter = itertools.count()
+        results = {
+            "meta": {
+                "database": connection.vendor,
+                "workers": args.workers,
+                "duration": args.duration,
+                "slo_ms": args.slo_ms,
+                "users": args.users,
+            },
+            "views": {
+                name: run_views(name, scenarios, dataset, counter, args)
+                for name in views
+            },
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
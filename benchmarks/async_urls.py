@@ -0,0 +1,5 @@
+from django.urls import include, path
+
+urlpatterns = [
+    path("api/auth/", include("drf_auth.async_urls")),
+]
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""Measures authentication throughput under a mix of known and unknown users.
+
+Threads call ``django.contrib.auth.authenticate`` with usernames, emails and
+mobile numbers, ``--miss-ratio`` of them unknown and drawn from ``--unknown``
+identifiers (as credential stuffing retries the same ones). The run is made
+with the negative lookup cache off and on (``AUTH["NEGATIVE_CACHE_TIMEOUT"]``),
+and each reports authentications/sec, queries per authentication, and
+p50/p99 latency of hits and misses; both run the password hasher, so their
+latencies should be close. Results are printed as JSON.
+
+Usage::
+
+    python benchmarks/auth_mix.py --threads 8 --attempts 2000 --miss-ratio 0.5
+    python benchmarks/auth_mix.py --hasher django.contrib.auth.hashers.MD5PasswordHasher
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run import PASSWORD, QueryCounter, percentile  # noqa: E402
+
+# Identifier kinds, used in turn.
+KINDS = ("username", "email", "mobile")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument(
+        "--attempts", type=int, default=1000, help="Authentications per mode."
+    )
+    parser.add_argument(
+        "--miss-ratio",
+        type=float,
+        default=0.5,
+        help="Fraction of authentications for unknown users.",
+    )
+    parser.add_argument(
+        "--users", type=int, default=1000, help="Number of users in the dataset."
+    )
+    parser.add_argument(
+        "--unknown", type=int, default=100, help="Number of unknown identifiers."
+    )
+    parser.add_argument(
+        "--database", choices=("sqlite", "postgresql"), default="sqlite"
+    )
+    parser.add_argument(
+        "--hasher",
+        help="Dotted path of the only password hasher to use (default: Django's).",
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def setup_django(args):
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    os.environ["BENCH_DB"] = args.database
+    if args.hasher:
+        os.environ["BENCH_PASSWORD_HASHER"] = args.hasher
+
+    import django
+
+    django.setup()
+
+
+def identifier(kind: str, i: int, known: bool) -> str:
+    prefix = "bench" if known else "unknown"
+    if kind == "email":
+        return "%s%d@example.com" % (prefix, i)
+    if kind == "mobile":
+        return "%s%09d" % ("9" if known else "8", i)
+    return "%s%d" % (prefix, i)
+
+
+def create_users(count: int):
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+
+    User = get_user_model()
+    password = make_password(PASSWORD)
+    for start in range(0, count, 1000):
+        User.objects.bulk_create(
+            [
+                User(
+                    username=identifier("username", i, True),
+                    name="Bench %d" % i,
+                    email=identifier("email", i, True),
+                    mobile=identifier("mobile", i, True),
+                    password=password,
+                )
+                for i in range(start, min(start + 1000, count))
+            ]
+        )
+
+
+def run_mode(cache_timeout: int, args) -> dict:
+    from django.conf import settings
+    from django.contrib.auth import authenticate
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test import override_settings
+    from drf_auth.app_settings import drf_auth_settings
+
+    counter = itertools.count()
+
+    def worker():
+        queries = QueryCounter()
+        samples = []
+        try:
+            with connection.execute_wrapper(queries):
+                while True:
+                    i = next(counter)
+                    if i >= args.attempts:
+                        return samples
+                    rng = random.Random(i)
+                    known = rng.random() >= args.miss_ratio
+                    kind = KINDS[i % len(KINDS)]
+                    username = identifier(
+                        kind,
+                        rng.randrange(args.users if known else args.unknown),
+                        known,
+                    )
+                    queries.count = 0
+                    start = time.perf_counter()
+                    user = authenticate(None, username=username, password=PASSWORD)
+                    elapsed = time.perf_counter() - start
+                    samples.append((known, elapsed, queries.count, known == bool(user)))
+        finally:
+            connection.close()
+
+    auth = dict(settings.DRF_AUTH_SETTINGS.get("AUTH", {}))
+    auth["NEGATIVE_CACHE_TIMEOUT"] = cache_timeout
+    with override_settings(
+        DRF_AUTH_SETTINGS=dict(settings.DRF_AUTH_SETTINGS, AUTH=auth)
+    ):
+        caches[drf_auth_settings.AUTH.CACHE_ALIAS].clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            futures = [executor.submit(worker) for _ in range(args.threads)]
+            samples = [sample for future in futures for sample in future.result()]
+        wall = time.perf_counter() - start
+
+    result = {
+        "negative_cache_timeout": cache_timeout,
+        "attempts": len(samples),
+        "errors": sum(1 for _, _, _, ok in samples if not ok),
+        "auth_per_sec": round(len(samples) / wall, 2) if wall else 0.0,
+        "queries_per_auth": (
+            round(sum(count for _, _, count, _ in samples) / len(samples), 3)
+            if samples
+            else 0.0
+        ),
+    }
+    for name, known in (("hit", True), ("miss", False)):
+        latencies = sorted(
+            elapsed * 1000 for hit, elapsed, _, _ in samples if hit == known
+        )
+        result[name] = {
+            "count": len(latencies),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+        }
+    return result
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not 0 <= args.miss_ratio <= 1:
+        sys.exit("--miss-ratio must be between 0 and 1.")
+
+    setup_django(args)
+    from django.conf import settings
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        create_users(args.users)
+        results = {
+            "meta": {
+                "database": connection.vendor,
+                "hasher": settings.PASSWORD_HASHERS[0],
+                "threads": args.threads,
+                "miss_ratio": args.miss_ratio,
+                "unknown": args.unknown,
+            },
+            "modes": {"uncached": run_mode(0, args), "cached": run_mode(60, args)},
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Compares JWT authentication classes on authenticated endpoints.
+
+``run.py`` is run once per class of ``--classes``, each in its own process as
+the class is read from the settings, with the same scenarios and load. Each
+class reports requests/sec, p50/p99 latency and queries per request, and its
+requests/sec relative to the first class. Results are printed as JSON.
+
+Usage::
+
+    python benchmarks/authentication.py --concurrency 8 --requests 2000
+    python benchmarks/authentication.py --scenarios me --database postgresql
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CLASSES = (
+    "rest_framework_simplejwt.authentication.JWTAuthentication",
+    "drf_auth.authentication.TokenUserAuthentication",
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--classes",
+        default=",".join(CLASSES),
+        help="Comma separated authentication classes (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--scenarios",
+        default="me",
+        help="Comma separated run.py scenarios (default: %(default)s).",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--requests", type=int, default=1000, help="Measured requests per scenario."
+    )
+    parser.add_argument(
+        "--tokens",
+        type=int,
+        default=200,
+        help="Number of users issued tokens for the requests.",
+    )
+    parser.add_argument(
+        "--database", choices=("sqlite", "postgresql"), default="sqlite"
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def run(authentication: str, args) -> dict:
+    """Runs `run.py` with `authentication` and returns its scenarios."""
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(HERE, "run.py"),
+                "--scenarios",
+                args.scenarios,
+                "--concurrency",
+                str(args.concurrency),
+                "--requests",
+                str(args.requests),
+                "--tokens",
+                str(args.tokens),
+                "--users",
+                str(args.tokens),
+                "--database",
+                args.database,
+                "--authentication",
+                authentication,
+                "--output",
+                output.name,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        return json.load(output)["scenarios"]
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    classes = [name.strip() for name in args.classes.split(",") if name.strip()]
+    if not classes:
+        sys.exit("--classes needs at least one authentication class.")
+
+    results = {
+        "meta": {"database": args.database, "concurrency": args.concurrency},
+        "classes": {
+            authentication: run(authentication, args) for authentication in classes
+        },
+    }
+    baseline = results["classes"][classes[0]]
+    for scenarios in results["classes"].values():
+        for name, scenario in scenarios.items():
+            before = baseline[name]["rps"]
+            scenario["speedup"] = round(scenario["rps"] / before, 2) if before else 0.0
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
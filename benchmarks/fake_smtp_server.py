@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Runs a local SMTP sink that accepts and discards mail, printing throughput.
+
+Point ``EMAIL_HOST``/``EMAIL_PORT`` at it to benchmark message delivery
+without a real mail provider. Every ``--report-interval`` seconds it prints
+the number of messages received and the rate since the last report. It does
+not need Django.
+
+Usage::
+
+    python benchmarks/fake_smtp_server.py --port 1025
+"""
+import argparse
+import socketserver
+import sys
+import threading
+import time
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Accepts any message and discards it, counting deliveries."""
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost fake SMTP ready")
+        in_data = False
+        for raw in self.rfile:
+            line = raw.rstrip(b"\r\n")
+            if in_data:
+                if line == b".":
+                    in_data = False
+                    self.server.count_message()
+                    self.reply("250 OK")
+                continue
+
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.reply("250-localhost")
+                self.reply("250 PIPELINING")
+            elif command == b"DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("250 OK")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    def count_message(self):
+        with self.lock:
+            self.messages += 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between throughput reports.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    server = FakeSMTPServer((args.host, args.port), FakeSMTPHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print("Fake SMTP server listening on %s:%d" % (args.host, args.port), flush=True)
+
+    last_count, last_time = 0, time.monotonic()
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            now, count = time.monotonic(), server.messages
+            print(
+                "%d message(s) received, %.1f msg/s"
+                % (count, (count - last_count) / (now - last_time)),
+                flush=True,
+            )
+            last_count, last_time = count, now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
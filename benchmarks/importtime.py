@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""Measures how long importing drf_auth takes, with ``python -X importtime``.
+
+Each target is imported in a fresh interpreter, after ``django.setup()`` with the
+benchmark project's settings; ``setup`` measures app loading alone. A target
+reports the time spent importing drf_auth modules (including what they import,
+but not what Django had already imported), the total import time and the
+slowest modules imported for drf_auth. Results are printed as JSON.
+
+Usage::
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --targets setup,drf_auth.views --budget-ms 20
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TARGETS = (
+    "setup",
+    "drf_auth.urls",
+    "drf_auth.management.commands.purge_otps",
+    "drf_auth.management.commands.process_messages",
+)
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--targets",
+        default=",".join(DEFAULT_TARGETS),
+        help="Comma separated modules to import, or setup (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Measured runs per target; the fastest is kept.",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of slowest modules to list."
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        help="Fail when drf_auth takes longer than this to import at setup.",
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def parse_importtime(output: str) -> list:
+    """
+    Parses the ``-X importtime`` lines of `output`.
+
+    Returns
+    -------
+    imports: list
+        `(module, self_us, cumulative_us, ancestors)` tuples, where `ancestors`
+        are the modules whose import caused this one, outermost first.
+    """
+    entries = []
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us), int(cumulative_us), len(indent)))
+
+    # A module is listed after the modules it imports, which are indented
+    # deeper; walking backwards, the enclosing imports are on the stack.
+    imports, stack = [], []
+    for module, self_us, cumulative_us, depth in reversed(entries):
+        while stack and stack[-1][1] >= depth:
+            stack.pop()
+        imports.append((module, self_us, cumulative_us, [name for name, _ in stack]))
+        stack.append((module, depth))
+    imports.reverse()
+    return imports
+
+
+def is_drf_auth(module: str) -> bool:
+    return module == "drf_auth" or module.startswith("drf_auth.")
+
+
+def measure(target: str, top: int) -> dict:
+    code = "import django; django.setup()"
+    if target != "setup":
+        code += "; import " + target
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="benchmarks.settings")
+    # Stale bytecode would be recompiled on every run otherwise.
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if process.returncode:
+        sys.exit("Importing %s failed:\n%s" % (target, process.stderr))
+
+    imports = parse_importtime(process.stderr)
+    total_us = sum(
+        cumulative for _, _, cumulative, ancestors in imports if not ancestors
+    )
+    # Outermost drf_auth imports, so nested ones are not counted twice.
+    drf_auth_us = sum(
+        cumulative
+        for module, _, cumulative, ancestors in imports
+        if is_drf_auth(module) and not any(map(is_drf_auth, ancestors))
+    )
+    slowest = sorted(
+        (
+            (self_us, module)
+            for module, self_us, _, ancestors in imports
+            if is_drf_auth(module) or any(map(is_drf_auth, ancestors))
+        ),
+        reverse=True,
+    )[:top]
+    return {
+        "drf_auth_ms": round(drf_auth_us / 1000.0, 3),
+        "total_ms": round(total_us / 1000.0, 3),
+        "slowest": [
+            {"module": module, "self_ms": round(self_us / 1000.0, 3)}
+            for self_us, module in slowest
+        ],
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    targets = [name.strip() for name in args.targets.split(",") if name.strip()]
+
+    results = {"python": sys.version.split()[0], "targets": {}}
+    for target in targets:
+        # Unmeasured, to write bytecode for what the target imports.
+        measure(target, args.top)
+        runs = [measure(target, args.top) for _ in range(max(args.repeat, 1))]
+        results["targets"][target] = min(runs, key=lambda run: run["drf_auth_ms"])
+
+    status = 0
+    if args.budget_ms is not None:
+        setup = results["targets"].get("setup") or measure("setup", args.top)
+        results["budget_ms"] = args.budget_ms
+        if setup["drf_auth_ms"] > args.budget_ms:
+            sys.stderr.write(
+                "OVER BUDGET: drf_auth imports take %.3f ms at setup (budget %.3f ms)\n"
+                % (setup["drf_auth_ms"], args.budget_ms)
+            )
+            status = 1
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""Checks that concurrent OTP verifications are exact, and measures their throughput.
+
+Two phases run against a fresh database, with the OTP sent (so it is in its
+cooling period and is not reset when its attempts run out):
+
+* ``exactness``: for each of ``--rounds`` destinations, ``--threads`` threads
+  verify at the same time, all with a wrong OTP, then all with the right one.
+  With ``VALIDATION_ATTEMPTS`` attempts, exactly that many wrong verifications
+  may consume one, each leaving a different count, and the right OTP must be
+  validated exactly once.
+* ``throughput``: the threads verify wrong OTPs for ``--hot`` destinations for
+  ``--duration`` seconds, resending each OTP once its attempts run out, and
+  verifications/sec, p50/p99 latency and outcomes are reported.
+
+Results are printed as JSON; the run exits with status 1 if a round was not
+exact.
+
+Usage::
+
+    python benchmarks/otp_contention.py --threads 16 --rounds 50
+    python benchmarks/otp_contention.py --database postgresql --hot 1 --duration 30
+"""
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run import percentile  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--rounds", type=int, default=20, help="Destinations checked for exactness."
+    )
+    parser.add_argument(
+        "--hot",
+        type=int,
+        default=4,
+        help="Destinations shared by every thread in the throughput phase.",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Seconds of the throughput phase."
+    )
+    parser.add_argument(
+        "--database", choices=("sqlite", "postgresql"), default="sqlite"
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def setup_django(args):
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    os.environ["BENCH_DB"] = args.database
+
+    import django
+
+    django.setup()
+
+
+def send(destination: str):
+    """
+    Stores a fresh OTP for `destination`, in its cooling period like a sent
+    one, so running out of attempts does not reset it.
+    """
+    from django.utils import timezone
+    from django.utils.crypto import get_random_string
+    from drf_auth.app_settings import drf_auth_settings
+    from drf_auth.models import OTPValidation
+    from drf_auth.otp_store import get_otp_store
+
+    otp_settings = drf_auth_settings.OTP
+    return get_otp_store().reset(
+        destination=destination,
+        prop=OTPValidation.EMAIL,
+        otp=get_random_string(
+            length=otp_settings.LENGTH, allowed_chars=otp_settings.ALLOWED_CHARS
+        ),
+        attempts=otp_settings.VALIDATION_ATTEMPTS,
+        reactive_at=timezone.now() + datetime.timedelta(minutes=5),
+    )
+
+
+def verify(destination: str, otp: str) -> str:
+    """Verifies `otp`, and returns the outcome."""
+    from django.db import DatabaseError
+    from drf_auth.utils import validate_otp
+    from rest_framework.exceptions import AuthenticationFailed, NotFound
+
+    try:
+        validate_otp(destination, otp)
+    except NotFound:
+        return "not_pending"
+    except AuthenticationFailed as err:
+        # e.g. "OTP Validation failed! 2 attempts left!"
+        words = [word for word in str(err.detail).split() if word.isdigit()]
+        return "left_" + words[0] if words else "exceeded"
+    except DatabaseError:
+        return "error"
+    return "validated"
+
+
+def run_concurrently(executor, threads: int, func, *args) -> list:
+    """Calls `func(*args)` from `threads` threads at the same time."""
+    from django.db import connection
+
+    barrier = threading.Barrier(threads)
+
+    def call():
+        try:
+            barrier.wait()
+            return func(*args)
+        finally:
+            connection.close()
+
+    return [
+        future.result() for future in [executor.submit(call) for _ in range(threads)]
+    ]
+
+
+def check_round(executor, destination: str, attempts: int, threads: int) -> list:
+    """Returns what was not exact for `destination`, if anything."""
+    from drf_auth.models import OTPValidation
+
+    problems = []
+    send(destination)
+    wrong = collections.Counter(
+        run_concurrently(executor, threads, verify, destination, "wrong")
+    )
+    # Each consumed attempt leaves a different count; the others find no
+    # pending OTP.
+    consumed = min(threads, attempts)
+    expected = collections.Counter(
+        "left_%d" % left if left else "exceeded"
+        for left in range(attempts - consumed, attempts)
+    )
+    if threads > consumed:
+        expected["not_pending"] = threads - consumed
+    if wrong != expected:
+        problems.append({"wrong": dict(wrong), "expected": dict(expected)})
+    left = OTPValidation.objects.get(destination=destination).validate_attempt
+    if left != attempts - consumed:
+        problems.append({"attempts_left": left, "expected": attempts - consumed})
+
+    record = send(destination)
+    right = collections.Counter(
+        run_concurrently(executor, threads, verify, destination, record.otp)
+    )
+    expected = collections.Counter(validated=1)
+    if threads > 1:
+        expected["not_pending"] = threads - 1
+    if right != expected:
+        problems.append({"right": dict(right), "expected": dict(expected)})
+    return problems
+
+
+def run_exactness(executor, args, run_id: str) -> dict:
+    from drf_auth.app_settings import drf_auth_settings
+
+    attempts = drf_auth_settings.OTP.VALIDATION_ATTEMPTS
+    failures = []
+    for index in range(args.rounds):
+        destination = "exact-%s-%d@example.com" % (run_id, index)
+        problems = check_round(executor, destination, attempts, args.threads)
+        if problems:
+            failures.append({"destination": destination, "problems": problems})
+    return {
+        "rounds": args.rounds,
+        "attempts": attempts,
+        "exact": not failures,
+        "failures": failures,
+    }
+
+
+def run_throughput(executor, args, run_id: str) -> dict:
+    from django.db import connection
+
+    destinations = [
+        "hot-%s-%d@example.com" % (run_id, index) for index in range(args.hot)
+    ]
+    for destination in destinations:
+        send(destination)
+    counter = itertools.count()
+    deadline = time.monotonic() + args.duration
+
+    def worker():
+        samples, outcomes = [], collections.Counter()
+        try:
+            while time.monotonic() < deadline:
+                destination = destinations[next(counter) % len(destinations)]
+                start = time.perf_counter()
+                outcome = verify(destination, "wrong")
+                samples.append(time.perf_counter() - start)
+                if outcome == "exceeded":
+                    send(destination)
+                outcomes["left" if outcome.startswith("left_") else outcome] += 1
+            return samples, outcomes
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    results = [
+        future.result()
+        for future in [executor.submit(worker) for _ in range(args.threads)]
+    ]
+    wall = time.perf_counter() - start
+
+    latencies = sorted(elapsed * 1000 for samples, _ in results for elapsed in samples)
+    outcomes = sum((outcomes for _, outcomes in results), collections.Counter())
+    return {
+        "destinations": args.hot,
+        "operations": len(latencies),
+        "errors": outcomes.pop("error", 0),
+        "ops_per_sec": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "outcomes": dict(outcomes),
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    setup_django(args)
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        run_id = uuid.uuid4().hex[:8]
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            results = {
+                "meta": {"database": connection.vendor, "threads": args.threads},
+                "exactness": run_exactness(executor, args, run_id),
+                "throughput": run_throughput(executor, args, run_id),
+            }
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0 if results["exactness"]["exact"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""Measures OTP generation latency as the OTP table grows.
+
+The table is filled with pending (unvalidated) OTPs up to each of ``--sizes``
+rows, then ``generate_otp`` is timed ``--operations`` times for new
+destinations and as many times for destinations already in the table. OTPs
+are only looked up by their (indexed) destination, so the latency should
+stay flat however many rows there are. Each level reports p50/p99 latency
+for both kinds and the p50 slowdown against the smallest level. Results are
+printed as JSON.
+
+Usage::
+
+    python benchmarks/otp_growth.py --sizes 0,100000,1000000
+    python benchmarks/otp_growth.py --database postgresql --sizes 0,10000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run import percentile  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        default="0,100000,1000000",
+        help="Comma separated numbers of rows in the OTP table (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--operations",
+        type=int,
+        default=500,
+        help="OTPs generated per level, for each kind of destination.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=10000,
+        help="Rows inserted at a time while filling the table.",
+    )
+    parser.add_argument(
+        "--database", choices=("sqlite", "postgresql"), default="sqlite"
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def setup_django(args):
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    os.environ["BENCH_DB"] = args.database
+
+    import django
+
+    django.setup()
+
+
+def seed_destination(i: int) -> str:
+    return "seed-%d@example.com" % i
+
+
+def fill(start: int, stop: int, batch_size: int):
+    """Inserts pending OTPs for the seed destinations `start` to `stop`."""
+    import datetime
+
+    from django.utils import timezone
+    from django.utils.crypto import get_random_string
+    from drf_auth.app_settings import drf_auth_settings
+    from drf_auth.models import OTPValidation
+
+    otp_settings = drf_auth_settings.OTP
+    # In the past, so generating an OTP for a seeded destination resets it.
+    reactive_at = timezone.now() - datetime.timedelta(minutes=1)
+    for offset in range(start, stop, batch_size):
+        OTPValidation.objects.bulk_create(
+            [
+                OTPValidation(
+                    destination=seed_destination(i),
+                    prop=OTPValidation.EMAIL,
+                    otp=get_random_string(
+                        length=otp_settings.LENGTH,
+                        allowed_chars=otp_settings.ALLOWED_CHARS,
+                    ),
+                    validate_attempt=otp_settings.VALIDATION_ATTEMPTS,
+                    reactive_at=reactive_at,
+                )
+                for i in range(offset, min(offset + batch_size, stop))
+            ]
+        )
+
+
+def measure(destinations: list) -> dict:
+    """Generates an OTP for each of `destinations` and returns the latency."""
+    from drf_auth.models import OTPValidation
+    from drf_auth.utils import generate_otp
+
+    latencies = []
+    for destination in destinations:
+        start = time.perf_counter()
+        generate_otp(OTPValidation.EMAIL, destination)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def run_level(size: int, args, run_id: str) -> dict:
+    from drf_auth.models import OTPValidation
+
+    # Destinations generated by earlier levels count towards the size too.
+    rows = OTPValidation.objects.count()
+    seeded = OTPValidation.objects.filter(destination__startswith="seed-").count()
+    if size > rows:
+        fill(seeded, seeded + size - rows, args.batch_size)
+        seeded += size - rows
+
+    new = [
+        "new-%s-%d-%d@example.com" % (run_id, size, i) for i in range(args.operations)
+    ]
+    existing = [
+        seed_destination(i)
+        for i in random.sample(range(seeded), min(args.operations, seeded))
+    ]
+    result = {"rows": OTPValidation.objects.count(), "new": measure(new)}
+    if existing:
+        result["existing"] = measure(existing)
+    return result
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    sizes = sorted(int(size) for size in args.sizes.split(",") if size.strip())
+    if not sizes or sizes[0] < 0:
+        sys.exit("--sizes needs numbers of rows.")
+
+    setup_django(args)
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        run_id = uuid.uuid4().hex[:8]
+        results = {
+            "meta": {"database": connection.vendor, "operations": args.operations},
+            "levels": [run_level(size, args, run_id) for size in sizes],
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    baseline = results["levels"][0]["new"]["p50_ms"]
+    for level in results["levels"]:
+        level["slowdown"] = (
+            round(level["new"]["p50_ms"] / baseline, 2) if baseline else 0.0
+        )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""Measures OTP write throughput as OTP state is sharded across databases.
+
+Threads send and verify OTPs for fresh destinations (``generate_otp`` then
+``validate_otp``: an INSERT and an UPDATE of ``OTPValidation``), with
+``ROUTING["OTP_SHARDS"]`` set to 1, 2, 4... SQLite databases. A SQLite database
+takes one writer at a time, so throughput grows with the shard count until the
+threads or the disk are saturated. Each level reports operations/sec, p50/p99
+latency, errors and how the destinations spread over the shards. Results are
+printed as JSON.
+
+Usage::
+
+    python benchmarks/otp_shards.py --shards 1,2,4,8 --threads 8
+    python benchmarks/otp_shards.py --operations 5000 --output shards.json
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run import percentile  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--shards",
+        default="1,2,4,8",
+        help="Comma separated numbers of shards (default: %(default)s).",
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--operations",
+        type=int,
+        default=2000,
+        help="OTPs sent and verified per level.",
+    )
+    parser.add_argument(
+        "--directory",
+        help="Directory of the SQLite databases (default: a temporary one).",
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def setup_django(shards: int, directory: str):
+    """Sets up Django with `shards` OTP databases, and migrates them all."""
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    os.environ["BENCH_DB"] = "sqlite"
+    os.environ["BENCH_DB_PATH"] = os.path.join(directory, "drf_auth_bench.sqlite3")
+    os.environ["BENCH_OTP_SHARDS"] = str(shards)
+    os.environ["BENCH_OTP_SHARD_DIR"] = directory
+
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+
+    for alias in settings.DATABASES:
+        call_command("migrate", database=alias, verbosity=0)
+
+
+def run_level(shards: int, args, run_id: str) -> dict:
+    from django.conf import settings
+    from django.db import DatabaseError, connections
+    from django.test import override_settings
+    from drf_auth.models import OTPValidation
+    from drf_auth.utils import generate_otp, validate_otp
+
+    aliases = ["otp%d" % index for index in range(shards)]
+    prefix = "otp-%s-%d-" % (run_id, shards)
+    counter = itertools.count()
+
+    def worker():
+        samples, errors = [], 0
+        try:
+            while True:
+                i = next(counter)
+                if i >= args.operations:
+                    return samples, errors
+                destination = "%s%d@example.com" % (prefix, i)
+                start = time.perf_counter()
+                try:
+                    record = generate_otp(OTPValidation.EMAIL, destination)
+                    validate_otp(destination, record.otp)
+                except DatabaseError:
+                    errors += 1
+                else:
+                    samples.append(time.perf_counter() - start)
+        finally:
+            connections.close_all()
+
+    routing = dict(settings.DRF_AUTH_SETTINGS["ROUTING"], OTP_SHARDS=aliases)
+    with override_settings(
+        DRF_AUTH_SETTINGS=dict(settings.DRF_AUTH_SETTINGS, ROUTING=routing)
+    ):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            futures = [executor.submit(worker) for _ in range(args.threads)]
+            results = [future.result() for future in futures]
+        wall = time.perf_counter() - start
+
+    latencies = sorted(elapsed * 1000 for samples, _ in results for elapsed in samples)
+    return {
+        "shards": shards,
+        "operations": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "ops_per_sec": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "distribution": {
+            alias: OTPValidation.objects.using(alias)
+            .filter(destination__startswith=prefix)
+            .count()
+            for alias in aliases
+        },
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    levels = sorted(int(level) for level in args.shards.split(",") if level.strip())
+    if not levels or levels[0] < 1:
+        sys.exit("--shards needs positive numbers of shards.")
+
+    directory = args.directory or tempfile.mkdtemp(prefix="drf_auth_otp_shards")
+    try:
+        setup_django(levels[-1], directory)
+        run_id = uuid.uuid4().hex[:8]
+        results = {
+            "meta": {
+                "threads": args.threads,
+                "operations": args.operations,
+            },
+            "levels": [run_level(shards, args, run_id) for shards in levels],
+        }
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    baseline = results["levels"][0]["ops_per_sec"]
+    for level in results["levels"]:
+        level["speedup"] = (
+            round(level["ops_per_sec"] / baseline, 2) if baseline else 0.0
+        )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Pins the number of queries each drf_auth endpoint runs.
+
+Run with the benchmark settings::
+
+    python -m django test benchmarks.query_counts --settings=benchmarks.settings
+
+A failure means an endpoint now runs more (or fewer) queries; update the
+count here only if that is intended.
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.authentication import user_cache
+from drf_auth.models import OTPValidation
+from drf_auth.tokens import get_token_factory
+
+PREFIX = "/api/auth/"
+PASSWORD = "bench-password"
+
+
+class QueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username="alice",
+            email="alice@example.com",
+            mobile="9999999999",
+            name="Alice",
+            password=PASSWORD,
+        )
+
+    def setUp(self):
+        caches[drf_auth_settings.AUTH.CACHE_ALIAS].clear()
+        user_cache.clear()
+
+    def post(self, path: str, data: dict, **headers):
+        return self.client.post(
+            PREFIX + path, json.dumps(data), content_type="application/json", **headers
+        )
+
+    def test_login(self):
+        # The user with only the login columns, then last_login.
+        with self.assertNumQueries(2):
+            response = self.post("login/", {"username": "alice", "password": PASSWORD})
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_wrong_password(self):
+        with self.assertNumQueries(1):
+            response = self.post("login/", {"username": "alice", "password": "wrong"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_login_unknown_user(self):
+        with self.assertNumQueries(1):
+            response = self.post("login/", {"username": "bob", "password": PASSWORD})
+        self.assertEqual(response.status_code, 401)
+        # Remembered by the negative lookup cache.
+        with self.assertNumQueries(0):
+            response = self.post("login/", {"username": "bob", "password": PASSWORD})
+        self.assertEqual(response.status_code, 401)
+
+    def test_otp_send(self):
+        # The user and the OTP by destination, the INSERT of the new OTP in a
+        # transaction, then one UPDATE of the cooling period and send counter.
+        with self.assertNumQueries(6):
+            response = self.post("otp/", {"destination": "bob@example.com"})
+        self.assertEqual(response.status_code, 201)
+
+    def test_otp_verify(self):
+        self.post("otp/", {"destination": "bob@example.com"})
+        otp = OTPValidation.objects.get(destination="bob@example.com").otp
+        # The user and the OTP by destination, then the conditional UPDATE.
+        with self.assertNumQueries(3):
+            response = self.post("otp/", {"destination": "bob@example.com", "otp": otp})
+        self.assertEqual(response.status_code, 202)
+
+    def test_register(self):
+        # One conflict check for every identity field, then the INSERT in a
+        # transaction.
+        with self.assertNumQueries(4):
+            response = self.post(
+                "register/",
+                {"username": "carol", "name": "Carol", "password": PASSWORD},
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_me(self):
+        tokens = get_token_factory().for_user(self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                PREFIX + "me/", HTTP_AUTHORIZATION="Bearer " + tokens["access"]
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_me_unchanged_identity(self):
+        tokens = get_token_factory().for_user(self.user)
+        # No validated OTP for the current email and mobile, as after a purge.
+        # Only the user and the conflict check, then the UPDATE in a
+        # transaction.
+        with self.assertNumQueries(5):
+            response = self.client.patch(
+                PREFIX + "me/",
+                json.dumps(
+                    {"name": "B", "email": "alice@example.com", "mobile": "9999999999"}
+                ),
+                content_type="application/json",
+                HTTP_AUTHORIZATION="Bearer " + tokens["access"],
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        # A new email still needs one.
+        response = self.client.patch(
+            PREFIX + "me/",
+            json.dumps({"email": "alice@example.org"}),
+            content_type="application/json",
+            HTTP_AUTHORIZATION="Bearer " + tokens["access"],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("email", response.json())
+
+    def test_refresh(self):
+        tokens = get_token_factory().for_user(self.user)
+        # simplejwt checks that the user is still active.
+        with self.assertNumQueries(1):
+            response = self.post("token/refresh/", {"refresh": tokens["refresh"]})
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""Measures refresh token rotation as revoked tokens pile up.
+
+The revocation index only stores revoked tokens, so issued tokens cost
+nothing until they are revoked. For each of ``--revoked``, the index is
+filled with that many revoked tokens (a tenth of them as revoked users),
+then ``--requests`` refresh tokens are rotated through ``token/refresh/``
+and as many are checked against the index alone. Each level reports the
+p50/p99 latency of both, and errors. Results are printed as JSON.
+
+The index lives in an in-memory cache by default; ``--cache`` takes a Redis
+URL (``redis://...``, needs ``redis``) for levels of millions of tokens.
+
+Usage::
+
+    python benchmarks/refresh.py --revoked 0,10000,100000 --requests 500
+    python benchmarks/refresh.py --cache redis://localhost:6379/1 --revoked 0,10000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run import PREFIX, Dataset, percentile  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--revoked",
+        default="0,10000,100000",
+        help="Comma separated numbers of revoked tokens (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=500, help="Refreshes measured per level."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=10000,
+        help="Revocations written to the cache at a time.",
+    )
+    parser.add_argument(
+        "--cache",
+        default="locmem",
+        help="'locmem' or the Redis URL of the revocation cache.",
+    )
+    parser.add_argument(
+        "--database", choices=("sqlite", "postgresql"), default="sqlite"
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def setup_django(args):
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    os.environ["BENCH_DB"] = args.database
+    os.environ["BENCH_ROTATE_REFRESH_TOKENS"] = "1"
+
+    import django
+
+    django.setup()
+
+
+def get_cache_settings(location: str) -> dict:
+    if location == "locmem":
+        return {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "drf_auth_revocation",
+            "OPTIONS": {"MAX_ENTRIES": sys.maxsize},
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": location,
+    }
+
+
+def revoke(count: int, batch_size: int):
+    """Adds `count` revoked tokens and users to the index."""
+    from drf_auth.revocation import get_revocation_index
+    from rest_framework_simplejwt.settings import api_settings
+
+    index = get_revocation_index()
+    timeout = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+    cutoff = int(time.time())
+    for start in range(0, count, batch_size):
+        entries = {}
+        for i in range(start, min(start + batch_size, count)):
+            if i % 10:
+                entries[index.key("jti", uuid.uuid4().hex)] = True
+            else:
+                # Users unknown to the dataset, so no token is revoked by them.
+                entries[index.key("user", "revoked-%d" % i)] = cutoff
+        index.cache.set_many(entries, timeout)
+
+
+def latency(samples: list) -> dict:
+    samples = sorted(elapsed * 1000 for elapsed in samples)
+    return {
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+    }
+
+
+def run_level(revoked: int, users: list, args) -> dict:
+    from django.test import Client
+    from drf_auth.revocation import get_revocation_index
+    from drf_auth.tokens import get_token_factory
+    from rest_framework_simplejwt.tokens import UntypedToken
+
+    issued = get_token_factory().for_users(users)
+    client = Client(raise_request_exception=False)
+    refresh, errors = [], 0
+    for tokens in issued:
+        start = time.perf_counter()
+        response = client.post(
+            PREFIX + "token/refresh/",
+            json.dumps({"refresh": tokens["refresh"]}),
+            content_type="application/json",
+        )
+        refresh.append(time.perf_counter() - start)
+        errors += response.status_code != 200
+
+    index = get_revocation_index()
+    payloads = [UntypedToken(tokens["access"]).payload for tokens in issued]
+    check = []
+    for payload in payloads:
+        start = time.perf_counter()
+        index.check(payload)
+        check.append(time.perf_counter() - start)
+
+    return {
+        "revoked": revoked,
+        "refreshes": len(refresh),
+        "errors": errors,
+        "refresh": latency(refresh),
+        "check": latency(check),
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    levels = sorted(int(level) for level in args.revoked.split(",") if level.strip())
+    if not levels or levels[0] < 0:
+        sys.exit("--revoked needs numbers of tokens.")
+
+    setup_django(args)
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test import override_settings
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        with override_settings(
+            CACHES=dict(settings.CACHES, revocation=get_cache_settings(args.cache)),
+            DRF_AUTH_SETTINGS=dict(
+                settings.DRF_AUTH_SETTINGS, REVOCATION={"CACHE_ALIAS": "revocation"}
+            ),
+        ):
+            caches["revocation"].clear()
+            dataset = Dataset(args.requests, 0)
+            dataset.create()
+            users = list(get_user_model().objects.order_by("pk"))
+            results = {
+                "meta": {"database": connection.vendor, "cache": args.cache},
+                "levels": [],
+            }
+            revoked = 0
+            for level in levels:
+                if level > revoked:
+                    revoke(level - revoked, args.batch_size)
+                    revoked = level
+                results["levels"].append(run_level(revoked, users, args))
+                # Each rotated token was revoked.
+                revoked += len(users)
+            caches["revocation"].clear()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
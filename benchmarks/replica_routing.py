@@ -0,0 +1,186 @@
+"""Tests of read replica routing, with SQLite aliases as replicas.
+
+Run with the replica settings::
+
+    python -m django test benchmarks.replica_routing --settings=benchmarks.replica_settings
+"""
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from drf_auth import routers
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.authentication import get_cached_user, user_cache
+
+PREFIX = "/api/auth/"
+PASSWORD = "bench-password"
+REPLICAS = settings.DRF_AUTH_SETTINGS["ROUTING"]["REPLICAS"]
+
+
+def with_policy(**policy):
+    """Overrides `ROUTING["POLICY"]` entries."""
+    routing = dict(settings.DRF_AUTH_SETTINGS["ROUTING"])
+    routing["POLICY"] = dict(routing.get("POLICY", {}), **policy)
+    return override_settings(
+        DRF_AUTH_SETTINGS=dict(settings.DRF_AUTH_SETTINGS, ROUTING=routing)
+    )
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # Data must be committed to be visible on the replicas' connections.
+    databases = {"default", *REPLICAS}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="alice",
+            email="alice@example.com",
+            mobile="9999999999",
+            name="Alice",
+            password=PASSWORD,
+        )
+        caches[drf_auth_settings.AUTH.CACHE_ALIAS].clear()
+        user_cache.clear()
+        # Creating the user pinned this thread's reads to the primary.
+        routers._primary_until.set(0.0)
+
+    def post(self, path: str, data: dict, **extra):
+        return self.client.post(
+            PREFIX + path, json.dumps(data), content_type="application/json", **extra
+        )
+
+    def capture(self, alias: str) -> CaptureQueriesContext:
+        return CaptureQueriesContext(connections[alias])
+
+    def reads(self, func) -> dict:
+        """Returns the number of queries `func()` ran on each alias."""
+        contexts = {alias: self.capture(alias) for alias in ("default", *REPLICAS)}
+        for context in contexts.values():
+            context.__enter__()
+        try:
+            func()
+        finally:
+            for context in contexts.values():
+                context.__exit__(None, None, None)
+        return {alias: len(context) for alias, context in contexts.items()}
+
+    def test_read_db_is_a_replica(self):
+        aliases = {routers.get_read_db("AUTHENTICATE") for _ in range(50)}
+        self.assertEqual(aliases, set(REPLICAS))
+
+    def test_read_db_follows_policy(self):
+        with with_policy(AUTHENTICATE="primary"):
+            self.assertEqual(routers.get_read_db("AUTHENTICATE"), "default")
+        self.assertIn(routers.get_read_db("AUTHENTICATE"), REPLICAS)
+
+    @override_settings(DATABASE_ROUTERS=[])
+    def test_read_db_needs_router(self):
+        self.assertEqual(routers.get_read_db("AUTHENTICATE"), "default")
+
+    def test_writes_go_to_primary(self):
+        self.assertEqual(
+            routers.DRFAuthRouter().db_for_write(get_user_model()), "default"
+        )
+        self.assertEqual(
+            routers.DRFAuthRouter().db_for_read(get_user_model()), "default"
+        )
+
+    def test_login_reads_replica(self):
+        counts = self.reads(
+            lambda: self.assertEqual(
+                self.post(
+                    "login/", {"username": "alice", "password": PASSWORD}
+                ).status_code,
+                200,
+            )
+        )
+        # The user from a replica, last_login written to the primary.
+        self.assertEqual(sum(counts[alias] for alias in REPLICAS), 1)
+        self.assertEqual(counts["default"], 1)
+
+    def test_login_reads_primary_by_policy(self):
+        with with_policy(AUTHENTICATE="primary"):
+            counts = self.reads(
+                lambda: self.post("login/", {"username": "alice", "password": PASSWORD})
+            )
+        self.assertEqual(sum(counts[alias] for alias in REPLICAS), 0)
+        self.assertEqual(counts["default"], 2)
+
+    def test_get_user_reads_replica(self):
+        counts = self.reads(lambda: get_cached_user(self.user.pk))
+        self.assertEqual(sum(counts[alias] for alias in REPLICAS), 1)
+        self.assertEqual(counts["default"], 0)
+
+    def test_missing_on_replica_is_read_from_primary(self):
+        User = get_user_model()
+        replica_get = mock.Mock(side_effect=User.DoesNotExist)
+        queryset = mock.Mock(model=User)
+        queryset.using.side_effect = lambda alias: (
+            mock.Mock(get=replica_get)
+            if alias in REPLICAS
+            else User.objects.using(alias)
+        )
+        user = routers.read_get(queryset, "GET_USER", pk=self.user.pk)
+        self.assertEqual(user, self.user)
+        self.assertEqual(user._state.db, "default")
+        replica_get.assert_called_once_with(pk=self.user.pk)
+
+    def test_write_pins_reads_to_primary(self):
+        routers.pin_primary()
+        self.assertTrue(routers.is_pinned())
+        self.assertEqual(routers.get_read_db("AUTHENTICATE"), "default")
+        sticky = drf_auth_settings.ROUTING.STICKY_SECONDS
+        with mock.patch("drf_auth.routers.time.time", return_value=10**10):
+            routers.pin_primary()
+        with mock.patch("drf_auth.routers.time.time", return_value=10**10 + sticky + 1):
+            self.assertFalse(routers.is_pinned())
+            self.assertIn(routers.get_read_db("AUTHENTICATE"), REPLICAS)
+
+    def test_write_sets_cookie(self):
+        response = self.post(
+            "register/", {"username": "bob", "name": "Bob", "password": PASSWORD}
+        )
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies[drf_auth_settings.ROUTING.STICKY_COOKIE]
+        self.assertEqual(cookie["max-age"], drf_auth_settings.ROUTING.STICKY_SECONDS)
+        self.assertTrue(cookie["httponly"])
+
+    def test_read_does_not_set_cookie(self):
+        self.client.cookies.clear()
+        response = self.post("login/", {"username": "nobody", "password": PASSWORD})
+        self.assertNotIn(drf_auth_settings.ROUTING.STICKY_COOKIE, response.cookies)
+
+    def test_login_does_not_set_cookie(self):
+        # Recording last_login does not pin the client to the primary.
+        response = self.post("login/", {"username": "alice", "password": PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(drf_auth_settings.ROUTING.STICKY_COOKIE, response.cookies)
+        self.assertFalse(routers.is_pinned())
+
+    def test_cookie_pins_reads_to_primary(self):
+        self.post("register/", {"username": "bob", "name": "Bob", "password": PASSWORD})
+        # The test client sends the cookie back.
+        counts = self.reads(
+            lambda: self.post("login/", {"username": "alice", "password": PASSWORD})
+        )
+        self.assertEqual(sum(counts[alias] for alias in REPLICAS), 0)
+
+    def test_cookie_is_capped(self):
+        cookie = drf_auth_settings.ROUTING.STICKY_COOKIE
+        for value in ("%.3f" % 10**12, "not-a-time", "0"):
+            self.client.cookies[cookie] = value
+            counts = self.reads(
+                lambda: self.post("login/", {"username": "alice", "password": PASSWORD})
+            )
+            self.assertEqual(sum(counts[alias] for alias in REPLICAS), 1, value)
+
+    def test_replicas_are_not_migrated(self):
+        router = routers.DRFAuthRouter()
+        for alias in REPLICAS:
+            self.assertFalse(router.allow_migrate(alias, "drf_auth", "user"))
+        self.assertIsNone(router.allow_migrate("default", "drf_auth", "user"))
+        self.assertIsNone(router.allow_migrate(REPLICAS[0], "auth", "group"))
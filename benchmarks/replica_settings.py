@@ -0,0 +1,20 @@
+"""Benchmark settings with read replicas, for ``replica_routing.py``.
+
+The replicas are SQLite aliases of the primary's database file, mirrors of
+``default`` in tests, so they always have the primary's data. Queries still
+run on their own connections, which shows where each read was routed.
+"""
+from benchmarks.settings import *  # noqa: F401, F403
+from benchmarks.settings import DATABASES, DRF_AUTH_SETTINGS
+
+REPLICAS = ["replica0", "replica1"]
+
+for alias in REPLICAS:
+    DATABASES[alias] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+
+DATABASE_ROUTERS = ["drf_auth.routers.DRFAuthRouter"]
+MIDDLEWARE = ["drf_auth.routers.ReadYourWritesMiddleware"]
+
+DRF_AUTH_SETTINGS = dict(
+    DRF_AUTH_SETTINGS, ROUTING=dict(DRF_AUTH_SETTINGS["ROUTING"], REPLICAS=REPLICAS)
+)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""Benchmarks the drf_auth endpoints.
+
+Requests go through the full Django/DRF stack in-process, from a pool of
+threads, against a fresh database seeded with ``--users`` users. Results are
+printed as JSON.
+
+Usage::
+
+    python benchmarks/run.py --scenarios login,me --concurrency 8 --requests 500
+    python benchmarks/run.py --output baseline.json
+    python benchmarks/run.py --compare baseline.json --threshold 0.1
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREFIX = "/api/auth/"
+PASSWORD = "bench-password"
+
+# name -> (expected status codes, request factory); see `Dataset` for the
+# values the factories use. A factory returns (method, path, data, headers).
+SCENARIOS = {
+    "login": (
+        (200,),
+        lambda data, i: (
+            "post",
+            "login/",
+            {"username": data.username(i), "password": PASSWORD},
+            {},
+        ),
+    ),
+    "otp": (
+        (201,),
+        lambda data, i: (
+            "post",
+            "otp/",
+            {"destination": "otp-%s-%d@example.com" % (data.run_id, i)},
+            {},
+        ),
+    ),
+    "register": (
+        (201,),
+        lambda data, i: (
+            "post",
+            "register/",
+            {
+                "username": "reg-%s-%d" % (data.run_id, i),
+                "name": "Bench",
+                "password": PASSWORD,
+            },
+            {},
+        ),
+    ),
+    "me": (
+        (200,),
+        lambda data, i: (
+            "get",
+            "me/",
+            None,
+            {"HTTP_AUTHORIZATION": "Bearer " + data.tokens(i)["access"]},
+        ),
+    ),
+    "refresh": (
+        (200,),
+        lambda data, i: (
+            "post",
+            "token/refresh/",
+            {"refresh": data.tokens(i)["refresh"]},
+            {},
+        ),
+    ),
+}
+# metric -> whether a higher value is worse.
+METRICS = {"p50_ms": True, "p99_ms": True, "rps": False, "queries_per_request": True}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help="Comma separated scenarios (default: %(default)s).",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Measured requests per scenario."
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=10, help="Unmeasured requests per scenario."
+    )
+    parser.add_argument(
+        "--users", type=int, default=1000, help="Number of users in the dataset."
+    )
+    parser.add_argument(
+        "--tokens",
+        type=int,
+        default=200,
+        help="Number of users issued tokens for the me and refresh scenarios.",
+    )
+    parser.add_argument(
+        "--database", choices=("sqlite", "postgresql"), default="sqlite"
+    )
+    parser.add_argument(
+        "--hasher",
+        help="Dotted path of the only password hasher to use (default: Django's).",
+    )
+    parser.add_argument(
+        "--authentication",
+        help="Dotted path of the DRF authentication class to use.",
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    parser.add_argument(
+        "--compare", metavar="BASELINE", help="Flag regressions against a results file."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative change of latency or throughput counted as a regression.",
+    )
+    return parser.parse_args(argv)
+
+
+def setup_django(args):
+    sys.path.insert(0, ROOT)
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    os.environ["BENCH_DB"] = args.database
+    if args.hasher:
+        os.environ["BENCH_PASSWORD_HASHER"] = args.hasher
+    if args.authentication:
+        os.environ["BENCH_AUTHENTICATION"] = args.authentication
+
+    import django
+
+    django.setup()
+
+
+class Dataset:
+    """Users, and tokens for some of them, created in a fresh database."""
+
+    def __init__(self, users: int, tokens: int):
+        self.run_id = uuid.uuid4().hex[:8]
+        self.size = users
+        self.issued = []
+        self.token_count = min(tokens, users)
+
+    def create(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.hashers import make_password
+        from drf_auth.tokens import get_token_factory
+
+        User = get_user_model()
+        password = make_password(PASSWORD)
+        for start in range(0, self.size, 1000):
+            User.objects.bulk_create(
+                [
+                    User(
+                        username=self.username(i),
+                        name="Bench %d" % i,
+                        email="%s@example.com" % self.username(i),
+                        password=password,
+                    )
+                    for i in range(start, min(start + 1000, self.size))
+                ]
+            )
+        factory = get_token_factory()
+        users = User.objects.order_by("pk")[: self.token_count]
+        self.issued = factory.for_users(users)
+
+    def username(self, i: int) -> str:
+        return "bench%d" % (i % self.size)
+
+    def tokens(self, i: int) -> dict:
+        return self.issued[i % len(self.issued)]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values: list, percent: float) -> float:
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def run_scenario(name: str, dataset: Dataset, args) -> dict:
+    from django.db import connection
+    from django.test import Client
+
+    expected, factory = SCENARIOS[name]
+    counter = itertools.count()
+
+    def worker(limit: int, offset: int):
+        client = Client(raise_request_exception=False)
+        queries = QueryCounter()
+        samples = []
+        try:
+            with connection.execute_wrapper(queries):
+                while True:
+                    i = next(counter)
+                    if i >= limit:
+                        return samples
+                    method, path, data, headers = factory(dataset, offset + i)
+                    queries.count = 0
+                    start = time.perf_counter()
+                    if method == "get":
+                        response = client.get(PREFIX + path, **headers)
+                    else:
+                        response = client.post(
+                            PREFIX + path,
+                            json.dumps(data),
+                            content_type="application/json",
+                            **headers,
+                        )
+                    elapsed = time.perf_counter() - start
+                    samples.append(
+                        (elapsed, queries.count, response.status_code in expected)
+                    )
+        finally:
+            connection.close()
+
+    # Warm up on indexes past the measured ones, so no registration or OTP
+    # destination is used twice.
+    worker(args.warmup, args.requests)
+
+    counter = itertools.count()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(worker, args.requests, 0) for _ in range(args.concurrency)
+        ]
+        samples = [sample for future in futures for sample in future.result()]
+    wall = time.perf_counter() - start
+
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, _, ok in samples if not ok),
+        "rps": round(len(samples) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "queries_per_request": (
+            round(sum(count for _, count, _ in samples) / len(samples), 2)
+            if samples
+            else 0.0
+        ),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Returns the metrics of `results` that regressed against `baseline`.
+
+    Latency and throughput regress when they are worse by more than
+    `threshold` (relative); any increase in queries per request regresses.
+    """
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_worse in METRICS.items():
+            before, after = previous.get(metric), current.get(metric)
+            if before is None or after is None:
+                continue
+            if metric == "queries_per_request":
+                regressed = after > before
+            elif before == 0:
+                regressed = False
+            else:
+                change = (after - before) / before
+                regressed = (
+                    change > threshold if higher_is_worse else -change > threshold
+                )
+            if regressed:
+                regressions.append(
+                    {
+                        "scenario": name,
+                        "metric": metric,
+                        "baseline": before,
+                        "current": after,
+                    }
+                )
+    return regressions
+
+
+def get_meta(args) -> dict:
+    import django
+    from django.conf import settings
+    from django.db import connection
+
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "hasher": settings.PASSWORD_HASHERS[0],
+        "authentication": settings.REST_FRAMEWORK["DEFAULT_AUTHENTICATION_CLASSES"][0],
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "users": args.users,
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        sys.exit("Unknown scenario(s): %s" % ", ".join(unknown))
+
+    setup_django(args)
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        dataset = Dataset(args.users, args.tokens)
+        dataset.create()
+        results = {
+            "meta": get_meta(args),
+            "scenarios": {
+                name: run_scenario(name, dataset, args) for name in scenarios
+            },
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        results["regressions"] = compare(results, baseline, args.threshold)
+        for regression in results["regressions"]:
+            sys.stderr.write(
+                "REGRESSION %(scenario)s %(metric)s: %(baseline)s -> %(current)s\n"
+                % regression
+            )
+        status = 1 if results["regressions"] else 0
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Self-contained settings for the drf_auth benchmarks.
+
+The database is chosen with environment variables set by ``run.py``:
+
+* ``BENCH_DB=sqlite`` (default) uses a file in ``BENCH_DB_PATH``.
+* ``BENCH_DB=postgresql`` uses ``BENCH_DB_NAME``, ``BENCH_DB_USER``,
+  ``BENCH_DB_PASSWORD``, ``BENCH_DB_HOST`` and ``BENCH_DB_PORT``.
+
+``otp_shards.py`` adds ``BENCH_OTP_SHARDS`` SQLite databases, ``otp0``,
+``otp1``..., in ``BENCH_OTP_SHARD_DIR``, and shards OTP state across them.
+"""
+import datetime
+import os
+import tempfile
+
+SECRET_KEY = "drf-auth-benchmarks-not-a-secret-key-0123456789"
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+USE_TZ = True
+DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "rest_framework",
+    "drf_auth",
+]
+MIDDLEWARE = []
+# asgi_run.py sets benchmarks.async_urls to serve the async views.
+ROOT_URLCONF = os.environ.get("BENCH_URLCONF", "benchmarks.urls")
+
+if os.environ.get("BENCH_DB", "sqlite") == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("BENCH_DB_NAME", "drf_auth_bench"),
+            "USER": os.environ.get("BENCH_DB_USER", ""),
+            "PASSWORD": os.environ.get("BENCH_DB_PASSWORD", ""),
+            "HOST": os.environ.get("BENCH_DB_HOST", ""),
+            "PORT": os.environ.get("BENCH_DB_PORT", ""),
+            "CONN_MAX_AGE": None,
+        }
+    }
+else:
+    path = os.environ.get(
+        "BENCH_DB_PATH", os.path.join(tempfile.gettempdir(), "drf_auth_bench.sqlite3")
+    )
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": path,
+            "OPTIONS": {"timeout": 30},
+            "TEST": {"NAME": path},
+        }
+    }
+
+otp_shards = []
+for index in range(int(os.environ.get("BENCH_OTP_SHARDS", 0))):
+    path = os.path.join(
+        os.environ.get("BENCH_OTP_SHARD_DIR", tempfile.gettempdir()),
+        "drf_auth_bench_otp%d.sqlite3" % index,
+    )
+    otp_shards.append("otp%d" % index)
+    DATABASES[otp_shards[-1]] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": path,
+        "OPTIONS": {"timeout": 30},
+        "TEST": {"NAME": path},
+    }
+if otp_shards:
+    # Only the OTP table is created on the shards.
+    DATABASE_ROUTERS = ["drf_auth.routers.DRFAuthRouter"]
+
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+AUTH_USER_MODEL = "drf_auth.User"
+AUTHENTICATION_BACKENDS = ["drf_auth.auth.MultiFieldModelBackend"]
+AUTH_PASSWORD_VALIDATORS = []
+if os.environ.get("BENCH_PASSWORD_HASHER"):
+    PASSWORD_HASHERS = [os.environ["BENCH_PASSWORD_HASHER"]]
+
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": (
+        os.environ.get(
+            "BENCH_AUTHENTICATION",
+            "rest_framework_simplejwt.authentication.JWTAuthentication",
+        ),
+    ),
+}
+SIMPLE_JWT = {
+    "ACCESS_TOKEN_LIFETIME": datetime.timedelta(hours=1),
+    # Set by refresh.py; run.py refreshes the same tokens again and again.
+    "ROTATE_REFRESH_TOKENS": bool(os.environ.get("BENCH_ROTATE_REFRESH_TOKENS")),
+}
+
+EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+EMAIL_HOST = "localhost"
+EMAIL_FROM = "bench@example.com"
+SENDSMS_BACKEND = "sendsms.backends.console.SmsBackend"
+
+DRF_AUTH_SETTINGS = {
+    "MOBILE_OPTIONAL": True,
+    "EMAIL_OPTIONAL": True,
+    "DEFAULT_ACTIVE_STATE": True,
+    "OTP": {
+        "LENGTH": 6,
+        "ALLOWED_CHARS": "1234567890",
+        "VALIDATION_ATTEMPTS": 3,
+        "SUBJECT": "OTP for Verification",
+        "COOLING_PERIOD": 3,
+    },
+    "MOBILE_VALIDATION": True,
+    "EMAIL_VALIDATION": False,
+    "REGISTRATION": {
+        "SEND_MAIL": False,
+        "SEND_MESSAGE": False,
+        "MAIL_SUBJECT": "Welcome",
+        "SMS_BODY": "Your account has been created",
+        "TEXT_MAIL_BODY": "Your account has been created.",
+        "HTML_MAIL_BODY": "Your account has been created.",
+    },
+    # Every benchmark request would otherwise be rate limited.
+    "THROTTLE": {"ENABLED": False},
+    "ROUTING": {"OTP_SHARDS": otp_shards},
+}
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Measures token pair issuance per signing algorithm.
+
+For each of ``--algorithms``, token pairs are issued for ``--tokens`` users
+three ways: simplejwt's ``RefreshToken.for_user`` encoded with its
+``TokenBackend`` (the path before ``TokenFactory``), ``TokenFactory.for_user``,
+and ``TokenFactory.for_users`` in batches of ``--batch-size``. Each reports
+tokens/sec (two per pair) and its speedup over simplejwt. RS256 and EdDSA
+need the ``cryptography`` package and are skipped without it. Results are
+printed as JSON.
+
+Usage::
+
+    python benchmarks/tokens.py --algorithms HS256,RS256,EdDSA --tokens 5000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--algorithms",
+        default="HS256,RS256,EdDSA",
+        help="Comma separated signing algorithms (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--tokens", type=int, default=2000, help="Token pairs issued per path."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="Users per for_users call."
+    )
+    parser.add_argument("--output", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def setup_django():
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+
+    import django
+
+    django.setup()
+
+
+def get_signing_key(algorithm: str):
+    """Returns a new signing key for `algorithm`, PEM encoded if asymmetric."""
+    if algorithm.startswith("HS"):
+        return os.urandom(64).hex()
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+    if algorithm == "EdDSA":
+        key = ed25519.Ed25519PrivateKey.generate()
+    elif algorithm.startswith("ES"):
+        curve = {"ES256": ec.SECP256R1, "ES384": ec.SECP384R1}.get(
+            algorithm, ec.SECP521R1
+        )
+        key = ec.generate_private_key(curve())
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+def get_users(count: int) -> list:
+    """Unsaved users: issuing tokens does not query the database."""
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    return [
+        User(
+            pk=i + 1,
+            username="bench%d" % i,
+            name="Bench %d" % i,
+            email="bench%d@example.com" % i,
+            password="",
+        )
+        for i in range(count)
+    ]
+
+
+def rate(func, users: list) -> float:
+    """Returns the tokens/sec of `func(users)`."""
+    start = time.perf_counter()
+    func(users)
+    elapsed = time.perf_counter() - start
+    return round(2 * len(users) / elapsed, 2) if elapsed else 0.0
+
+
+def run_algorithm(algorithm: str, args) -> dict:
+    from drf_auth.tokens import TokenFactory
+    from jwt.algorithms import get_default_algorithms
+    from rest_framework_simplejwt.backends import TokenBackend
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    if algorithm not in get_default_algorithms():
+        return {"skipped": "%s needs the cryptography package." % algorithm}
+
+    signing_key = get_signing_key(algorithm)
+    backend = TokenBackend(algorithm, signing_key)
+    factory = TokenFactory(algorithm, signing_key)
+    users = get_users(args.tokens)
+
+    def simplejwt(users):
+        for user in users:
+            refresh = RefreshToken.for_user(user)
+            backend.encode(refresh.payload)
+            backend.encode(refresh.access_token.payload)
+
+    def for_user(users):
+        for user in users:
+            factory.for_user(user)
+
+    def for_users(users):
+        for start in range(0, len(users), args.batch_size):
+            factory.for_users(users[start : start + args.batch_size])
+
+    result = {
+        "simplejwt": rate(simplejwt, users),
+        "for_user": rate(for_user, users),
+        "for_users": rate(for_users, users),
+    }
+    baseline = result["simplejwt"]
+    return {
+        "tokens_per_sec": result,
+        "speedup": {
+            path: round(value / baseline, 2) if baseline else 0.0
+            for path, value in result.items()
+        },
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    algorithms = [name.strip() for name in args.algorithms.split(",") if name.strip()]
+    setup_django()
+    results = {
+        "meta": {"tokens": args.tokens, "batch_size": args.batch_size},
+        "algorithms": {
+            algorithm: run_algorithm(algorithm, args) for algorithm in algorithms
+        },
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,88 @@
+import json
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 from django.utils.text import gettext_lazy as _
-from drf_auth.models import OTPValidation, User
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.models import MessageDelivery, OTPValidation, User
+
+
+def estimate_count(queryset):
+    """
+    Returns the planner's row estimate for `queryset` on PostgreSQL, or None.
+
+    An unfiltered queryset reads `pg_class.reltuples`, anything else the top
+    row estimate of `EXPLAIN`. Neither scans the table.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 until the table is first vacuumed or analyzed.
+            if row is None or row[0] < 0:
+                return None
+            return int(row[0])
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that trusts the planner's estimate for large result sets.
+
+    Results estimated below `ADMIN["EXACT_COUNT_BELOW"]` rows, and every
+    result set on databases other than PostgreSQL, are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < drf_auth_settings.ADMIN.EXACT_COUNT_BELOW:
+            return super().count
+        return estimate
 
 
-class DRFUserAdmin(UserAdmin):
+class IndexedSearchMixin:
+    """
+    Changelist settings for tables too large to scan.
+
+    With `ADMIN["SEARCH"]` set to "prefix" or "exact", the search box matches
+    the start of, or the whole of, `indexed_search_fields` instead of running
+    `icontains` on every `search_fields` column.
+    """
+
+    indexed_search_fields = ()
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        mode = drf_auth_settings.ADMIN.SEARCH
+        search_term = search_term.strip()
+        if mode == "contains" or not search_term:
+            return super().get_search_results(request, queryset, search_term)
+
+        lookup = "startswith" if mode == "prefix" else "exact"
+        query = Q()
+        for field in self.indexed_search_fields:
+            query |= Q(**{"%s__%s" % (field, lookup): search_term})
+        return queryset.filter(query), False
+
+
+class DRFUserAdmin(IndexedSearchMixin, UserAdmin):
     fieldsets = (
         (None, {"fields": ("username", "password")}),
         (_("Personal info"), {"fields": ("name", "image", "email", "mobile")}),
@@ -41,13 +119,26 @@ class DRFUserAdmin(UserAdmin):
         ),
     )
     list_display = ("username", "email", "name", "mobile", "is_active")
+    list_filter = ("is_active",)
     search_fields = ("username", "name", "email", "mobile")
+    indexed_search_fields = ("username", "email", "mobile")
     readonly_fields = ("date_joined",)
 
 
-class OTPValidationAdmin(admin.ModelAdmin):
-    list_display = ("destination", "otp", "prop")
+class OTPValidationAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ("destination", "otp", "prop", "is_validated", "modified")
+    list_filter = ("is_validated",)
+    ordering = ("-modified",)
+    search_fields = ("destination",)
+    indexed_search_fields = ("destination",)
+
+
+class MessageDeliveryAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ("recipient", "subject", "status", "attempts", "next_attempt_at")
+    list_filter = ("status",)
+    readonly_fields = ("sent_at", "last_error")
 
 
 admin.site.register(User, DRFUserAdmin)
 admin.site.register(OTPValidation, OTPValidationAdmin)
+admin.site.register(MessageDelivery, MessageDeliveryAdmin)
@@ -1,4 +1,9 @@
-from django.conf import settings
+"""drf_auth settings: DRF_AUTH_SETTINGS merged over the defaults below"""
+import threading
+from collections.abc import Mapping
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
 
 DEFAULT_DRF_AUTH_SETTINGS = {
     "MOBILE_OPTIONAL": True,
@@ -10,6 +15,11 @@ DEFAULT_DRF_AUTH_SETTINGS = {
         "VALIDATION_ATTEMPTS": 3,
         "SUBJECT": "OTP for Verification",
         "COOLING_PERIOD": 3,
+        "STORE": "drf_auth.otp_store.ModelOTPStore",
+        "CACHE_ALIAS": "default",
+        "CACHE_TIMEOUT": 86400,
+        "PURGE_PENDING_AFTER": 1440,
+        "PURGE_VALIDATED_AFTER": 10080,
     },
     "MOBILE_VALIDATION": True,
     "EMAIL_VALIDATION": False,
@@ -21,6 +31,292 @@ DEFAULT_DRF_AUTH_SETTINGS = {
         "TEXT_MAIL_BODY": "Your account has been created.",
         "HTML_MAIL_BODY": "Your account has been created.",
     },
+    "AUTH": {
+        "CACHE_ALIAS": "default",
+        "NEGATIVE_CACHE_TIMEOUT": 60,
+        "USER_CACHE_SIZE": 1024,
+        "USER_CACHE_TIMEOUT": 60,
+    },
+    "LAST_LOGIN": {
+        "UPDATE_INTERVAL": 0,
+        "BUFFERED": False,
+        "BUFFER_SIZE": 500,
+        "FLUSH_INTERVAL": 5,
+    },
+    "THROTTLE": {
+        "ENABLED": True,
+        "CACHE_ALIAS": "default",
+        "LOGIN": {"IP": "30/min", "IDENTIFIER": "10/min"},
+        "OTP": {"IP": "10/min", "DESTINATION": "5/min"},
+        "LOCKOUT_BASE": 60,
+        "LOCKOUT_MAX": 3600,
+        "LOCKOUT_RESET": 86400,
+    },
+    "REVOCATION": {
+        "CACHE_ALIAS": "default",
+    },
+    "DELIVERY": {
+        "BACKEND": "drf_auth.delivery.SyncBackend",
+        "MAX_ATTEMPTS": 5,
+        "RETRY_BACKOFF": 30,
+        "MAX_WORKERS": 4,
+        "BATCH_SIZE": 100,
+        "FLUSH_INTERVAL": 1.0,
+        "LEASE": 300,
+    },
+    "PROVISIONING": {
+        "CHUNK_SIZE": 1000,
+        "PROCESSES": None,
+        "VIEW_PROCESSES": 2,
+        "SEND_MESSAGES": False,
+    },
+    "EXPORT": {
+        "BATCH_SIZE": 2000,
+    },
+    "ADMIN": {
+        "SEARCH": "contains",
+        "EXACT_COUNT_BELOW": 10000,
+    },
+    "IMAGES": {
+        "MAX_UPLOAD_SIZE": 10485760,
+        "MAX_PIXELS": 40000000,
+        "MAX_DIMENSION": 2048,
+        "FORMATS": ["JPEG", "PNG", "WEBP", "GIF"],
+        "QUALITY": 85,
+        "THUMBNAIL_SIZES": [64, 128, 256],
+        "WEBP": True,
+        "MAX_WORKERS": 2,
+    },
+    "METRICS": {
+        "ENABLED": False,
+        "SINK": "drf_auth.metrics.PrometheusSink",
+        "BUCKETS": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+        "QUERY_BUCKETS": [0, 1, 2, 3, 5, 8, 13, 21, 34, 55],
+    },
+    "HASHING": {
+        "PROFILE": None,
+        "PROFILES": {},
+        "MAX_WORKERS": 0,
+    },
+    "ROUTING": {
+        "PRIMARY": "default",
+        "REPLICAS": [],
+        "POLICY": {
+            "AUTHENTICATE": "replica",
+            "GET_USER": "replica",
+            "OTP_USER": "replica",
+            "CHECK_VALIDATION": "replica",
+            "CONFLICT_CHECKS": "replica",
+        },
+        "STICKY_SECONDS": 5,
+        "STICKY_COOKIE": "drf_auth_primary",
+        "OTP_SHARDS": [],
+    },
 }
 
-DRF_AUTH_SETTINGS = getattr(settings, "DRF_AUTH_SETTINGS", DEFAULT_DRF_AUTH_SETTINGS)
+# Values that must be one of the given choices, by path.
+CHOICES = {
+    ("ADMIN", "SEARCH"): ("contains", "prefix", "exact"),
+    **{
+        ("ROUTING", "POLICY", operation): ("primary", "replica")
+        for operation in DEFAULT_DRF_AUTH_SETTINGS["ROUTING"]["POLICY"]
+    },
+}
+
+
+class SettingsSection(Mapping):
+    """
+    Read-only group of settings, readable as attributes or items.
+
+    Values are stored as instance attributes, so `section.KEY` is a plain
+    attribute lookup.
+    """
+
+    def __init__(self, values: dict):
+        self.__dict__.update(values)
+
+    def __getitem__(self, key):
+        return self.__dict__[key]
+
+    def __iter__(self):
+        return iter(self.__dict__)
+
+    def __len__(self):
+        return len(self.__dict__)
+
+    def __repr__(self):
+        return "SettingsSection(%r)" % self.__dict__
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def merge(defaults: dict, values: dict, path: tuple = ()) -> dict:
+    """
+    Deep-merges `values` over `defaults`, checking keys and types.
+
+    Groups with empty defaults (e.g. `HASHING["PROFILES"]`) accept any key.
+    `None` is accepted for every setting, numbers for numbers and lists for
+    tuples.
+
+    Raises
+    ------
+    ImproperlyConfigured: If a key is unknown or a value has the wrong type.
+    """
+    if not isinstance(values, Mapping):
+        raise ImproperlyConfigured(
+            "DRF_AUTH_SETTINGS%s must be a dict." % format_path(path)
+        )
+    if not defaults:
+        return dict(values)
+    unknown = [key for key in values if key not in defaults]
+    if unknown:
+        raise ImproperlyConfigured(
+            "Unknown DRF_AUTH_SETTINGS%s key(s): %s"
+            % (format_path(path), ", ".join(sorted(map(str, unknown))))
+        )
+
+    merged = {}
+    for key, default in defaults.items():
+        if key not in values:
+            merged[key] = default
+            continue
+        value = values[key]
+        if isinstance(default, dict) and value is not None:
+            merged[key] = merge(default, value, path + (key,))
+        elif not (
+            default is None
+            or value is None
+            or isinstance(value, type(default))
+            or (is_number(default) and is_number(value))
+            or (isinstance(default, (list, tuple)) and isinstance(value, (list, tuple)))
+        ):
+            raise ImproperlyConfigured(
+                "DRF_AUTH_SETTINGS%s must be of type %s, not %r."
+                % (format_path(path + (key,)), type(default).__name__, value)
+            )
+        else:
+            merged[key] = value
+    return merged
+
+
+def format_path(path: tuple) -> str:
+    return "".join("[%r]" % key for key in path)
+
+
+def freeze(values: dict, defaults: dict) -> SettingsSection:
+    """Turns merged groups that have default keys into `SettingsSection`s."""
+    return SettingsSection(
+        {
+            key: (
+                freeze(value, defaults[key])
+                if isinstance(value, dict) and defaults.get(key)
+                else value
+            )
+            for key, value in values.items()
+        }
+    )
+
+
+class DRFAuthSettings:
+    """
+    Lazily loaded drf_auth settings.
+
+    On first access, `settings.DRF_AUTH_SETTINGS` is deep-merged over
+    `DEFAULT_DRF_AUTH_SETTINGS` and validated. Each top-level value is then
+    cached as an attribute, with groups of settings as `SettingsSection`s::
+
+        drf_auth_settings.OTP.LENGTH
+        drf_auth_settings.THROTTLE["LOGIN"]["IP"]
+
+    The cache is dropped when `DRF_AUTH_SETTINGS` changes, e.g. with
+    `override_settings`.
+    """
+
+    def __init__(self, defaults: dict = None):
+        self._defaults = defaults or DEFAULT_DRF_AUTH_SETTINGS
+        self._section = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> SettingsSection:
+        from django.conf import settings
+
+        values = getattr(settings, "DRF_AUTH_SETTINGS", None) or {}
+        merged = merge(self._defaults, values)
+        self.validate(merged)
+        return freeze(merged, self._defaults)
+
+    def validate(self, merged: dict):
+        """Checks values that are constrained beyond their type."""
+        from django.conf import settings
+
+        for path, choices in CHOICES.items():
+            value = merged
+            for key in path:
+                value = value[key]
+            if value not in choices:
+                raise ImproperlyConfigured(
+                    "DRF_AUTH_SETTINGS%s must be one of: %s"
+                    % (format_path(path), ", ".join(choices))
+                )
+        hashing = merged["HASHING"]
+        if hashing["PROFILE"] and hashing["PROFILE"] not in (hashing["PROFILES"] or {}):
+            raise ImproperlyConfigured(
+                "Unknown hashing profile: %s" % hashing["PROFILE"]
+            )
+        routing = merged["ROUTING"]
+        for alias in [
+            routing["PRIMARY"],
+            *(routing["REPLICAS"] or ()),
+            *(routing["OTP_SHARDS"] or ()),
+        ]:
+            if alias not in settings.DATABASES:
+                raise ImproperlyConfigured(
+                    "DRF_AUTH_SETTINGS['ROUTING'] uses an unknown database: %s" % alias
+                )
+
+    def __getattr__(self, attr):
+        if attr.startswith("_") or attr not in self._defaults:
+            raise AttributeError("Invalid drf_auth setting: %r" % attr)
+        with self._lock:
+            if self._section is None:
+                self._section = self._load()
+            value = self._section[attr]
+            # Later reads find the attribute without calling __getattr__.
+            setattr(self, attr, value)
+        return value
+
+    def as_dict(self) -> dict:
+        """Returns the merged settings as plain nested dicts."""
+
+        def unfreeze(value):
+            if isinstance(value, SettingsSection):
+                return {key: unfreeze(item) for key, item in value.items()}
+            return value
+
+        return {key: unfreeze(getattr(self, key)) for key in self._defaults}
+
+    def reload(self):
+        with self._lock:
+            for attr in self._defaults:
+                self.__dict__.pop(attr, None)
+            self._section = None
+
+
+drf_auth_settings = DRFAuthSettings()
+
+
+def reload_drf_auth_settings(*, setting, **kwargs):
+    if setting == "DRF_AUTH_SETTINGS":
+        drf_auth_settings.reload()
+
+
+setting_changed.connect(reload_drf_auth_settings)
+
+
+def __getattr__(name):
+    # `DRF_AUTH_SETTINGS` was a module level dict; still provide it, merged.
+    if name == "DRF_AUTH_SETTINGS":
+        return drf_auth_settings.as_dict()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -5,3 +5,6 @@ from django.utils.translation import gettext_lazy as _
 class DRFAuthConfig(AppConfig):
     name = "drf_auth"
     verbose_name = _("DRF Auth")
+
+    def ready(self):
+        import drf_auth.signals.handlers  # noqa: F401
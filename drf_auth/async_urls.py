@@ -0,0 +1,24 @@
+"""URLconf mounting the async views, for ASGI deployments"""
+from django.urls import path
+from drf_auth import async_views
+from drf_auth.urls import urlpatterns as sync_urlpatterns
+
+app_name = "drf_auth"
+
+urlpatterns = [
+    path("login/", async_views.AsyncLoginView.as_view(), name="Login"),
+    path("register/", async_views.AsyncRegisterView.as_view(), name="Register"),
+    path("otp/", async_views.AsyncOTPView.as_view(), name="OTP"),
+    path(
+        "me/",
+        async_views.AsyncRetrieveUpdateUserAccountView.as_view(),
+        name="Retrieve Update Profile",
+    ),
+]
+
+# The other endpoints have no async counterpart and keep their sync views.
+urlpatterns += [
+    pattern
+    for pattern in sync_urlpatterns
+    if pattern.name not in {url.name for url in urlpatterns}
+]
@@ -0,0 +1,276 @@
+"""Async counterparts of the login, OTP, registration and profile views, for ASGI"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from django.utils.decorators import classonlymethod
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from drf_auth.auth import aauthenticate
+from drf_auth.authentication import aget_model_user
+from drf_auth.hashers import arun_hasher
+from drf_auth.images import schedule_thumbnails
+from drf_auth.login_tracking import aupdate_last_login
+from drf_auth.metrics import AsyncInstrumentedViewMixin
+from drf_auth.serializers import (
+    CustomTokenObtainPairSerializer,
+    JWTSerializer,
+    OTPSerializer,
+    UserSerializer,
+)
+from drf_auth.throttling import LoginRateThrottle, OTPRateThrottle, record_failure
+from drf_auth.tokens import get_token_factory
+from drf_auth.utils import agenerate_otp, asend_otp, avalidate_otp
+from drf_auth.views import build_user, get_conflict_error, map_integrity_error
+from rest_framework import exceptions, status
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+User = get_user_model()
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of DRF's `APIView`.
+
+    Requests are parsed, authenticated, permission checked and throttled with
+    the usual DRF classes, and errors go through DRF's exception handler.
+    Those classes are synchronous, so authentication, permission and throttle
+    checks run in a thread. Responses are always rendered as JSON.
+    """
+
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = (AllowAny,)
+    throttle_classes = ()
+    parser_classes = (JSONParser, FormParser, MultiPartParser)
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Like APIView, CSRF checks are left to SessionAuthentication.
+        view.csrf_exempt = True
+        return view
+
+    def get_serializer_context(self) -> dict:
+        return {"request": self.request, "format": None, "view": self}
+
+    def initialize_request(self, request, *args, **kwargs) -> Request:
+        return Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[auth() for auth in self.authentication_classes],
+            parser_context={"view": self, "args": args, "kwargs": kwargs},
+        )
+
+    async def initial(self, request):
+        # Authenticating may load the user from the database.
+        await sync_to_async(getattr)(request, "user")
+
+        for permission in [permission() for permission in self.permission_classes]:
+            if not await sync_to_async(permission.has_permission)(request, self):
+                if request.authenticators and not request.successful_authenticator:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(
+                    getattr(permission, "message", None),
+                    getattr(permission, "code", None),
+                )
+
+        waits = []
+        for throttle in [throttle() for throttle in self.throttle_classes]:
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                waits.append(throttle.wait())
+        if waits:
+            raise exceptions.Throttled(
+                max((wait for wait in waits if wait is not None), default=None)
+            )
+
+    def handle_exception(self, exc) -> Response:
+        if isinstance(
+            exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+        ):
+            header = None
+            if self.request.authenticators:
+                header = self.request.authenticators[0].authenticate_header(
+                    self.request
+                )
+            if header:
+                exc.auth_header = header
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+
+        response = api_settings.EXCEPTION_HANDLER(
+            exc,
+            {
+                "view": self,
+                "args": self.args,
+                "kwargs": self.kwargs,
+                "request": self.request,
+            },
+        )
+        if response is None:
+            raise exc
+        response.exception = True
+        return response
+
+    def finalize_response(self, request, response):
+        if isinstance(response, Response):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+            response.renderer_context = {
+                "view": self,
+                "args": self.args,
+                "kwargs": self.kwargs,
+                "request": request,
+            }
+            # Rendered here rather than by Django, which would use a thread.
+            response.render()
+        return response
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        try:
+            await self.initial(request)
+            handler = None
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), None)
+            if handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            await sync_to_async(record_failure)(self, request, exc)
+            response = self.handle_exception(exc)
+        return self.finalize_response(request, response)
+
+
+class AsyncLoginView(AsyncInstrumentedViewMixin, AsyncAPIView):
+    throttle_classes = (LoginRateThrottle,)
+
+    async def post(self, request, *args, **kwargs):
+        serializer = CustomTokenObtainPairSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        # Only checks the fields; authentication is done below, asynchronously.
+        attrs = serializer.to_internal_value(request.data)
+        user = await aauthenticate(
+            request,
+            **{
+                serializer.username_field: attrs[serializer.username_field],
+                "password": attrs["password"],
+            },
+        )
+        if not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise exceptions.AuthenticationFailed(
+                serializer.error_messages["no_active_account"], "no_active_account"
+            )
+
+        tokens = await sync_to_async(get_token_factory().for_user)(user)
+        await aupdate_last_login(user)
+        data = {
+            "user": user,
+            "access_token": tokens["access"],
+            "refresh_token": tokens["refresh"],
+        }
+        jwtserializer = JWTSerializer(
+            instance=data, context=self.get_serializer_context()
+        )
+        return Response(jwtserializer.data, status=status.HTTP_200_OK)
+
+
+class AsyncOTPView(AsyncInstrumentedViewMixin, AsyncAPIView):
+    throttle_classes = (OTPRateThrottle,)
+
+    async def post(self, request, *args, **kwargs):
+        serializer = OTPSerializer(data=request.data)
+        # Validation looks the user up by destination.
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        destination = serializer.validated_data.get("destination")
+        prop = serializer.validated_data.get("prop")
+        is_login = serializer.validated_data.get("is_login")
+
+        if "otp" in request.data.keys():
+            await avalidate_otp(destination, request.data.get("otp"))
+            if is_login:
+                user = serializer.validated_data["user"]
+                await aupdate_last_login(user)
+                tokens = await sync_to_async(get_token_factory().for_user)(user)
+                data = {
+                    "user": user,
+                    "access_token": tokens["access"],
+                    "refresh_token": tokens["refresh"],
+                }
+                jwtserializer = JWTSerializer(instance=data)
+                return Response(jwtserializer.data, status=status.HTTP_202_ACCEPTED)
+            return Response(
+                data={"OTP": [_("OTP Validated successfully!")]},
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        otp_obj = await agenerate_otp(prop, destination)
+        sentotp = await asend_otp(destination, otp_obj)
+        if not sentotp["success"]:
+            raise exceptions.APIException(
+                detail=_("A Server Error occurred: " + sentotp["message"])
+            )
+        return Response(sentotp, status=status.HTTP_201_CREATED)
+
+
+class AsyncRegisterView(AsyncInstrumentedViewMixin, AsyncAPIView):
+    async def post(self, request, *args, **kwargs):
+        serializer = UserSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        # Validation checks for existing users and validated OTPs.
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        user = build_user(serializer.validated_data)
+        await arun_hasher(user.set_password, serializer.validated_data["password"])
+        try:
+            await user.asave()
+        except IntegrityError:
+            raise await sync_to_async(get_conflict_error)(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AsyncRetrieveUpdateUserAccountView(AsyncInstrumentedViewMixin, AsyncAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    async def get(self, request, *args, **kwargs):
+        user = await aget_model_user(request.user)
+        serializer = UserSerializer(user, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    async def put(self, request, *args, **kwargs):
+        return await self.update(request, partial=False)
+
+    async def patch(self, request, *args, **kwargs):
+        return await self.update(request, partial=True)
+
+    async def update(self, request, partial: bool) -> Response:
+        user = await aget_model_user(request.user)
+        serializer = UserSerializer(
+            user,
+            data=request.data,
+            partial=partial,
+            context=self.get_serializer_context(),
+        )
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await sync_to_async(self.perform_update)(serializer)
+        if "password" in request.data.keys():
+            await arun_hasher(user.set_password, request.data["password"])
+            await user.asave(update_fields=["password"])
+        return Response(serializer.data)
+
+    def perform_update(self, serializer):
+        replaced = serializer.instance.image.name
+        with map_integrity_error(serializer):
+            serializer.save()
+        if "image" in serializer.validated_data:
+            schedule_thumbnails(serializer.instance.image.name, replaced=replaced)
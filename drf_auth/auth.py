@@ -1,31 +1,189 @@
+import hashlib
+import inspect
 import re
 
-from django.contrib.auth import get_user_model
+from asgiref.sync import sync_to_async
+from django.contrib.auth import _clean_credentials, _get_backends, get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.hashers import (
+    ahash_password,
+    averify_password,
+    hash_password,
+    verify_password,
+)
+from drf_auth.metrics import observe
+from drf_auth.routers import aread_get, read_get
+
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
+# Columns needed to check credentials and to render the login response.
+LOGIN_FIELDS = (
+    "id",
+    "password",
+    "last_login",
+    "is_active",
+    "username",
+    "name",
+    "email",
+    "mobile",
+    "image",
+)
+
+
+def get_lookup_field(username: str) -> str:
+    if username.isdigit():
+        return "mobile"
+    elif EMAIL_RE.match(username) is None:
+        return "username"
+    else:
+        return "email"
+
+
+def get_negative_cache_key(username: str) -> str:
+    return "drf_auth:auth:miss:" + hashlib.sha256(username.encode()).hexdigest()
+
+
+def forget_unknown_user(*usernames):
+    """Drops `usernames` from the negative lookup cache."""
+    keys = [get_negative_cache_key(username) for username in usernames if username]
+    if keys:
+        caches[drf_auth_settings.AUTH.CACHE_ALIAS].delete_many(keys)
 
 
 class MultiFieldModelBackend(ModelBackend):
     user_model = get_user_model()
+    login_fields = [
+        field.attname
+        for field in user_model._meta.concrete_fields
+        if field.name in LOGIN_FIELDS
+    ]
 
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
             username = kwargs.get(self.user_model.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
 
-        if username.isdigit():
-            kwargs = {"mobile": username}
-        elif not re.match(r"[^@]+@[^@]+\.[^@]+", username):
-            kwargs = {"username": username}
-        else:
-            kwargs = {"email": username}
-        try:
-            user = self.user_model.objects.get(**kwargs)
-            if user.check_password(password):
-                return user
-        except self.user_model.DoesNotExist:
+        cache = caches[drf_auth_settings.AUTH.CACHE_ALIAS]
+        cache_timeout = drf_auth_settings.AUTH.NEGATIVE_CACHE_TIMEOUT
+        cache_key = get_negative_cache_key(username)
+
+        user = None
+        if not (cache_timeout and cache.get(cache_key)):
+            try:
+                user = read_get(
+                    self.user_model.objects.only(*self.login_fields),
+                    "AUTHENTICATE",
+                    **{get_lookup_field(username): username},
+                )
+            except self.user_model.DoesNotExist:
+                if cache_timeout:
+                    cache.set(cache_key, True, cache_timeout)
+
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            with observe("check_password"):
+                hash_password(password)
             return None
 
+        with observe("check_password"):
+            valid, must_update = verify_password(password, user.password)
+        if not valid:
+            return None
+        if must_update:
+            self.rehash_password(user, password)
+        if self.user_can_authenticate(user):
+            return user
+
+    def rehash_password(self, user, password: str):
+        """
+        Stores `password` hashed with the current hasher and profile.
+
+        Updates the password column alone, so the user's save signals do not
+        run again on login.
+        """
+        with observe("rehash_password"):
+            user.password = hash_password(password)
+        self.user_model.objects.filter(pk=user.pk).update(password=user.password)
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        """Async `authenticate`, using the async ORM and cache APIs."""
+        if username is None:
+            username = kwargs.get(self.user_model.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        cache = caches[drf_auth_settings.AUTH.CACHE_ALIAS]
+        cache_timeout = drf_auth_settings.AUTH.NEGATIVE_CACHE_TIMEOUT
+        cache_key = get_negative_cache_key(username)
+
+        user = None
+        if not (cache_timeout and await cache.aget(cache_key)):
+            try:
+                user = await aread_get(
+                    self.user_model.objects.only(*self.login_fields),
+                    "AUTHENTICATE",
+                    **{get_lookup_field(username): username},
+                )
+            except self.user_model.DoesNotExist:
+                if cache_timeout:
+                    await cache.aset(cache_key, True, cache_timeout)
+
+        if user is None:
+            with observe("check_password"):
+                await ahash_password(password)
+            return None
+
+        with observe("check_password"):
+            valid, must_update = await averify_password(password, user.password)
+        if not valid:
+            return None
+        if must_update:
+            with observe("rehash_password"):
+                user.password = await ahash_password(password)
+            await self.user_model.objects.filter(pk=user.pk).aupdate(
+                password=user.password
+            )
+        if self.user_can_authenticate(user):
+            return user
+
     def get_user(self, username: int):
         try:
-            return self.user_model.objects.get(pk=username)
+            return read_get(self.user_model.objects, "GET_USER", pk=username)
         except self.user_model.DoesNotExist:
             return None
+
+
+async def aauthenticate(request=None, **credentials):
+    """
+    Async `django.contrib.auth.authenticate`.
+
+    Backends without an `aauthenticate` method run in a thread.
+    """
+    for backend, backend_path in _get_backends(return_tuples=True):
+        try:
+            inspect.signature(backend.authenticate).bind(request, **credentials)
+        except TypeError:
+            # This backend does not accept these credentials.
+            continue
+        try:
+            if hasattr(backend, "aauthenticate"):
+                user = await backend.aauthenticate(request, **credentials)
+            else:
+                user = await sync_to_async(backend.authenticate)(request, **credentials)
+        except PermissionDenied:
+            break
+        if user is not None:
+            user.backend = backend_path
+            return user
+
+    await sync_to_async(user_login_failed.send)(
+        sender=__name__,
+        credentials=_clean_credentials(credentials),
+        request=request,
+    )
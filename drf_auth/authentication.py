@@ -0,0 +1,209 @@
+"""JWT authentication backed by token claims instead of a per-request query"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.routers import aread_get, read_get
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """
+    Thread-safe, size-bounded LRU cache of users whose entries expire.
+
+    `max_size` and `timeout` default to the `AUTH` settings, read when used.
+    """
+
+    def __init__(self, max_size: int = None, timeout: float = None):
+        self._max_size = max_size
+        self._timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def max_size(self) -> int:
+        if self._max_size is None:
+            return drf_auth_settings.AUTH.USER_CACHE_SIZE
+        return self._max_size
+
+    @property
+    def timeout(self) -> float:
+        if self._timeout is None:
+            return drf_auth_settings.AUTH.USER_CACHE_TIMEOUT
+        return self._timeout
+
+    def get(self, pk):
+        with self.lock:
+            entry = self.entries.get(pk)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self.entries[pk]
+                return None
+            self.entries.move_to_end(pk)
+        # Callers may modify the user; never hand out the cached instance.
+        return copy.copy(user)
+
+    def set(self, pk, user):
+        if not self.max_size:
+            return
+        with self.lock:
+            self.entries[pk] = (time.monotonic() + self.timeout, copy.copy(user))
+            self.entries.move_to_end(pk)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, pk):
+        with self.lock:
+            self.entries.pop(pk, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
+
+
+def user_not_found():
+    return AuthenticationFailed(_("User not found"), code="user_not_found")
+
+
+def get_cached_user(pk):
+    """
+    Returns the user with primary key `pk`, from `user_cache` if possible.
+
+    Raises AuthenticationFailed if the user was deleted.
+    """
+    User = get_user_model()
+    pk = User._meta.pk.to_python(pk)
+    user = user_cache.get(pk)
+    if user is None:
+        try:
+            user = read_get(User.objects, "GET_USER", pk=pk)
+        except User.DoesNotExist:
+            raise user_not_found()
+        user_cache.set(pk, user)
+    return user
+
+
+class TokenBackedUser(TokenUser):
+    """
+    User identified by the claims of a validated token.
+
+    Only the user id is read from the token. The other claims (`email`,
+    `mobile`, `name`) may have changed since the token was issued, so they and
+    anything else, including permissions, load the full user through
+    `get_cached_user` on first use.
+    """
+
+    @cached_property
+    def user(self):
+        return get_cached_user(self.id)
+
+    def __getattr__(self, attr):
+        if attr in ("token", "__setstate__"):
+            raise AttributeError(attr)
+        return getattr(self.user, attr)
+
+    def __str__(self):
+        return str(self.user)
+
+    @cached_property
+    def username(self):
+        return self.user.get_username()
+
+    @cached_property
+    def is_staff(self):
+        return self.user.is_staff
+
+    @cached_property
+    def is_superuser(self):
+        return self.user.is_superuser
+
+    @property
+    def groups(self):
+        return self.user.groups
+
+    @property
+    def user_permissions(self):
+        return self.user.user_permissions
+
+    def get_group_permissions(self, obj=None):
+        return self.user.get_group_permissions(obj)
+
+    def get_all_permissions(self, obj=None):
+        return self.user.get_all_permissions(obj)
+
+    def has_perm(self, perm, obj=None):
+        return self.user.has_perm(perm, obj)
+
+    def has_perms(self, perm_list, obj=None):
+        return self.user.has_perms(perm_list, obj)
+
+    def has_module_perms(self, module):
+        return self.user.has_module_perms(module)
+
+    def save(self, *args, **kwargs):
+        self.user.save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.user.delete(*args, **kwargs)
+
+    def set_password(self, raw_password):
+        self.user.set_password(raw_password)
+
+    def check_password(self, raw_password):
+        return self.user.check_password(raw_password)
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """
+    Authenticates a JWT without loading the user from the database.
+
+    Like simplejwt's stateless authentication, a user deactivated after the
+    token was issued stays authenticated until the token expires, unless a
+    view loads the full user.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        return TokenBackedUser(validated_token)
+
+
+def get_model_user(user):
+    """Returns the model instance behind `user`, which may be token-backed."""
+    if isinstance(user, TokenBackedUser):
+        return user.user
+    return user
+
+
+async def aget_model_user(user):
+    """Async `get_model_user`."""
+    if not isinstance(user, TokenBackedUser):
+        return user
+    if "user" in user.__dict__:
+        return user.user
+    User = get_user_model()
+    pk = User._meta.pk.to_python(user.id)
+    model_user = user_cache.get(pk)
+    if model_user is None:
+        try:
+            model_user = await aread_get(User.objects, "GET_USER", pk=pk)
+        except User.DoesNotExist:
+            raise user_not_found()
+        user_cache.set(pk, model_user)
+    # Also fills the `user` cached property, so it is not loaded again.
+    user.__dict__["user"] = model_user
+    return model_user
@@ -0,0 +1,554 @@
+"""Delivery backends for OTP and registration messages"""
+import datetime
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.metrics import timed
+from drf_auth.models import MessageDelivery
+from drf_auth.utils import check_recipient, send_message
+
+logger = logging.getLogger(__name__)
+
+QUEUED = {"success": True, "message": "Message queued for delivery!"}
+SENT = {"success": True, "message": "Message sent successfully!"}
+
+DELIVERY_FIELDS = ("status", "attempts", "next_attempt_at", "last_error", "sent_at")
+
+
+class BaseDeliveryBackend:
+    """Base class for delivery backends.
+
+    A backend receives the same arguments as `utils.send_message` and returns
+    the same `{"success": bool, "message": str}` dict.
+    """
+
+    def enqueue(
+        self, message: str, subject: str, recip: str, html_message: str = None
+    ) -> dict:
+        raise NotImplementedError
+
+    def enqueue_many(self, messages: list) -> list:
+        """Enqueues many messages, each a dict of `enqueue` keyword arguments."""
+        return [self.enqueue(**message) for message in messages]
+
+
+class SyncBackend(BaseDeliveryBackend):
+    """Sends the message inline, on the calling thread."""
+
+    def enqueue(self, message, subject, recip, html_message=None):
+        return send_message(message, subject, recip, html_message)
+
+
+class ThreadPoolBackend(BaseDeliveryBackend):
+    """Records the message and sends it from an in-process thread pool.
+
+    Failed attempts are rescheduled in-process with exponential backoff. A
+    message being sent is leased for `LEASE` seconds; rows left pending, or
+    still sending once their lease expired (e.g. after a crash or a restart),
+    are picked up by `process_messages`.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=drf_auth_settings.DELIVERY.MAX_WORKERS,
+            thread_name_prefix="drf_auth_delivery",
+        )
+
+    def enqueue(self, message, subject, recip, html_message=None):
+        check_recipient(recip)
+        delivery = MessageDelivery.objects.create(
+            recipient=recip,
+            subject=subject,
+            message=message,
+            html_message=html_message,
+            status=MessageDelivery.SENDING,
+            next_attempt_at=get_lease_expiry(),
+        )
+        transaction.on_commit(lambda: self.executor.submit(self.run, delivery.pk))
+        return dict(QUEUED)
+
+    def run(self, pk, claimed=True):
+        close_old_connections()
+        try:
+            # A retry is only sent if `process_messages` did not claim it first.
+            if not claimed and not claim(pk):
+                return
+            delivery = MessageDelivery.objects.get(pk=pk)
+            if not deliver(delivery) and delivery.status == MessageDelivery.PENDING:
+                delay = (delivery.next_attempt_at - timezone.now()).total_seconds()
+                timer = threading.Timer(
+                    max(delay, 0), self.executor.submit, args=(self.run, pk, False)
+                )
+                timer.daemon = True
+                timer.start()
+        except Exception:
+            logger.exception("Delivery of message %s crashed.", pk)
+        finally:
+            close_old_connections()
+
+
+class DatabaseBackend(BaseDeliveryBackend):
+    """Stores the message in the database to be sent by `process_messages`."""
+
+    def enqueue(self, message, subject, recip, html_message=None):
+        check_recipient(recip)
+        MessageDelivery.objects.create(
+            recipient=recip,
+            subject=subject,
+            message=message,
+            html_message=html_message,
+        )
+        return dict(QUEUED)
+
+    def enqueue_many(self, messages):
+        for message in messages:
+            check_recipient(message["recip"])
+        MessageDelivery.objects.bulk_create(
+            [
+                MessageDelivery(
+                    recipient=message["recip"],
+                    subject=message["subject"],
+                    message=message["message"],
+                    html_message=message.get("html_message"),
+                )
+                for message in messages
+            ]
+        )
+        return [dict(QUEUED) for message in messages]
+
+
+def get_lease_expiry() -> datetime.datetime:
+    """
+    Returns when a message claimed now may be claimed again.
+
+    The `next_attempt_at` of a message being sent is its lease expiry, so a
+    message left sending by a crashed worker is retried once it expires.
+    """
+    return timezone.now() + datetime.timedelta(seconds=drf_auth_settings.DELIVERY.LEASE)
+
+
+def claim(pk) -> bool:
+    """Marks the pending message `pk` as sending, unless it was claimed already."""
+    return bool(
+        MessageDelivery.objects.filter(pk=pk, status=MessageDelivery.PENDING).update(
+            status=MessageDelivery.SENDING, next_attempt_at=get_lease_expiry()
+        )
+    )
+
+
+def get_retry_delay(attempts: int) -> datetime.timedelta:
+    backoff = drf_auth_settings.DELIVERY.RETRY_BACKOFF
+    return datetime.timedelta(seconds=backoff * 2 ** max(attempts - 1, 0))
+
+
+def record_attempt(delivery: MessageDelivery, sent: dict):
+    """Updates `delivery` (without saving it) with the outcome of an attempt."""
+    delivery.attempts += 1
+    if sent["success"]:
+        delivery.status = MessageDelivery.SENT
+        delivery.sent_at = timezone.now()
+        delivery.last_error = ""
+    else:
+        delivery.last_error = sent["message"] or ""
+        if delivery.attempts >= drf_auth_settings.DELIVERY.MAX_ATTEMPTS:
+            delivery.status = MessageDelivery.DEAD
+        else:
+            delivery.status = MessageDelivery.PENDING
+            delivery.next_attempt_at = timezone.now() + get_retry_delay(
+                delivery.attempts
+            )
+
+
+def deliver(delivery: MessageDelivery) -> bool:
+    """
+    Makes a single delivery attempt and records its outcome.
+
+    Parameters
+    ----------
+    delivery: MessageDelivery
+        Message to be sent.
+
+    Returns
+    -------
+    sent: bool
+    """
+    try:
+        sent = send_message(
+            delivery.message,
+            delivery.subject,
+            delivery.recipient,
+            delivery.html_message,
+        )
+    except ValueError as err:
+        sent = {"success": False, "message": str(err)}
+
+    record_attempt(delivery, sent)
+    delivery.save()
+    return sent["success"]
+
+
+class BatchSender:
+    """
+    Buffers messages and sends them in batches over persistent mail and SMS
+    connections.
+
+    The buffer is flushed once it holds `batch_size` messages, when a message is
+    added after `flush_interval` seconds, or when `flush()` is called.
+    """
+
+    def __init__(self, batch_size: int = None, flush_interval: float = None):
+        self.batch_size = batch_size or drf_auth_settings.DELIVERY.BATCH_SIZE
+        if flush_interval is None:
+            flush_interval = drf_auth_settings.DELIVERY.FLUSH_INTERVAL
+        self.flush_interval = flush_interval
+        self.mail_connection = None
+        self.sms_connection = None
+        self.pending = []
+        self.last_flush = time.monotonic()
+        # `lock` guards the buffer only, so adding never waits on a send;
+        # `send_lock` keeps one flush at a time on the connections.
+        self.lock = threading.Lock()
+        self.send_lock = threading.RLock()
+
+    def add(
+        self,
+        message: str,
+        subject: str,
+        recip: str,
+        html_message: str = None,
+        delivery: MessageDelivery = None,
+        flush: bool = True,
+    ) -> list:
+        """
+        Buffers a message, flushing the buffer if it is due and `flush` is set.
+
+        Raises ValueError for an invalid recipient, like `utils.send_message`.
+
+        Returns
+        -------
+        results: list
+            `(delivery, sent)` pairs of the flushed messages, if any.
+        """
+        from django.conf import settings
+        from django.core.mail import EmailMultiAlternatives
+        from sendsms.message import SmsMessage
+
+        if check_recipient(recip):
+            msg = EmailMultiAlternatives(
+                subject=subject,
+                body=message,
+                from_email=settings.EMAIL_FROM,
+                to=[recip],
+            )
+            if html_message:
+                msg.attach_alternative(html_message, "text/html")
+        else:
+            msg = SmsMessage(body=message, to=[recip])
+
+        with self.lock:
+            self.pending.append((msg, delivery))
+            due = flush and self.is_due()
+        if due:
+            return self.flush()
+        return []
+
+    def is_due(self) -> bool:
+        return (
+            len(self.pending) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def flush(self) -> list:
+        """Sends every buffered message and returns `(delivery, sent)` pairs."""
+        from django.core.mail import EmailMessage
+
+        with self.lock:
+            batch, self.pending = self.pending, []
+            self.last_flush = time.monotonic()
+        if not batch:
+            return []
+
+        mails = [item for item in batch if isinstance(item[0], EmailMessage)]
+        sms = [item for item in batch if not isinstance(item[0], EmailMessage)]
+        results = []
+        with self.send_lock:
+            if mails:
+                results += self.send_batch(mails, self.get_mail_connection)
+            if sms:
+                results += self.send_batch(sms, self.get_sms_connection)
+        return results
+
+    def send_batch(self, items: list, get_connection) -> list:
+        """
+        Sends `items` one at a time over the open connection.
+
+        A batch send that fails part way does not tell which messages were
+        sent, so each result is recorded as it is known. A failed message
+        drops the connection, as the server may have closed an idle one, and
+        is sent once more over a new connection before it is recorded as failed.
+        """
+        results = []
+        for msg, delivery in items:
+            for retry in (True, False):
+                try:
+                    get_connection().send_messages([msg])
+                except Exception as ex:
+                    self.close()
+                    if retry:
+                        continue
+                    sent = {
+                        "success": False,
+                        "message": "Message sending failed!" + str(ex.args),
+                    }
+                else:
+                    sent = dict(SENT)
+                break
+            results.append((delivery, sent))
+        return results
+
+    def get_mail_connection(self):
+        if self.mail_connection is None:
+            from django.core.mail import get_connection
+
+            self.mail_connection = get_connection()
+            self.mail_connection.open()
+        return self.mail_connection
+
+    def get_sms_connection(self):
+        if self.sms_connection is None:
+            from sendsms.api import get_connection
+
+            self.sms_connection = get_connection()
+            self.sms_connection.open()
+        return self.sms_connection
+
+    def close(self):
+        with self.send_lock:
+            for connection in (self.mail_connection, self.sms_connection):
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        logger.exception("Could not close delivery connection.")
+            self.mail_connection = None
+            self.sms_connection = None
+
+
+def save_results(results: list):
+    """Records `(delivery, sent)` pairs returned by `BatchSender`."""
+    deliveries = []
+    for delivery, sent in results:
+        if delivery is None:
+            if not sent["success"]:
+                logger.error("Message delivery failed: %s", sent["message"])
+            continue
+        record_attempt(delivery, sent)
+        deliveries.append(delivery)
+    if deliveries:
+        MessageDelivery.objects.bulk_update(deliveries, DELIVERY_FIELDS)
+
+
+class BatchingBackend(BaseDeliveryBackend):
+    """Records the message and sends it with a shared `BatchSender`.
+
+    A background thread flushes the buffer every `FLUSH_INTERVAL` seconds, or as
+    soon as it holds `BATCH_SIZE` messages. Messages that still fail after a
+    reconnect are left pending, and are only retried by a `process_messages`
+    worker, which must be deployed alongside.
+    """
+
+    def __init__(self):
+        self.sender = BatchSender()
+        self.wakeup = threading.Event()
+        flusher = threading.Thread(
+            target=self.run, name="drf_auth_delivery_flusher", daemon=True
+        )
+        flusher.start()
+
+    def enqueue(self, message, subject, recip, html_message=None):
+        check_recipient(recip)
+        delivery = MessageDelivery.objects.create(
+            recipient=recip,
+            subject=subject,
+            message=message,
+            html_message=html_message,
+            status=MessageDelivery.SENDING,
+            next_attempt_at=get_lease_expiry(),
+        )
+        transaction.on_commit(lambda: self.add(delivery))
+        return dict(QUEUED)
+
+    def add(self, delivery):
+        self.sender.add(
+            delivery.message,
+            delivery.subject,
+            delivery.recipient,
+            delivery.html_message,
+            delivery=delivery,
+            flush=False,
+        )
+        if len(self.sender.pending) >= self.sender.batch_size:
+            self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.sender.flush_interval)
+            self.wakeup.clear()
+            try:
+                save_results(self.sender.flush())
+            except Exception:
+                logger.exception("Flushing queued messages failed.")
+            finally:
+                close_old_connections()
+
+
+def claim_pending(limit: int = 100) -> list:
+    """
+    Marks up to `limit` due messages as sending and returns them.
+
+    Messages still sending once their lease expired are due again. Each row
+    is claimed with an UPDATE conditional on it still being due, and only the
+    rows this call updated are returned. Where the database supports it, the
+    rows are first locked with `skip_locked` so workers pick different ones.
+    SQLite does not: its rows are selected outside a transaction, as two
+    workers reading then writing in one would deadlock, and concurrent
+    workers may select the same rows but only claim each once.
+    """
+    due = Q(
+        status__in=(MessageDelivery.PENDING, MessageDelivery.SENDING),
+        next_attempt_at__lte=timezone.now(),
+    )
+    lease_expiry = get_lease_expiry()
+    queryset = MessageDelivery.objects.filter(due).order_by("next_attempt_at")
+    alias = router.db_for_write(MessageDelivery)
+    skip_locked = connections[alias].features.has_select_for_update_skip_locked
+    with transaction.atomic(using=alias) if skip_locked else nullcontext():
+        if skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        pks = list(queryset.values_list("pk", flat=True)[:limit])
+        claimed = [
+            pk
+            for pk in pks
+            if MessageDelivery.objects.filter(due, pk=pk).update(
+                status=MessageDelivery.SENDING, next_attempt_at=lease_expiry
+            )
+        ]
+    return list(MessageDelivery.objects.filter(pk__in=claimed))
+
+
+def process_pending(limit: int = 100, sender: BatchSender = None) -> int:
+    """
+    Sends up to `limit` pending messages in batches.
+
+    Parameters
+    ----------
+    limit: int
+        Maximum number of messages to claim.
+    sender: BatchSender
+        Sender to reuse across calls, keeping its connections open. A temporary
+        one is used (and closed) if not given.
+
+    Returns
+    -------
+    processed: int
+    """
+    deliveries = claim_pending(limit)
+    if not deliveries:
+        return 0
+
+    owns_sender = sender is None
+    if owns_sender:
+        sender = BatchSender(batch_size=limit)
+    try:
+        results = []
+        for delivery in deliveries:
+            try:
+                results += sender.add(
+                    delivery.message,
+                    delivery.subject,
+                    delivery.recipient,
+                    delivery.html_message,
+                    delivery=delivery,
+                )
+            except ValueError as err:
+                results.append((delivery, {"success": False, "message": str(err)}))
+        results += sender.flush()
+        save_results(results)
+    finally:
+        if owns_sender:
+            sender.close()
+    return len(deliveries)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> BaseDeliveryBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = import_string(drf_auth_settings.DELIVERY.BACKEND)
+                _backend = backend_class()
+    return _backend
+
+
+def reset_backend(*, setting, **kwargs):
+    """Drops the cached instance when `DRF_AUTH_SETTINGS` changes."""
+    global _backend
+    if setting == "DRF_AUTH_SETTINGS":
+        _backend = None
+
+
+setting_changed.connect(reset_backend)
+
+
+@timed("queue_message")
+def queue_message(
+    message: str, subject: str, recip: str, html_message: str = None
+) -> dict:
+    """
+    Hands a message over to the configured delivery backend.
+
+    Parameters
+    ----------
+    message: str
+        Message that is to be sent to user.
+    subject: str
+        Subject that is to be sent to user, in case prop is an email.
+    recip: str
+        Recipient to whom message is being sent.
+    html_message: str
+        HTML variant of message, if any.
+
+    Returns
+    -------
+    sent: dict
+    """
+    return get_backend().enqueue(message, subject, recip, html_message)
+
+
+def queue_messages(messages: list) -> list:
+    """
+    Hands many messages over to the configured delivery backend at once.
+
+    Parameters
+    ----------
+    messages: list
+        Dicts with the `queue_message` arguments.
+
+    Returns
+    -------
+    sent: list
+    """
+    return get_backend().enqueue_many(messages)
@@ -0,0 +1,142 @@
+"""Password hashers tuned by named cost profiles, and a bounded hashing pool"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    BCryptSHA256PasswordHasher,
+    PBKDF2PasswordHasher,
+    PBKDF2SHA1PasswordHasher,
+    ScryptPasswordHasher,
+    check_password,
+    make_password,
+)
+from django.core.exceptions import ImproperlyConfigured
+from drf_auth.app_settings import drf_auth_settings
+
+
+def get_profile() -> dict:
+    """Returns the cost parameters of `HASHING["PROFILE"]`, empty if unset."""
+    name = drf_auth_settings.HASHING.PROFILE
+    if not name:
+        return {}
+    try:
+        return drf_auth_settings.HASHING.PROFILES[name]
+    except KeyError:
+        raise ImproperlyConfigured("Unknown hashing profile: %s" % name)
+
+
+def profiled(key: str, default):
+    """A hasher attribute read from the active profile's `key`, else `default`."""
+    return property(lambda self: get_profile().get(key, default))
+
+
+# Each hasher keeps the algorithm name of the hasher it extends, so existing
+# hashes still verify, and Django's `check_password` asks for a rehash when they
+# were made with parameters other than the profile's.
+
+
+class ProfiledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = profiled("PBKDF2_ITERATIONS", PBKDF2PasswordHasher.iterations)
+
+
+class ProfiledPBKDF2SHA1PasswordHasher(PBKDF2SHA1PasswordHasher):
+    iterations = profiled("PBKDF2_ITERATIONS", PBKDF2SHA1PasswordHasher.iterations)
+
+
+class ProfiledArgon2PasswordHasher(Argon2PasswordHasher):
+    """Needs `argon2-cffi`, like Django's `Argon2PasswordHasher`."""
+
+    time_cost = profiled("ARGON2_TIME_COST", Argon2PasswordHasher.time_cost)
+    memory_cost = profiled("ARGON2_MEMORY_COST", Argon2PasswordHasher.memory_cost)
+    parallelism = profiled("ARGON2_PARALLELISM", Argon2PasswordHasher.parallelism)
+
+
+class ProfiledBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    """Needs `bcrypt`, like Django's `BCryptSHA256PasswordHasher`."""
+
+    rounds = profiled("BCRYPT_ROUNDS", BCryptSHA256PasswordHasher.rounds)
+
+
+class ProfiledScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = profiled("SCRYPT_WORK_FACTOR", ScryptPasswordHasher.work_factor)
+    block_size = profiled("SCRYPT_BLOCK_SIZE", ScryptPasswordHasher.block_size)
+    parallelism = profiled("SCRYPT_PARALLELISM", ScryptPasswordHasher.parallelism)
+    maxmem = profiled("SCRYPT_MAXMEM", ScryptPasswordHasher.maxmem)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the pool hashing runs in, or None to hash on the calling thread.
+
+    The pool has `HASHING["MAX_WORKERS"]` threads; hashlib, argon2-cffi and
+    bcrypt release the GIL, so this caps the cores a login storm can take.
+    """
+    global _executor
+    max_workers = drf_auth_settings.HASHING.MAX_WORKERS
+    if not max_workers:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="drf_auth_hashing"
+                )
+    return _executor
+
+
+def run_hasher(func, *args):
+    """Calls `func(*args)` in the hashing pool and waits for its result."""
+    executor = get_executor()
+    if executor is None:
+        return func(*args)
+    return executor.submit(func, *args).result()
+
+
+def verify_password(password: str, encoded: str) -> tuple:
+    """
+    Checks `password` against `encoded` in the hashing pool.
+
+    Returns
+    -------
+    valid: bool
+    must_update: bool
+        Whether the hash should be remade with the preferred hasher or its
+        current parameters.
+    """
+    must_update = []
+    valid = run_hasher(check_password, password, encoded, must_update.append)
+    return valid, bool(must_update)
+
+
+def hash_password(password: str) -> str:
+    """Hashes `password` with the preferred hasher, in the hashing pool."""
+    return run_hasher(make_password, password)
+
+
+async def arun_hasher(func, *args):
+    """
+    Async `run_hasher`: awaits `func(*args)` in the hashing pool.
+
+    Without `HASHING["MAX_WORKERS"]`, the event loop's default executor is used
+    so hashing never blocks the loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), func, *args)
+
+
+async def averify_password(password: str, encoded: str) -> tuple:
+    """Async `verify_password`."""
+    must_update = []
+    valid = await arun_hasher(check_password, password, encoded, must_update.append)
+    return valid, bool(must_update)
+
+
+async def ahash_password(password: str) -> str:
+    """Async `hash_password`."""
+    return await arun_hasher(make_password, password)
@@ -0,0 +1,243 @@
+"""Processing of uploaded profile images and their thumbnails"""
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from drf_auth.app_settings import drf_auth_settings
+from rest_framework.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Pillow is imported by the functions that open images, so importing the views
+# does not load it.
+
+# Pillow format -> file extension of the stored original.
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+# Thumbnails of formats other than JPEG and WebP are stored as PNG.
+THUMBNAIL_FORMATS = {"jpg": "JPEG", "webp": "WEBP"}
+
+
+def get_storage():
+    return get_user_model()._meta.get_field("image").storage
+
+
+def get_thumbnail_sizes() -> list:
+    return sorted(drf_auth_settings.IMAGES.THUMBNAIL_SIZES, reverse=True)
+
+
+def has_alpha(image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def prepare(image):
+    """Applies the EXIF orientation and converts to a mode that resizes well."""
+    from PIL import ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA" if has_alpha(image) else "RGB")
+    return image
+
+
+def encode(image, fmt: str) -> bytes:
+    """Encodes `image` without its EXIF, XMP or text metadata."""
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    options = {"quality": drf_auth_settings.IMAGES.QUALITY}
+    if image.info.get("icc_profile"):
+        options["icc_profile"] = image.info["icc_profile"]
+    if fmt == "JPEG":
+        options["optimize"] = True
+        options["progressive"] = True
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def validate_image(upload) -> ContentFile:
+    """
+    Checks an uploaded image and returns a cleaned copy.
+
+    The copy is rotated according to its EXIF orientation, downscaled to fit
+    `MAX_DIMENSION` and re-encoded without metadata (EXIF, GPS, XMP...).
+
+    Raises
+    ------
+    ValidationError: If the upload is too large or not an allowed image.
+    """
+    if upload.size > drf_auth_settings.IMAGES.MAX_UPLOAD_SIZE:
+        raise ValidationError(_("The image file is too large."))
+
+    from PIL import Image, UnidentifiedImageError
+
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except (UnidentifiedImageError, OSError):
+        raise ValidationError(_("Upload a valid image."))
+    except Image.DecompressionBombError:
+        # Raised by Pillow itself for over twice its MAX_IMAGE_PIXELS.
+        raise ValidationError(_("The image has too many pixels."))
+    if image.format not in drf_auth_settings.IMAGES.FORMATS:
+        raise ValidationError(_("Unsupported image format."))
+    # Checked before decoding, so a decompression bomb is never loaded.
+    if image.width * image.height > drf_auth_settings.IMAGES.MAX_PIXELS:
+        raise ValidationError(_("The image has too many pixels."))
+
+    fmt = image.format
+    max_dimension = drf_auth_settings.IMAGES.MAX_DIMENSION
+    try:
+        if fmt == "JPEG":
+            # Lets libjpeg decode large photos at a fraction of their size.
+            image.draft("RGB", (max_dimension, max_dimension))
+        image = prepare(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        content = encode(image, fmt)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ValidationError(_("Upload a valid image."))
+    name = posixpath.splitext(upload.name or "image")[0] + "." + EXTENSIONS[fmt]
+    return ContentFile(content, name=name)
+
+
+def get_thumbnail_names(name: str, size: int) -> dict:
+    """
+    Returns the storage names of the thumbnails of `name` at `size`.
+
+    Returns
+    -------
+    names: dict
+        `{"default": str}`, plus `"webp"` when WebP variants are enabled.
+    """
+    directory, filename = posixpath.split(name)
+    stem, extension = posixpath.splitext(filename)
+    extension = extension.lstrip(".").lower()
+    if extension not in THUMBNAIL_FORMATS:
+        extension = "png"
+    base = posixpath.join(directory, "thumbnails", "%s_%d" % (stem, size))
+    names = {"default": "%s.%s" % (base, extension)}
+    if drf_auth_settings.IMAGES.WEBP and extension != "webp":
+        names["webp"] = base + ".webp"
+    return names
+
+
+def generate_thumbnails(name: str, force: bool = False) -> list:
+    """
+    Writes the thumbnails of the stored image `name`.
+
+    Thumbnails are made from largest to smallest, each from the previous one.
+    Existing thumbnails are kept unless `force` is set.
+
+    Returns
+    -------
+    names: list
+        Storage names of the thumbnails written.
+    """
+    storage = get_storage()
+    sizes = get_thumbnail_sizes()
+    pending = {
+        size: {
+            variant: thumbnail
+            for variant, thumbnail in get_thumbnail_names(name, size).items()
+            if force or not storage.exists(thumbnail)
+        }
+        for size in sizes
+    }
+    if not any(pending.values()):
+        return []
+
+    from PIL import Image
+
+    with storage.open(name, "rb") as f:
+        image = Image.open(f)
+        if image.format == "JPEG":
+            image.draft("RGB", (sizes[0], sizes[0]))
+        image = prepare(image)
+        image.load()
+
+    written = []
+    for size in sizes:
+        image.thumbnail((size, size), Image.LANCZOS)
+        for variant, thumbnail in pending[size].items():
+            fmt = (
+                "WEBP"
+                if variant == "webp"
+                else THUMBNAIL_FORMATS.get(posixpath.splitext(thumbnail)[1][1:], "PNG")
+            )
+            if storage.exists(thumbnail):
+                storage.delete(thumbnail)
+            written.append(storage.save(thumbnail, ContentFile(encode(image, fmt))))
+    return written
+
+
+def delete_thumbnails(name: str) -> list:
+    """
+    Deletes the thumbnails of the image `name`, WebP variants included.
+
+    Returns
+    -------
+    names: list
+        Storage names of the thumbnails deleted.
+    """
+    storage = get_storage()
+    deleted = []
+    for size in get_thumbnail_sizes():
+        default = get_thumbnail_names(name, size)["default"]
+        for thumbnail in {default, posixpath.splitext(default)[0] + ".webp"}:
+            if storage.exists(thumbnail):
+                storage.delete(thumbnail)
+                deleted.append(thumbnail)
+    return deleted
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=drf_auth_settings.IMAGES.MAX_WORKERS,
+                    thread_name_prefix="drf_auth_images",
+                )
+    return _executor
+
+
+def run_generate_thumbnails(name: str):
+    try:
+        generate_thumbnails(name, force=True)
+    except Exception:
+        logger.exception("Generating thumbnails of %s failed.", name)
+
+
+def run_delete_thumbnails(name: str):
+    try:
+        delete_thumbnails(name)
+    except Exception:
+        logger.exception("Deleting thumbnails of %s failed.", name)
+
+
+def schedule_thumbnails(name: str, replaced: str = None):
+    """
+    Generates the thumbnails of `name` in the background once committed, and
+    deletes those of the image it `replaced`.
+    """
+
+    def submit():
+        executor = get_executor()
+        if replaced and replaced != name:
+            executor.submit(run_delete_thumbnails, replaced)
+        if name:
+            executor.submit(run_generate_thumbnails, name)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,113 @@
+"""Cheap last_login tracking for the login views"""
+import atexit
+import datetime
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.routers import unpinned
+
+
+class LastLoginBuffer:
+    """
+    Collects last_login values and writes them with a single `bulk_update`.
+
+    The buffer is flushed when it holds `size` users, when a login is added
+    `interval` seconds after the last flush, and at interpreter exit. Both
+    default to the `LAST_LOGIN` settings, read when used.
+    """
+
+    def __init__(self, size: int = None, interval: float = None):
+        self._size = size
+        self._interval = interval
+        self.pending = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            return drf_auth_settings.LAST_LOGIN.BUFFER_SIZE
+        return self._size
+
+    @property
+    def interval(self) -> float:
+        if self._interval is None:
+            return drf_auth_settings.LAST_LOGIN.FLUSH_INTERVAL
+        return self._interval
+
+    def add(self, pk, last_login: datetime.datetime):
+        with self.lock:
+            self.pending[pk] = last_login
+            due = (
+                len(self.pending) >= self.size
+                or time.monotonic() - self.last_flush >= self.interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        if pending:
+            User = get_user_model()
+            User.objects.bulk_update(
+                [User(pk=pk, last_login=value) for pk, value in pending.items()],
+                ["last_login"],
+            )
+
+
+buffer = LastLoginBuffer()
+atexit.register(buffer.flush)
+
+
+def is_recent(user, now: datetime.datetime) -> bool:
+    """Whether `user` logged in less than `UPDATE_INTERVAL` minutes ago."""
+    interval = drf_auth_settings.LAST_LOGIN.UPDATE_INTERVAL
+    return bool(
+        interval
+        and user.last_login is not None
+        and now - user.last_login < datetime.timedelta(minutes=interval)
+    )
+
+
+def update_last_login(user):
+    """
+    Records a login by writing only `last_login`, without sending signals.
+
+    Parameters
+    ----------
+    user: get_user_model()
+        User who just logged in.
+    """
+    now = timezone.now()
+    if is_recent(user, now):
+        return
+
+    user.last_login = now
+    # Logging in should not keep the client's reads off the replicas.
+    with unpinned():
+        if drf_auth_settings.LAST_LOGIN.BUFFERED:
+            buffer.add(user.pk, now)
+        else:
+            type(user).objects.filter(pk=user.pk).update(last_login=now)
+
+
+async def aupdate_last_login(user):
+    """Async `update_last_login`."""
+    now = timezone.now()
+    if is_recent(user, now):
+        return
+
+    user.last_login = now
+    with unpinned():
+        if drf_auth_settings.LAST_LOGIN.BUFFERED:
+            # A flush writes to the database, so it must not run on the event
+            # loop.
+            await sync_to_async(buffer.add)(user.pk, now)
+        else:
+            await type(user).objects.filter(pk=user.pk).aupdate(last_login=now)
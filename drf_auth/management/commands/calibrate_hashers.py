@@ -0,0 +1,188 @@
+import json
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    BCryptSHA256PasswordHasher,
+    PBKDF2PasswordHasher,
+    PBKDF2SHA1PasswordHasher,
+    ScryptPasswordHasher,
+    get_hasher,
+)
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+
+HASHERS = {
+    "pbkdf2_sha256": PBKDF2PasswordHasher,
+    "pbkdf2_sha1": PBKDF2SHA1PasswordHasher,
+    "argon2": Argon2PasswordHasher,
+    "bcrypt_sha256": BCryptSHA256PasswordHasher,
+    "scrypt": ScryptPasswordHasher,
+}
+# OpenSSL's default scrypt memory limit, used by hashlib when maxmem is 0.
+SCRYPT_DEFAULT_MAXMEM = 32 * 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures password hashing speed on this host and suggests a "
+        "HASHING profile that takes about --target-ms per hash."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--algorithm",
+            choices=sorted(HASHERS),
+            help="Hasher to calibrate (default: the first of PASSWORD_HASHERS).",
+        )
+        parser.add_argument(
+            "--target-ms",
+            type=float,
+            default=250.0,
+            help="Wanted duration of one hash, in milliseconds.",
+        )
+        parser.add_argument(
+            "--samples", type=int, default=5, help="Hashes timed per measurement."
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=os.cpu_count(),
+            help="Threads hashing at once for the throughput measurement.",
+        )
+        parser.add_argument(
+            "--argon2-memory-cost",
+            type=int,
+            default=Argon2PasswordHasher.memory_cost,
+            help="Argon2 memory in KiB, kept fixed while time_cost is tuned.",
+        )
+        parser.add_argument(
+            "--argon2-parallelism",
+            type=int,
+            default=Argon2PasswordHasher.parallelism,
+        )
+        parser.add_argument(
+            "--profile", default="calibrated", help="Name of the suggested profile."
+        )
+
+    def make_hasher(self, algorithm: str, params: dict):
+        hasher = HASHERS[algorithm]()
+        for attribute, value in params.items():
+            setattr(hasher, attribute, value)
+        return hasher
+
+    def measure(self, algorithm: str, params: dict) -> float:
+        """Returns the median duration of one hash with `params`, in seconds."""
+        hasher = self.make_hasher(algorithm, params)
+        password = get_random_string(16)
+        durations = []
+        for _ in range(self.samples):
+            salt = hasher.salt()
+            start = time.perf_counter()
+            try:
+                hasher.encode(password, salt)
+            except ValueError as e:
+                # Raised by Django when argon2-cffi or bcrypt is missing.
+                raise CommandError(str(e))
+            durations.append(time.perf_counter() - start)
+        return statistics.median(durations)
+
+    def measure_throughput(self, algorithm: str, params: dict, threads: int) -> float:
+        """Returns the hashes per second of `threads` threads hashing at once."""
+        hasher = self.make_hasher(algorithm, params)
+        password = get_random_string(16)
+        count = threads * self.samples
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(
+                executor.map(
+                    lambda _: hasher.encode(password, hasher.salt()), range(count)
+                )
+            )
+        return count / (time.perf_counter() - start)
+
+    def calibrate(self, algorithm: str, target: float, options) -> dict:
+        """
+        Returns the hasher attributes expected to take `target` seconds.
+
+        The cost of PBKDF2 and of Argon2's time_cost grows linearly; bcrypt's
+        rounds and scrypt's work factor are powers of two.
+        """
+        if algorithm.startswith("pbkdf2"):
+            base = 100000
+            elapsed = self.measure(algorithm, {"iterations": base})
+            iterations = int(round(base * target / elapsed, -3))
+            return {"iterations": max(iterations, 1000)}
+        if algorithm == "argon2":
+            params = {
+                "time_cost": 1,
+                "memory_cost": options["argon2_memory_cost"],
+                "parallelism": options["argon2_parallelism"],
+            }
+            elapsed = self.measure(algorithm, params)
+            if elapsed > target:
+                self.stderr.write(
+                    "One pass over %d KiB already takes %.1f ms; lower "
+                    "--argon2-memory-cost to reach the target."
+                    % (params["memory_cost"], elapsed * 1000)
+                )
+            params["time_cost"] = max(int(round(target / elapsed)), 1)
+            return params
+        if algorithm == "bcrypt_sha256":
+            base = 10
+            elapsed = self.measure(algorithm, {"rounds": base})
+            rounds = base + int(round(math.log2(target / elapsed)))
+            return {"rounds": min(max(rounds, 4), 31)}
+        if algorithm == "scrypt":
+            base = 2**14
+            block_size = ScryptPasswordHasher.block_size
+            elapsed = self.measure(
+                algorithm,
+                {"work_factor": base, "maxmem": 256 * base * block_size},
+            )
+            work_factor = 2 ** max(int(round(math.log2(base * target / elapsed))), 1)
+            params = {"work_factor": work_factor, "maxmem": 0}
+            if 256 * work_factor * block_size > SCRYPT_DEFAULT_MAXMEM:
+                params["maxmem"] = 256 * work_factor * block_size
+            return params
+        raise CommandError("Cannot calibrate %s." % algorithm)
+
+    def handle(self, *args, **options):
+        self.samples = max(options["samples"], 1)
+        algorithm = options["algorithm"] or get_hasher().algorithm
+        if algorithm not in HASHERS:
+            raise CommandError("Cannot calibrate %s; pass --algorithm." % algorithm)
+
+        params = self.calibrate(algorithm, options["target_ms"] / 1000.0, options)
+        elapsed = self.measure(algorithm, params)
+        threads = max(options["threads"] or 1, 1)
+        throughput = self.measure_throughput(algorithm, params, threads)
+
+        self.stdout.write("Algorithm: %s" % algorithm)
+        for attribute, value in params.items():
+            self.stdout.write("%s: %s" % (attribute, value))
+        self.stdout.write("One hash: %.1f ms" % (elapsed * 1000))
+        self.stdout.write("Hashes/sec, 1 thread: %.1f" % (1 / elapsed))
+        self.stdout.write("Hashes/sec, %d threads: %.1f" % (threads, throughput))
+
+        prefix = algorithm.split("_")[0].upper()
+        profile = {
+            "%s_%s" % (prefix, attribute.upper()): value
+            for attribute, value in params.items()
+        }
+        self.stdout.write(
+            "\nAdd to DRF_AUTH_SETTINGS:\n\n"
+            + json.dumps(
+                {
+                    "HASHING": {
+                        "PROFILE": options["profile"],
+                        "PROFILES": {options["profile"]: profile},
+                    }
+                },
+                indent=4,
+            )
+        )
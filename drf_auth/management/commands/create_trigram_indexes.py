@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from drf_auth.models import OTPValidation
+
+# Columns searched with icontains by the admin in the default "contains" mode.
+SEARCH_COLUMNS = (
+    (get_user_model(), ("username", "name", "email", "mobile")),
+    (OTPValidation, ("destination",)),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates PostgreSQL trigram indexes so the admin's icontains search does "
+        "not scan the user and OTP tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            "--drop", action="store_true", help="Drop the indexes instead."
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if connection.vendor != "postgresql":
+            raise CommandError("Trigram indexes need PostgreSQL.")
+        quote = connection.ops.quote_name
+
+        with connection.cursor() as cursor:
+            if not options["drop"]:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for model, fields in SEARCH_COLUMNS:
+                table = model._meta.db_table
+                for field in fields:
+                    column = model._meta.get_field(field).column
+                    name = "%s_%s_trgm" % (table, column)
+                    if options["drop"]:
+                        sql = "DROP INDEX CONCURRENTLY IF EXISTS %s" % quote(name)
+                    else:
+                        # Matches the UPPER(...) LIKE UPPER(...) SQL of icontains.
+                        sql = (
+                            "CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s "
+                            "USING gin (UPPER(%s::text) gin_trgm_ops)"
+                            % (quote(name), quote(table), quote(column))
+                        )
+                    cursor.execute(sql)
+                    self.stdout.write(
+                        "%s %s." % ("Dropped" if options["drop"] else "Created", name)
+                    )
@@ -0,0 +1,66 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from drf_auth.export import EXPORT_FIELDS, FORMATS, export_users, parse_bound
+
+
+class Command(BaseCommand):
+    help = "Streams the user table as CSV or JSON lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="File to write to, or - for standard output.",
+        )
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument(
+            "--fields",
+            help="Comma separated subset of: %s." % ", ".join(EXPORT_FIELDS),
+        )
+        parser.add_argument(
+            "--joined-after",
+            help="Only users who joined at or after this ISO date/datetime.",
+        )
+        parser.add_argument(
+            "--joined-before",
+            help="Only users who joined before this ISO date/datetime.",
+        )
+        parser.add_argument(
+            "--gzip", action="store_true", help="Compress the output with gzip."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Number of rows fetched per query.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            chunks = export_users(
+                fmt=options["format"],
+                fields=options["fields"].split(",") if options["fields"] else None,
+                joined_after=options["joined_after"]
+                and parse_bound(options["joined_after"]),
+                joined_before=options["joined_before"]
+                and parse_bound(options["joined_before"]),
+                gzip=options["gzip"],
+                batch_size=options["batch_size"],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        if options["output"] == "-":
+            output = sys.stdout.buffer if options["gzip"] else sys.stdout
+        elif options["gzip"]:
+            output = open(options["output"], "wb")
+        else:
+            output = open(options["output"], "w", newline="", encoding="utf-8")
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options["output"] == "-":
+                output.flush()
+            else:
+                output.close()
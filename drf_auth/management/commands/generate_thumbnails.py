@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from drf_auth.images import generate_thumbnails
+
+
+def backfill(name: str, force: bool = False):
+    try:
+        return name, len(generate_thumbnails(name, force=force)), None
+    except Exception as e:
+        return name, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = "Generates missing thumbnails of existing profile images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of images read from the database at a time.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate thumbnails that already exist.",
+        )
+
+    def iter_pages(self, batch_size: int):
+        queryset = (
+            get_user_model()
+            .objects.exclude(image="")
+            .order_by("pk")
+            .values_list("pk", "image")
+        )
+        last_pk = None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(page[:batch_size])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            yield [name for pk, name in rows]
+
+    def handle(self, *args, **options):
+        executor = ProcessPoolExecutor(
+            max_workers=options["processes"],
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        )
+        images = thumbnails = failed = 0
+        try:
+            task = partial(backfill, force=options["force"])
+            for names in self.iter_pages(options["batch_size"]):
+                for name, written, error in executor.map(task, names, chunksize=8):
+                    images += 1
+                    thumbnails += written
+                    if error:
+                        failed += 1
+                        self.stderr.write("%s: %s" % (name, error))
+        finally:
+            executor.shutdown()
+
+        self.stdout.write(
+            "Wrote %d thumbnail(s) for %d image(s), %d failed."
+            % (thumbnails, images, failed)
+        )
@@ -0,0 +1,81 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from drf_auth.provisioning import FORMATS, import_users
+
+
+class Command(BaseCommand):
+    help = "Creates users in bulk from a CSV or JSON lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", help="File to import, or - to read from standard input."
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Input format. Guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            "--report",
+            help="File receiving one JSON object per rejected row.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help="Number of rows validated and inserted at a time.",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Number of password hashing processes; 0 hashes in this process.",
+        )
+        parser.add_argument(
+            "--send-messages",
+            action="store_true",
+            default=None,
+            help="Queue the registration mail/message for each created user.",
+        )
+        parser.add_argument(
+            "--skip-password-validation",
+            action="store_true",
+            help="Do not run AUTH_PASSWORD_VALIDATORS on imported passwords.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            if path.endswith((".jsonl", ".ndjson")):
+                fmt = "jsonl"
+            elif path.endswith(".csv"):
+                fmt = "csv"
+            else:
+                raise CommandError(
+                    "Cannot guess the format of %s; use --format." % path
+                )
+
+        stream = (
+            sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+        )
+        report = open(options["report"], "w") if options["report"] else None
+        try:
+            result = import_users(
+                stream,
+                fmt,
+                report=report,
+                chunk_size=options["chunk_size"],
+                processes=options["processes"],
+                send_messages=options["send_messages"],
+                validate_passwords=not options["skip_password_validation"],
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if report is not None:
+                report.close()
+
+        self.stdout.write(
+            "Created %d user(s), rejected %d row(s)."
+            % (result["created"], result["failed"])
+        )
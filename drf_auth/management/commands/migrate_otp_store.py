@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from drf_auth.app_settings import drf_auth_settings
+
+
+class Command(BaseCommand):
+    help = "Copies OTP validation state from one OTP store to another."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="source",
+            default="drf_auth.otp_store.ModelOTPStore",
+            help="Dotted path of the store to read from.",
+        )
+        parser.add_argument(
+            "--to",
+            dest="target",
+            help="Dotted path of the store to write to (default: the configured one).",
+        )
+
+    def handle(self, *args, **options):
+        options["target"] = options["target"] or drf_auth_settings.OTP.STORE
+        if options["source"] == options["target"]:
+            raise CommandError("Source and target stores are the same.")
+
+        source = import_string(options["source"])()
+        target = import_string(options["target"])()
+
+        count = 0
+        try:
+            for record in source.iter_records():
+                target.import_record(record)
+                count += 1
+        except NotImplementedError as err:
+            raise CommandError(str(err))
+
+        self.stdout.write("Migrated %d OTP record(s)." % count)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from drf_auth.delivery import BatchSender, process_pending
+
+
+class Command(BaseCommand):
+    help = "Sends queued OTP and registration messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Maximum number of messages claimed and sent per batch.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when there is nothing to send.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the currently due messages and exit.",
+        )
+
+    def handle(self, *args, **options):
+        sender = BatchSender(batch_size=options["batch_size"])
+        try:
+            while True:
+                processed = process_pending(limit=options["batch_size"], sender=sender)
+                if processed:
+                    self.stdout.write("Processed %d message(s)." % processed)
+                if options["once"]:
+                    if processed < options["batch_size"]:
+                        break
+                elif not processed:
+                    time.sleep(options["interval"])
+        finally:
+            sender.close()
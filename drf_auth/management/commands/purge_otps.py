@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from drf_auth.utils import purge_otps
+
+
+class Command(BaseCommand):
+    help = "Deletes expired and validated OTP records in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pending-after",
+            type=int,
+            help="Minutes after which unvalidated OTPs are deleted.",
+        )
+        parser.add_argument(
+            "--validated-after",
+            type=int,
+            help="Minutes after which validated OTPs are deleted.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Maximum number of rows deleted per statement.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many records would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        result = purge_otps(
+            pending_after=options["pending_after"],
+            validated_after=options["validated_after"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        total = result["pending"] + result["validated"]
+        self.stdout.write(
+            "%s %d pending and %d validated OTP record(s) in %.2fs (%.1f rows/s)."
+            % (
+                "Would delete" if options["dry_run"] else "Deleted",
+                result["pending"],
+                result["validated"],
+                result["seconds"],
+                total / result["seconds"] if result["seconds"] else 0,
+            )
+        )
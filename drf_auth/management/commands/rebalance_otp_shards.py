@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.models import OTPValidation
+from drf_auth.routers import get_otp_shard, get_otp_shards
+
+# Copied along with the destination when a record moves.
+FIELDS = (
+    "otp",
+    "prop",
+    "is_validated",
+    "validate_attempt",
+    "send_counter",
+    "reactive_at",
+    "created",
+    "modified",
+)
+
+
+class Command(BaseCommand):
+    help = "Moves OTP records to the shard their destination belongs to."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="sources",
+            nargs="+",
+            default=[],
+            metavar="DATABASE",
+            help="Other databases holding OTP records, e.g. removed shards.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Maximum number of records read and moved at a time.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many records would be moved.",
+        )
+
+    def handle(self, *args, **options):
+        shards = get_otp_shards()
+        if not shards:
+            raise CommandError("DRF_AUTH_SETTINGS['ROUTING']['OTP_SHARDS'] is not set.")
+        unknown = [
+            alias for alias in options["sources"] if alias not in settings.DATABASES
+        ]
+        if unknown:
+            raise CommandError("Unknown database(s): %s" % ", ".join(unknown))
+
+        # Records are on the primary until OTP state is first sharded.
+        sources = [drf_auth_settings.ROUTING.PRIMARY, *shards, *options["sources"]]
+        moved = 0
+        for source in dict.fromkeys(sources):
+            source_scanned, source_moved = self.rebalance(
+                source, shards, options["batch_size"], options["dry_run"]
+            )
+            moved += source_moved
+            self.stdout.write(
+                "%s: %d of %d OTP record(s) %s."
+                % (
+                    source,
+                    source_moved,
+                    source_scanned,
+                    "to move" if options["dry_run"] else "moved",
+                )
+            )
+        self.stdout.write(
+            "%s %d OTP record(s)."
+            % ("Would move" if options["dry_run"] else "Moved", moved)
+        )
+
+    def rebalance(self, source, shards, batch_size, dry_run) -> tuple:
+        """Moves the records of `source` that belong to another shard."""
+        scanned = moved = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                OTPValidation.objects.using(source)
+                .filter(pk__gt=last_pk)
+                .order_by("pk")[:batch_size]
+            )
+            if not batch:
+                return scanned, moved
+            scanned += len(batch)
+            last_pk = batch[-1].pk
+
+            by_shard = {}
+            for record in batch:
+                shard = get_otp_shard(record.destination, shards)
+                if shard != source:
+                    by_shard.setdefault(shard, []).append(record)
+            for shard, records in by_shard.items():
+                moved += len(records)
+                if not dry_run:
+                    self.move(records, source, shard)
+
+    @staticmethod
+    def move(records, source, target):
+        """
+        Copies `records` to `target`, then deletes them from `source`.
+
+        A destination may already have a record on `target`, written after
+        the shards changed; the one modified last is kept. Running the
+        command again after an interruption finishes the move.
+        """
+        queryset = OTPValidation.objects.using(target)
+        with transaction.atomic(using=target):
+            current = {
+                record.destination: record
+                for record in queryset.filter(
+                    destination__in=[record.destination for record in records]
+                )
+            }
+            new = []
+            for record in records:
+                values = {field: getattr(record, field) for field in FIELDS}
+                existing = current.get(record.destination)
+                if existing is None:
+                    new.append(OTPValidation(destination=record.destination, **values))
+                elif existing.modified < record.modified:
+                    queryset.filter(pk=existing.pk).update(**values)
+            # A record created on `target` meanwhile is the latest one.
+            queryset.bulk_create(new, ignore_conflicts=True)
+        OTPValidation.objects.using(source).filter(
+            pk__in=[record.pk for record in records]
+        ).delete()
@@ -0,0 +1,304 @@
+"""Opt-in latency and query instrumentation for drf_auth views"""
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.core.signals import setting_changed
+from django.db import connections
+from django.utils.module_loading import import_string
+from drf_auth.app_settings import drf_auth_settings
+
+logger = logging.getLogger(__name__)
+
+# Histograms recorded by drf_auth: name -> (help text, counts queries).
+HISTOGRAMS = {
+    "drf_auth_request_seconds": ("Time spent in a drf_auth view.", False),
+    "drf_auth_request_queries": ("Database queries run by a drf_auth view.", True),
+    "drf_auth_request_query_seconds": (
+        "Time spent in database queries by a drf_auth view.",
+        False,
+    ),
+    "drf_auth_phase_seconds": (
+        "Time spent in a phase (password hashing, OTP, token, message) of a request.",
+        False,
+    ),
+}
+
+_request = ContextVar("drf_auth_metrics_request", default=None)
+
+
+def is_enabled() -> bool:
+    return drf_auth_settings.METRICS.ENABLED
+
+
+class BaseSink:
+    """
+    Receives every observation.
+
+    Set `METRICS["SINK"]` to the dotted path of a subclass to forward them to
+    StatsD, OpenTelemetry, logs...
+    """
+
+    def observe(self, name: str, labels: dict, value: float):
+        raise NotImplementedError
+
+
+class LoggingSink(BaseSink):
+    """Logs each observation to the `drf_auth.metrics` logger."""
+
+    def observe(self, name, labels, value):
+        logger.info("%s %s %.6f", name, labels, value)
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, one series per label set."""
+
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels: dict, value: float):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [
+            "# HELP %s %s" % (self.name, self.help_text),
+            "# TYPE %s histogram" % self.name,
+        ]
+        with self.lock:
+            series = [
+                (key, list(counts), total)
+                for key, (counts, total) in self.series.items()
+            ]
+        for key, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    "%s_bucket%s %d"
+                    % (
+                        self.name,
+                        format_labels(key + (("le", str(bound)),)),
+                        cumulative,
+                    )
+                )
+            lines.append("%s_sum%s %s" % (self.name, format_labels(key), repr(total)))
+            lines.append("%s_count%s %d" % (self.name, format_labels(key), cumulative))
+        return lines
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"'
+        % (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+
+
+class PrometheusSink(BaseSink):
+    """
+    Aggregates observations into in-process histograms.
+
+    Each process keeps its own histograms, so with several workers every
+    worker must be scraped, or another sink used.
+    """
+
+    def __init__(self):
+        self.histograms = {
+            name: Histogram(
+                name,
+                help_text,
+                (
+                    drf_auth_settings.METRICS.QUERY_BUCKETS
+                    if counts_queries
+                    else drf_auth_settings.METRICS.BUCKETS
+                ),
+            )
+            for name, (help_text, counts_queries) in HISTOGRAMS.items()
+        }
+
+    def observe(self, name, labels, value):
+        self.histograms[name].observe(labels, value)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink() -> BaseSink:
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = import_string(drf_auth_settings.METRICS.SINK)()
+    return _sink
+
+
+def reset_sink(*, setting, **kwargs):
+    """Drops the cached instance when `DRF_AUTH_SETTINGS` changes."""
+    global _sink
+    if setting == "DRF_AUTH_SETTINGS":
+        _sink = None
+
+
+setting_changed.connect(reset_sink)
+
+
+class RequestMetrics:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper for the request.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - start
+
+
+def wrap_connections(stack: ExitStack, metrics: RequestMetrics):
+    """Counts the queries of this thread's connections with `metrics`."""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics))
+
+
+def record_request(metrics: RequestMetrics, elapsed: float):
+    sink = get_sink()
+    labels = {"endpoint": metrics.endpoint}
+    sink.observe("drf_auth_request_seconds", labels, elapsed)
+    sink.observe("drf_auth_request_queries", labels, metrics.queries)
+    sink.observe("drf_auth_request_query_seconds", labels, metrics.query_seconds)
+
+
+@contextmanager
+def observe_request(endpoint: str):
+    """Records the duration and database queries of a request to `endpoint`."""
+    metrics = RequestMetrics(endpoint)
+    token = _request.set(metrics)
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            wrap_connections(stack, metrics)
+            yield metrics
+    finally:
+        elapsed = time.perf_counter() - start
+        _request.reset(token)
+        record_request(metrics, elapsed)
+
+
+@asynccontextmanager
+async def aobserve_request(endpoint: str):
+    """
+    Async `observe_request`.
+
+    The async ORM runs queries in the thread `sync_to_async` uses for the
+    request, so its connections are wrapped there.
+    """
+    metrics = RequestMetrics(endpoint)
+    token = _request.set(metrics)
+    start = time.perf_counter()
+    stack = ExitStack()
+    try:
+        await sync_to_async(wrap_connections)(stack, metrics)
+        yield metrics
+    finally:
+        await sync_to_async(stack.close)()
+        elapsed = time.perf_counter() - start
+        _request.reset(token)
+        record_request(metrics, elapsed)
+
+
+@contextmanager
+def observe(phase: str):
+    """Records the time spent in `phase`, if instrumentation is enabled."""
+    if not is_enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request = _request.get()
+        get_sink().observe(
+            "drf_auth_phase_seconds",
+            {"endpoint": request.endpoint if request else "", "phase": phase},
+            time.perf_counter() - start,
+        )
+
+
+def timed(phase: str):
+    """Decorator recording the time spent in the decorated function."""
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not is_enabled():
+                    return await func(*args, **kwargs)
+                with observe(phase):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with observe(phase):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class InstrumentedViewMixin:
+    """Records the latency and query count of every request to the view."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_enabled():
+            return super().dispatch(request, *args, **kwargs)
+        with observe_request(self.__class__.__name__):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class AsyncInstrumentedViewMixin:
+    """`InstrumentedViewMixin` for views with an async `dispatch`."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not is_enabled():
+            return await super().dispatch(request, *args, **kwargs)
+        async with aobserve_request(self.__class__.__name__):
+            return await super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:01
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_auth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('recipient', models.CharField(max_length=150, verbose_name='Recipient')),
+                ('subject', models.CharField(blank=True, max_length=255, verbose_name='Subject')),
+                ('message', models.TextField(verbose_name='Message')),
+                ('html_message', models.TextField(blank=True, null=True, verbose_name='HTML Message')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('dead', 'Dead')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next Attempt At')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last Error')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent At')),
+            ],
+            options={
+                'verbose_name': 'Message Delivery',
+                'verbose_name_plural': 'Message Deliveries',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='drf_auth_me_status_fe3bd3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_auth', '0002_message_delivery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otpvalidation',
+            index=models.Index(fields=['is_validated', 'modified'], name='drf_auth_ot_is_vali_6fcac4_idx'),
+        ),
+    ]
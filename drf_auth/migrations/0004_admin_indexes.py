@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_auth', '0003_otpvalidation_purge_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otpvalidation',
+            index=models.Index(fields=['modified'], name='drf_auth_ot_modifie_7c2553_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'username'], name='drf_auth_us_is_acti_927434_idx'),
+        ),
+    ]
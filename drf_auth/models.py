@@ -1,8 +1,10 @@
 import uuid
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, router
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from drf_auth.routers import get_otp_shard, get_otp_shards
 from model_utils.models import TimeStampedModel
 
 
@@ -41,6 +43,36 @@ class User(AbstractUser):
     def __str__(self):
         return str(self.name) + " | " + str(self.username)
 
+    class Meta(AbstractUser.Meta):
+        # Serves the admin's is_active filter with its default username ordering.
+        indexes = [models.Index(fields=["is_active", "username"])]
+
+
+class OTPValidationManager(models.Manager):
+    """
+    Resolves the database storing each destination's OTP state.
+
+    With `ROUTING["OTP_SHARDS"]` set, records are partitioned across those
+    databases by a hash of their destination; otherwise, the database routers
+    pick it as usual.
+    """
+
+    def get_shard(self, destination: str):
+        """Returns the alias of the shard storing `destination`, or None."""
+        return get_otp_shard(destination)
+
+    def get_write_db(self, destination: str) -> str:
+        """Returns the alias `destination`'s record is written to."""
+        return self.get_shard(destination) or router.db_for_write(self.model)
+
+    def for_destination(self, destination: str):
+        """A queryset on the database storing `destination`'s record."""
+        return self.using(self.get_shard(destination))
+
+    def per_shard(self) -> list:
+        """A queryset per database storing records."""
+        return [self.using(alias) for alias in get_otp_shards()] or [self.all()]
+
 
 class OTPValidation(TimeStampedModel):
     EMAIL = "E"
@@ -68,9 +100,55 @@ class OTPValidation(TimeStampedModel):
     )
     reactive_at = models.DateTimeField(verbose_name=_("ReActivate Sending OTP"))
 
+    objects = OTPValidationManager()
+
     def __str__(self):
         return self.destination
 
     class Meta:
         verbose_name = _("OTP Validation")
         verbose_name_plural = _("OTP Validations")
+        indexes = [
+            models.Index(fields=["is_validated", "modified"]),
+            models.Index(fields=["modified"]),
+        ]
+
+
+class MessageDelivery(TimeStampedModel):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    DEAD = "dead"
+    STATUS_CHOICES = (
+        (PENDING, _("Pending")),
+        (SENDING, _("Sending")),
+        (SENT, _("Sent")),
+        (DEAD, _("Dead")),
+    )
+
+    recipient = models.CharField(verbose_name=_("Recipient"), max_length=150)
+    subject = models.CharField(verbose_name=_("Subject"), max_length=255, blank=True)
+    message = models.TextField(verbose_name=_("Message"))
+    html_message = models.TextField(
+        verbose_name=_("HTML Message"), blank=True, null=True
+    )
+    status = models.CharField(
+        verbose_name=_("Status"),
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveIntegerField(verbose_name=_("Attempts"), default=0)
+    next_attempt_at = models.DateTimeField(
+        verbose_name=_("Next Attempt At"), default=timezone.now
+    )
+    last_error = models.TextField(verbose_name=_("Last Error"), blank=True)
+    sent_at = models.DateTimeField(verbose_name=_("Sent At"), blank=True, null=True)
+
+    def __str__(self):
+        return "%s (%s)" % (self.recipient, self.status)
+
+    class Meta:
+        verbose_name = _("Message Delivery")
+        verbose_name_plural = _("Message Deliveries")
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
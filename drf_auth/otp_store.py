@@ -0,0 +1,599 @@
+"""Storage backends for OTP validation state"""
+import datetime
+import hashlib
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.models import OTPValidation
+from drf_auth.routers import get_otp_shards, get_read_db, get_write_db
+
+
+class BaseOTPStore:
+    """
+    Base class for OTP stores.
+
+    Records are `OTPValidation` instances; stores that do not persist them in
+    the database return unsaved instances.
+    """
+
+    def get(self, destination: str):
+        """Returns the record for `destination`, or None."""
+        raise NotImplementedError
+
+    def is_validated(self, destination: str) -> bool:
+        record = self.get(destination)
+        return record is not None and record.is_validated
+
+    def validated_destinations(self, destinations) -> set:
+        """Returns which of `destinations` have been validated."""
+        return {
+            destination
+            for destination in destinations
+            if self.is_validated(destination)
+        }
+
+    def reset(
+        self,
+        destination: str,
+        prop: str,
+        otp: str,
+        attempts: int,
+        reactive_at: datetime.datetime,
+        record: OTPValidation = None,
+    ) -> OTPValidation:
+        """Stores a fresh, unvalidated OTP for `destination`.
+
+        `record` is the current record, if the caller already fetched it.
+        """
+        raise NotImplementedError
+
+    def mark_validated(self, record: OTPValidation) -> bool:
+        """
+        Validates the OTP `record` was read with, if it is still pending.
+
+        Returns whether this call validated it; concurrent requests cannot both
+        validate the same OTP.
+        """
+        raise NotImplementedError
+
+    def decrement_attempts(self, record: OTPValidation):
+        """
+        Consumes one validation attempt of the OTP `record` was read with.
+
+        Returns the attempts left, or None when that OTP is no longer pending:
+        validated, replaced or out of attempts. Each value is returned to one
+        caller only, so concurrent requests never consume the same attempt.
+        """
+        raise NotImplementedError
+
+    def set_reactive_at(self, record: OTPValidation, reactive_at: datetime.datetime):
+        raise NotImplementedError
+
+    def increment_send_counter(self, record: OTPValidation):
+        raise NotImplementedError
+
+    def record_send(self, record: OTPValidation, reactive_at: datetime.datetime):
+        """Records that the OTP was sent: sets its cooldown and counts the send."""
+        self.set_reactive_at(record, reactive_at)
+        self.increment_send_counter(record)
+
+    def iter_records(self):
+        """Yields every stored record, for migrating between stores."""
+        raise NotImplementedError
+
+    def import_record(self, record: OTPValidation):
+        """Stores `record` as-is, for migrating between stores."""
+        raise NotImplementedError
+
+    def purge(
+        self,
+        pending_before: datetime.datetime,
+        validated_before: datetime.datetime,
+        batch_size: int = 1000,
+        dry_run: bool = False,
+    ) -> dict:
+        """
+        Deletes records last modified before the given cutoffs.
+
+        Returns the number of (matching, when `dry_run`) pending and validated
+        records. Stores that expire records by themselves delete nothing.
+        """
+        return {"pending": 0, "validated": 0}
+
+    # Async variants used by the async views. They run the methods above in a
+    # thread, unless a store overrides them.
+
+    async def aget(self, destination: str):
+        return await sync_to_async(self.get)(destination)
+
+    async def areset(
+        self, destination, prop, otp, attempts, reactive_at, record=None
+    ) -> OTPValidation:
+        return await sync_to_async(self.reset)(
+            destination, prop, otp, attempts, reactive_at, record
+        )
+
+    async def amark_validated(self, record: OTPValidation) -> bool:
+        return await sync_to_async(self.mark_validated)(record)
+
+    async def adecrement_attempts(self, record: OTPValidation):
+        return await sync_to_async(self.decrement_attempts)(record)
+
+    async def aset_reactive_at(self, record, reactive_at):
+        await sync_to_async(self.set_reactive_at)(record, reactive_at)
+
+    async def aincrement_send_counter(self, record: OTPValidation):
+        await sync_to_async(self.increment_send_counter)(record)
+
+    async def arecord_send(self, record: OTPValidation, reactive_at):
+        await sync_to_async(self.record_send)(record, reactive_at)
+
+
+class ModelOTPStore(BaseOTPStore):
+    """
+    Keeps OTP state in the `OTPValidation` table.
+
+    Records are read and written on the database `OTPValidation.objects`
+    resolves for their destination, so OTP state can be sharded with
+    `ROUTING["OTP_SHARDS"]`.
+    """
+
+    def get(self, destination):
+        try:
+            return OTPValidation.objects.for_destination(destination).get(
+                destination=destination
+            )
+        except OTPValidation.DoesNotExist:
+            return None
+
+    def is_validated(self, destination):
+        return bool(self.validated_destinations([destination]))
+
+    def validated_destinations(self, destinations):
+        destinations = list(destinations)
+        if get_otp_shards():
+            by_shard = {}
+            for destination in destinations:
+                shard = OTPValidation.objects.get_shard(destination)
+                by_shard.setdefault(shard, []).append(destination)
+            return {
+                destination
+                for shard, items in by_shard.items()
+                for destination in OTPValidation.objects.using(shard)
+                .filter(destination__in=items, is_validated=True)
+                .values_list("destination", flat=True)
+            }
+
+        alias = get_read_db("CHECK_VALIDATION")
+        validated = set(
+            OTPValidation.objects.using(alias)
+            .filter(destination__in=destinations, is_validated=True)
+            .values_list("destination", flat=True)
+        )
+        missing = [item for item in destinations if item not in validated]
+        if missing and alias != get_write_db():
+            # The replica may not have the validation yet.
+            validated.update(
+                OTPValidation.objects.using(get_write_db())
+                .filter(destination__in=missing, is_validated=True)
+                .values_list("destination", flat=True)
+            )
+        return validated
+
+    def reset(self, destination, prop, otp, attempts, reactive_at, record=None):
+        alias = OTPValidation.objects.get_write_db(destination)
+        queryset = OTPValidation.objects.using(alias).filter(destination=destination)
+        fields = self.get_reset_fields(prop, otp, attempts, reactive_at)
+        if record is None:
+            # Most likely a new destination, so INSERT straight away.
+            try:
+                with transaction.atomic(using=alias):
+                    return queryset.create(destination=destination, **fields)
+            except IntegrityError:
+                # Stored after all, or by a concurrent request.
+                pass
+        # UPDATE first, so the row (or, on SQLite, the database) is locked
+        # before anything is read; a SELECT FOR UPDATE would deadlock SQLite
+        # writers.
+        with transaction.atomic(using=alias):
+            if not queryset.update(modified=timezone.now(), **fields):
+                try:
+                    with transaction.atomic(using=alias):
+                        return queryset.create(destination=destination, **fields)
+                except IntegrityError:
+                    # A concurrent request inserted it first.
+                    queryset.update(modified=timezone.now(), **fields)
+            return queryset.get()
+
+    @staticmethod
+    def get_reset_fields(prop, otp, attempts, reactive_at) -> dict:
+        return {
+            "otp": otp,
+            "prop": prop,
+            "is_validated": False,
+            "validate_attempt": attempts,
+            "reactive_at": reactive_at,
+        }
+
+    def update(self, record, **fields):
+        OTPValidation.objects.for_destination(record.destination).filter(
+            pk=record.pk
+        ).update(modified=timezone.now(), **fields)
+
+    @staticmethod
+    def pending(record):
+        """The row of `record`, if its OTP is unchanged and still pending."""
+        return OTPValidation.objects.using(
+            OTPValidation.objects.get_write_db(record.destination)
+        ).filter(
+            pk=record.pk,
+            otp=record.otp,
+            is_validated=False,
+            validate_attempt__gt=0,
+        )
+
+    def mark_validated(self, record):
+        if not self.pending(record).update(is_validated=True, modified=timezone.now()):
+            return False
+        record.is_validated = True
+        return True
+
+    def decrement_attempts(self, record):
+        queryset = self.pending(record)
+        with transaction.atomic(using=queryset.db):
+            if not queryset.update(
+                validate_attempt=F("validate_attempt") - 1, modified=timezone.now()
+            ):
+                return None
+            # The UPDATE locks the row until commit, so this reads the value it
+            # left, not one left by a concurrent request.
+            record.validate_attempt = (
+                OTPValidation.objects.using(queryset.db)
+                .values_list("validate_attempt", flat=True)
+                .get(pk=record.pk)
+            )
+        return record.validate_attempt
+
+    def set_reactive_at(self, record, reactive_at):
+        record.reactive_at = reactive_at
+        self.update(record, reactive_at=reactive_at)
+
+    def increment_send_counter(self, record):
+        record.send_counter += 1
+        self.update(record, send_counter=F("send_counter") + 1)
+
+    def record_send(self, record, reactive_at):
+        record.reactive_at = reactive_at
+        record.send_counter += 1
+        self.update(record, reactive_at=reactive_at, send_counter=F("send_counter") + 1)
+
+    async def aget(self, destination):
+        try:
+            return await OTPValidation.objects.for_destination(destination).aget(
+                destination=destination
+            )
+        except OTPValidation.DoesNotExist:
+            return None
+
+    async def areset(self, destination, prop, otp, attempts, reactive_at, record=None):
+        # Runs in a thread, for the transaction.
+        return await sync_to_async(self.reset)(
+            destination, prop, otp, attempts, reactive_at, record
+        )
+
+    async def aupdate(self, record, **fields):
+        await OTPValidation.objects.for_destination(record.destination).filter(
+            pk=record.pk
+        ).aupdate(modified=timezone.now(), **fields)
+
+    async def amark_validated(self, record):
+        if not await self.pending(record).aupdate(
+            is_validated=True, modified=timezone.now()
+        ):
+            return False
+        record.is_validated = True
+        return True
+
+    async def adecrement_attempts(self, record):
+        # Runs in a thread, for the transaction.
+        return await sync_to_async(self.decrement_attempts)(record)
+
+    async def aset_reactive_at(self, record, reactive_at):
+        record.reactive_at = reactive_at
+        await self.aupdate(record, reactive_at=reactive_at)
+
+    async def aincrement_send_counter(self, record):
+        record.send_counter += 1
+        await self.aupdate(record, send_counter=F("send_counter") + 1)
+
+    async def arecord_send(self, record, reactive_at):
+        record.reactive_at = reactive_at
+        record.send_counter += 1
+        await self.aupdate(
+            record, reactive_at=reactive_at, send_counter=F("send_counter") + 1
+        )
+
+    def iter_records(self):
+        for queryset in OTPValidation.objects.per_shard():
+            yield from queryset.order_by("pk").iterator()
+
+    def import_record(self, record):
+        OTPValidation.objects.for_destination(record.destination).update_or_create(
+            destination=record.destination,
+            defaults={
+                "otp": record.otp,
+                "prop": record.prop,
+                "is_validated": record.is_validated,
+                "validate_attempt": record.validate_attempt,
+                "send_counter": record.send_counter,
+                "reactive_at": record.reactive_at,
+            },
+        )
+
+    def purge(self, pending_before, validated_before, batch_size=1000, dry_run=False):
+        result = {"pending": 0, "validated": 0}
+        for queryset in OTPValidation.objects.per_shard():
+            result["pending"] += self.delete_in_batches(
+                queryset.filter(is_validated=False, modified__lt=pending_before),
+                batch_size,
+                dry_run,
+            )
+            result["validated"] += self.delete_in_batches(
+                queryset.filter(is_validated=True, modified__lt=validated_before),
+                batch_size,
+                dry_run,
+            )
+        return result
+
+    @staticmethod
+    def delete_in_batches(queryset, batch_size, dry_run):
+        if dry_run:
+            return queryset.count()
+
+        # Delete by primary key in short statements so rows are never locked
+        # for long, instead of one DELETE over the whole range.
+        deleted = 0
+        while True:
+            pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            deleted += (
+                OTPValidation.objects.using(queryset.db).filter(pk__in=pks).delete()[0]
+            )
+
+
+class CacheOTPStore(BaseOTPStore):
+    """
+    Keeps OTP state in a Django cache, expiring it after `CACHE_TIMEOUT`.
+
+    Each OTP gets a random nonce, stored with it. Its attempts counter and
+    validated flag are keyed by that nonce, so a record read before the OTP
+    was replaced can neither consume the new OTP's attempts nor validate it.
+    Attempts are consumed with `decr` and the flag is set with `add`, which
+    are atomic, so no read-modify-write is needed; unlike `ModelOTPStore`, a
+    right OTP consumes an attempt too. The sending cooldown is a key that
+    expires at `reactive_at`.
+
+    The caches have no compare-and-set across keys: a validation racing the
+    replacement of its OTP may still succeed, but only flags the replaced OTP.
+    """
+
+    prefix = "drf_auth:otp"
+    fields = ("state", "sent", "cooldown")
+
+    def __init__(self):
+        from django.core.cache import caches
+
+        self.cache = caches[drf_auth_settings.OTP.CACHE_ALIAS]
+        self.timeout = drf_auth_settings.OTP.CACHE_TIMEOUT
+
+    def key(self, field, destination):
+        digest = hashlib.sha256(destination.encode()).hexdigest()
+        return "%s:%s:%s" % (self.prefix, field, digest)
+
+    def keys(self, destination):
+        return {field: self.key(field, destination) for field in self.fields}
+
+    def otp_key(self, field, nonce):
+        """Key of the `attempts` or `validated` value of one OTP."""
+        return "%s:%s:%s" % (self.prefix, field, nonce)
+
+    @staticmethod
+    def get_nonce(state):
+        # States stored before nonces used the destination's digest, which
+        # keeps their counters readable.
+        return (
+            state.get("nonce")
+            or hashlib.sha256(state["destination"].encode()).hexdigest()
+        )
+
+    def get(self, destination):
+        keys = self.keys(destination)
+        values = self.cache.get_many(keys.values())
+        state = values.get(keys["state"])
+        if state is None:
+            return None
+
+        nonce = self.get_nonce(state)
+        attempts_key = self.otp_key("attempts", nonce)
+        validated_key = self.otp_key("validated", nonce)
+        counters = self.cache.get_many([attempts_key, validated_key])
+        reactive_at = values.get(keys["cooldown"])
+        if reactive_at is None or reactive_at <= timezone.now():
+            reactive_at = timezone.now() - datetime.timedelta(minutes=1)
+        record = OTPValidation(
+            destination=destination,
+            otp=state["otp"],
+            prop=state["prop"],
+            created=state["created"],
+            is_validated=bool(counters.get(validated_key)),
+            validate_attempt=max(counters.get(attempts_key, 0), 0),
+            send_counter=values.get(keys["sent"], 0),
+            reactive_at=reactive_at,
+        )
+        record.nonce = nonce
+        return record
+
+    def is_validated(self, destination):
+        return bool(self.validated_destinations([destination]))
+
+    def validated_destinations(self, destinations):
+        states = self.cache.get_many(
+            [self.key("state", destination) for destination in destinations]
+        )
+        keys = {
+            self.otp_key("validated", self.get_nonce(state)): state["destination"]
+            for state in states.values()
+        }
+        return {keys[key] for key, value in self.cache.get_many(keys).items() if value}
+
+    def reset(self, destination, prop, otp, attempts, reactive_at, record=None):
+        keys = self.keys(destination)
+        previous = self.cache.get(keys["state"])
+        created = record.created if record is not None else timezone.now()
+        nonce = uuid.uuid4().hex
+        self.cache.set_many(
+            {
+                keys["state"]: {
+                    "destination": destination,
+                    "otp": otp,
+                    "prop": prop,
+                    "created": created,
+                    "nonce": nonce,
+                },
+                self.otp_key("attempts", nonce): attempts,
+            },
+            self.timeout,
+        )
+        if previous is not None:
+            # Verifications of the replaced OTP that are still running fail.
+            self.cache.delete(self.otp_key("attempts", self.get_nonce(previous)))
+        self.set_cooldown(destination, reactive_at)
+        record = OTPValidation(
+            destination=destination,
+            otp=otp,
+            prop=prop,
+            created=created,
+            is_validated=False,
+            validate_attempt=attempts,
+            send_counter=record.send_counter if record is not None else 0,
+            reactive_at=reactive_at,
+        )
+        record.nonce = nonce
+        return record
+
+    def set_cooldown(self, destination, reactive_at):
+        seconds = (reactive_at - timezone.now()).total_seconds()
+        if seconds > 0:
+            self.cache.set(self.key("cooldown", destination), reactive_at, seconds)
+        else:
+            self.cache.delete(self.key("cooldown", destination))
+
+    def consume_attempt(self, record):
+        """
+        Consumes one attempt of the OTP `record` was read with.
+
+        Returns the attempts left, or None if it had none, or was replaced or
+        expired.
+        """
+        nonce = getattr(record, "nonce", None)
+        if nonce is None:
+            return None
+        try:
+            attempts = self.cache.decr(self.otp_key("attempts", nonce))
+        except ValueError:
+            return None
+        return attempts if attempts >= 0 else None
+
+    def mark_validated(self, record):
+        if self.consume_attempt(record) is None:
+            return False
+        # `add` only sets a missing key, so one request validates the OTP.
+        if not self.cache.add(
+            self.otp_key("validated", record.nonce), True, self.timeout
+        ):
+            return False
+        record.is_validated = True
+        return True
+
+    def decrement_attempts(self, record):
+        attempts = self.consume_attempt(record)
+        if attempts is None or self.cache.get(self.otp_key("validated", record.nonce)):
+            return None
+        record.validate_attempt = attempts
+        return attempts
+
+    def set_reactive_at(self, record, reactive_at):
+        record.reactive_at = reactive_at
+        self.set_cooldown(record.destination, reactive_at)
+
+    def increment_send_counter(self, record):
+        key = self.key("sent", record.destination)
+        try:
+            record.send_counter = self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 0, self.timeout)
+            record.send_counter = self.cache.incr(key)
+
+    def iter_records(self):
+        # Only backends that can scan keys (e.g. django-redis) support this.
+        if not hasattr(self.cache, "iter_keys"):
+            raise NotImplementedError(
+                "The configured cache backend cannot enumerate OTP records."
+            )
+        for key in self.cache.iter_keys("%s:state:*" % self.prefix):
+            state = self.cache.get(key)
+            if state is not None:
+                record = self.get(state["destination"])
+                if record is not None:
+                    yield record
+
+    def import_record(self, record):
+        keys = self.keys(record.destination)
+        nonce = uuid.uuid4().hex
+        values = {
+            keys["state"]: {
+                "destination": record.destination,
+                "otp": record.otp,
+                "prop": record.prop,
+                "created": record.created or timezone.now(),
+                "nonce": nonce,
+            },
+            self.otp_key("attempts", nonce): record.validate_attempt,
+            keys["sent"]: record.send_counter,
+        }
+        if record.is_validated:
+            values[self.otp_key("validated", nonce)] = True
+        self.cache.set_many(values, self.timeout)
+        self.set_cooldown(record.destination, record.reactive_at)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store() -> BaseOTPStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store_class = import_string(drf_auth_settings.OTP.STORE)
+                _store = store_class()
+    return _store
+
+
+def reset_otp_store(*, setting, **kwargs):
+    """Drops the cached instance when `DRF_AUTH_SETTINGS` changes."""
+    global _store
+    if setting == "DRF_AUTH_SETTINGS":
+        _store = None
+
+
+setting_changed.connect(reset_otp_store)
@@ -0,0 +1,360 @@
+"""Bulk user import for provisioning large numbers of accounts"""
+import csv
+import json
+import os
+import threading
+from itertools import islice
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.auth import forget_unknown_user
+
+FORMATS = ("csv", "jsonl")
+IDENTITY_FIELDS = ("username", "email", "mobile")
+# Columns validated with the model field; empty values of NULL-able fields are
+# stored as NULL so they do not collide with the unique constraints.
+CLEAN_FIELDS = ("username", "name", "email", "mobile")
+
+
+def create_executor(processes: int):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Spawned rather than forked, as the caller may be a threaded server;
+    # workers only need Django set up to run `make_password`.
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    )
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_shared_executor():
+    """
+    Returns the pool of `VIEW_PROCESSES` workers shared by `users/import/`
+    requests, started on first use; `None` when `VIEW_PROCESSES` is `0`.
+    """
+    global _executor
+    if _executor is None and drf_auth_settings.PROVISIONING.VIEW_PROCESSES:
+        with _executor_lock:
+            if _executor is None:
+                _executor = create_executor(
+                    drf_auth_settings.PROVISIONING.VIEW_PROCESSES
+                )
+    return _executor
+
+
+def reset_shared_executor(*, setting, **kwargs):
+    """Shuts the shared pool down when `DRF_AUTH_SETTINGS` changes."""
+    global _executor
+    if setting == "DRF_AUTH_SETTINGS" and _executor is not None:
+        with _executor_lock:
+            executor, _executor = _executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+setting_changed.connect(reset_shared_executor)
+
+
+def read_rows(stream, fmt: str = "csv"):
+    """
+    Lazily reads user rows from a text stream.
+
+    Parameters
+    ----------
+    stream: file-like
+        Text stream of CSV (with a header row) or JSON lines.
+    fmt: str
+        "csv" or "jsonl".
+
+    Yields
+    ------
+    row: tuple
+        `(line, data, error)`, where `error` is set when the line is unreadable.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for data in reader:
+            yield reader.line_num, data, None
+    elif fmt == "jsonl":
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                data = json.loads(text)
+            except ValueError as e:
+                yield line, None, str(e)
+                continue
+            if not isinstance(data, dict):
+                yield line, None, _("Expected a JSON object.")
+                continue
+            yield line, data, None
+    else:
+        raise ValueError("Unknown import format: %s" % fmt)
+
+
+class UserImporter:
+    """
+    Creates users from rows in chunks of `chunk_size`.
+
+    Each chunk costs one query to find existing usernames, emails and mobiles
+    and one `bulk_create`. Passwords are hashed in a pool of `processes`
+    worker processes (`0` hashes in the calling process), started by `run` and
+    shut down when it ends, or in `executor` if given, which is left running.
+    `post_save` is not sent; registration messages are queued in bulk when
+    `send_messages` is set.
+
+    `run` is a generator of per-row errors, so neither the input nor the
+    report is ever held in memory. Counts are kept in `created` and `failed`.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = None,
+        processes: int = None,
+        send_messages: bool = None,
+        validate_passwords: bool = True,
+        executor=None,
+    ):
+        self.user_model = get_user_model()
+        self.chunk_size = chunk_size or drf_auth_settings.PROVISIONING.CHUNK_SIZE
+        if processes is None:
+            processes = drf_auth_settings.PROVISIONING.PROCESSES
+        self.processes = os.cpu_count() if processes is None else processes
+        if send_messages is None:
+            send_messages = drf_auth_settings.PROVISIONING.SEND_MESSAGES
+        self.send_messages = send_messages
+        self.validate_passwords = validate_passwords
+        self.executor = executor
+        self.owns_executor = executor is None
+        self.created = 0
+        self.failed = 0
+
+    def run(self, rows):
+        """
+        Imports `rows`, as yielded by `read_rows`.
+
+        Yields
+        ------
+        error: dict
+            `{"line": int, "errors": dict}` for each row that was not imported.
+        """
+        if self.owns_executor and self.processes:
+            self.executor = create_executor(self.processes)
+        try:
+            rows = iter(rows)
+            chunk = list(islice(rows, self.chunk_size))
+            while chunk:
+                yield from self.import_chunk(chunk)
+                chunk = list(islice(rows, self.chunk_size))
+        finally:
+            if self.owns_executor and self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def import_chunk(self, chunk: list):
+        candidates = []
+        for line, data, error in chunk:
+            errors = {"non_field_errors": [error]} if error else None
+            if errors is None:
+                values, errors = self.clean_row(data)
+            if errors:
+                yield self.fail(line, errors)
+            else:
+                candidates.append((line, values))
+
+        candidates, errors = self.exclude_conflicts(candidates)
+        yield from errors
+        if not candidates:
+            return
+
+        passwords = self.hash_passwords(
+            [values.pop("password") for line, values in candidates]
+        )
+        users = [
+            self.user_model(password=password, **values)
+            for (line, values), password in zip(candidates, passwords)
+        ]
+        created = []
+        try:
+            with transaction.atomic():
+                self.user_model.objects.bulk_create(users)
+            created = users
+        except IntegrityError:
+            # Another writer took one of the identities in the meantime; find
+            # out which rows are affected.
+            for (line, values), user in zip(candidates, users):
+                try:
+                    with transaction.atomic():
+                        self.user_model.objects.bulk_create([user])
+                    created.append(user)
+                except IntegrityError:
+                    yield self.fail(
+                        line,
+                        {
+                            "non_field_errors": [
+                                _("A user with these details already exists.")
+                            ]
+                        },
+                    )
+        self.created += len(created)
+        self.after_create(created)
+
+    def clean_row(self, data: dict):
+        """
+        Validates one row.
+
+        Returns
+        -------
+        values: dict
+            Model field values, plus the raw `password`.
+        errors: dict
+            Messages per field, empty if the row is valid.
+        """
+        values, errors = {}, {}
+        for name in CLEAN_FIELDS:
+            field = self.user_model._meta.get_field(name)
+            value = data.get(name)
+            if isinstance(value, str):
+                value = value.strip()
+            if value in (None, "") and field.null:
+                values[name] = None
+                continue
+            try:
+                values[name] = field.clean(value, None)
+            except DjangoValidationError as e:
+                errors[name] = e.messages
+
+        if values.get("username"):
+            values["username"] = self.user_model.normalize_username(values["username"])
+        if values.get("email"):
+            values["email"] = self.user_model.objects.normalize_email(values["email"])
+        values["is_active"] = self.get_is_active(data.get("is_active"))
+
+        password = data.get("password") or None
+        if password and self.validate_passwords and not errors:
+            try:
+                validate_password(password, self.user_model(**values))
+            except DjangoValidationError as e:
+                errors["password"] = e.messages
+        values["password"] = password
+        return values, errors
+
+    @staticmethod
+    def get_is_active(value) -> bool:
+        if value in (None, ""):
+            return True
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "y")
+        return bool(value)
+
+    def exclude_conflicts(self, candidates: list):
+        """Drops rows whose identities are taken, in the chunk or the database."""
+        lookups = {
+            name: {values[name] for line, values in candidates if values[name]}
+            for name in IDENTITY_FIELDS
+        }
+        query = Q()
+        for name, taken in lookups.items():
+            if taken:
+                query |= Q(**{"%s__in" % name: taken})
+        existing = {name: set() for name in IDENTITY_FIELDS}
+        if query:
+            for identities in self.user_model.objects.filter(query).values_list(
+                *IDENTITY_FIELDS
+            ):
+                for name, value in zip(IDENTITY_FIELDS, identities):
+                    existing[name].add(value)
+
+        accepted, errors = [], []
+        for line, values in candidates:
+            conflicts = {
+                name: [
+                    _("A user with that %(field)s already exists.")
+                    % {"field": self.user_model._meta.get_field(name).verbose_name}
+                ]
+                for name in IDENTITY_FIELDS
+                if values[name] and values[name] in existing[name]
+            }
+            if conflicts:
+                errors.append(self.fail(line, conflicts))
+                continue
+            for name in IDENTITY_FIELDS:
+                if values[name]:
+                    existing[name].add(values[name])
+            accepted.append((line, values))
+        return accepted, errors
+
+    def hash_passwords(self, passwords: list) -> list:
+        if self.executor is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.processes * 4))
+        return list(self.executor.map(make_password, passwords, chunksize=chunksize))
+
+    def after_create(self, users: list):
+        if not users:
+            return
+        identities = []
+        for user in users:
+            identities.extend(getattr(user, name) for name in IDENTITY_FIELDS)
+        forget_unknown_user(*identities)
+
+        if self.send_messages:
+            from drf_auth.delivery import queue_messages
+            from drf_auth.signals.handlers import get_registration_messages
+
+            messages = []
+            for user in users:
+                messages.extend(get_registration_messages(user))
+            if messages:
+                queue_messages(messages)
+
+    def fail(self, line: int, errors: dict) -> dict:
+        self.failed += 1
+        return {
+            "line": line,
+            "errors": {
+                name: [str(message) for message in messages]
+                for name, messages in errors.items()
+            },
+        }
+
+
+def import_users(stream, fmt: str = "csv", report=None, **kwargs) -> dict:
+    """
+    Imports users from `stream`, writing per-row errors to `report`.
+
+    Parameters
+    ----------
+    stream: file-like
+        Text stream read with `read_rows`.
+    fmt: str
+        "csv" or "jsonl".
+    report: file-like
+        Text stream receiving one JSON object per rejected row, if given.
+    kwargs:
+        Passed to `UserImporter`.
+
+    Returns
+    -------
+    result: dict
+        Number of users `created` and rows `failed`.
+    """
+    importer = UserImporter(**kwargs)
+    for error in importer.run(read_rows(stream, fmt)):
+        if report is not None:
+            report.write(json.dumps(error) + "\n")
+    return {"created": importer.created, "failed": importer.failed}
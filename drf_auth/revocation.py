@@ -0,0 +1,115 @@
+"""Revocation index for refresh token rotation and logging out everywhere"""
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from drf_auth.app_settings import drf_auth_settings
+from rest_framework_simplejwt.settings import api_settings
+
+# Claim shared by every refresh token rotated from the same login.
+FAMILY_CLAIM = "fam"
+
+
+class RevocationIndex:
+    """
+    Keeps revoked token IDs, token families and per-user cutoffs in a cache.
+
+    Only revocations are stored, never issued tokens, and every entry expires
+    when the tokens it covers would have expired anyway. Checking a token is a
+    single `get_many`.
+
+    Access tokens are only checked by `token/verify/`, not when they
+    authenticate a request, so revoking a user's tokens takes effect for
+    their access tokens once these expire (`ACCESS_TOKEN_LIFETIME`).
+    """
+
+    prefix = "drf_auth:revoked"
+
+    def __init__(self):
+        self.cache = caches[drf_auth_settings.REVOCATION.CACHE_ALIAS]
+
+    def key(self, kind: str, value) -> str:
+        return "%s:%s:%s" % (self.prefix, kind, value)
+
+    def revoke(self, payload: dict) -> bool:
+        """
+        Revokes the single token described by `payload`.
+
+        Returns False if it was already revoked. The entry is added atomically,
+        so of concurrent requests revoking the same token only one succeeds.
+        """
+        return self.cache.add(
+            self.key("jti", payload[api_settings.JTI_CLAIM]),
+            True,
+            self.get_timeout(payload),
+        )
+
+    def revoke_family(self, payload: dict):
+        """Revokes every token rotated from the same login as `payload`."""
+        if payload.get(FAMILY_CLAIM):
+            self.cache.set(
+                self.key("family", payload[FAMILY_CLAIM]),
+                True,
+                int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()),
+            )
+
+    def revoke_user(self, user_id):
+        """Revokes every token issued to `user_id` so far."""
+        self.cache.set(
+            self.key("user", str(user_id)),
+            int(time.time()),
+            int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()),
+        )
+
+    def check(self, payload: dict):
+        """
+        Returns why the token described by `payload` is revoked, or None.
+
+        Returns
+        -------
+        reason: str
+            "jti", "family" or "user".
+        """
+        keys = {"jti": self.key("jti", payload.get(api_settings.JTI_CLAIM))}
+        if payload.get(FAMILY_CLAIM):
+            keys["family"] = self.key("family", payload[FAMILY_CLAIM])
+        if payload.get(api_settings.USER_ID_CLAIM) is not None:
+            keys["user"] = self.key("user", payload[api_settings.USER_ID_CLAIM])
+
+        values = self.cache.get_many(keys.values())
+        if values.get(keys["jti"]):
+            return "jti"
+        if "family" in keys and values.get(keys["family"]):
+            return "family"
+        cutoff = values.get(keys.get("user"))
+        if cutoff is not None and payload.get("iat", 0) < cutoff:
+            return "user"
+        return None
+
+    @staticmethod
+    def get_timeout(payload: dict) -> int:
+        return max(int(payload.get("exp", 0) - time.time()), 1)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_revocation_index() -> RevocationIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = RevocationIndex()
+    return _index
+
+
+def reset_revocation_index(*, setting, **kwargs):
+    """Drops the cached instance when `DRF_AUTH_SETTINGS` changes."""
+    global _index
+    if setting == "DRF_AUTH_SETTINGS":
+        _index = None
+
+
+setting_changed.connect(reset_revocation_index)
@@ -0,0 +1,209 @@
+"""Routing of drf_auth's reads to database replicas and of OTP state to shards"""
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import router
+from django.utils.deprecation import MiddlewareMixin
+from drf_auth.app_settings import drf_auth_settings
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+# Reads go to the primary until this time.time(), after a write.
+_primary_until = ContextVar("drf_auth_primary_until", default=0.0)
+
+
+def is_routed(model) -> bool:
+    """Whether `model` is stored by drf_auth, and so follows `ROUTING`."""
+    return model._meta.app_label == "drf_auth"
+
+
+def pin_primary():
+    """Sends reads to the primary for the next `STICKY_SECONDS`."""
+    _primary_until.set(time.time() + drf_auth_settings.ROUTING.STICKY_SECONDS)
+
+
+def is_pinned() -> bool:
+    return _primary_until.get() > time.time()
+
+
+@contextmanager
+def unpinned():
+    """
+    Writes made in this block do not pin reads to the primary.
+
+    For bookkeeping writes whose values are not read back by the client, such
+    as `last_login`, which would otherwise keep every client that logged in
+    off the replicas.
+    """
+    until = _primary_until.get()
+    try:
+        yield
+    finally:
+        _primary_until.set(until)
+
+
+def get_read_db(operation: str) -> str:
+    """
+    Returns the database alias `operation` reads from.
+
+    That is a random one of `ROUTING["REPLICAS"]` when `POLICY[operation]` is
+    "replica", no write was made recently in this context (see
+    `ReadYourWritesMiddleware`) and `DRFAuthRouter` is installed, so that
+    users read from a replica are saved to the primary. Otherwise, it is the
+    primary.
+    """
+    routing = drf_auth_settings.ROUTING
+    if (
+        routing.REPLICAS
+        and routing.POLICY[operation] == REPLICA
+        and not is_pinned()
+        and any(isinstance(item, DRFAuthRouter) for item in router.routers)
+    ):
+        return random.choice(routing.REPLICAS)
+    return routing.PRIMARY
+
+
+def get_write_db() -> str:
+    return drf_auth_settings.ROUTING.PRIMARY
+
+
+def read_get(queryset, operation: str, **lookups):
+    """
+    `queryset.get(**lookups)`, from the database of `operation`.
+
+    A replica may lag behind the primary, so an object missing from it is
+    looked up again on the primary before `DoesNotExist` is raised.
+    """
+    alias = get_read_db(operation)
+    try:
+        return queryset.using(alias).get(**lookups)
+    except queryset.model.DoesNotExist:
+        if alias == get_write_db():
+            raise
+    return queryset.using(get_write_db()).get(**lookups)
+
+
+async def aread_get(queryset, operation: str, **lookups):
+    """Async `read_get`."""
+    alias = get_read_db(operation)
+    try:
+        return await queryset.using(alias).aget(**lookups)
+    except queryset.model.DoesNotExist:
+        if alias == get_write_db():
+            raise
+    return await queryset.using(get_write_db()).aget(**lookups)
+
+
+def get_otp_shards() -> list:
+    """The database aliases OTP state is partitioned across; empty if none."""
+    return drf_auth_settings.ROUTING.OTP_SHARDS or []
+
+
+def get_otp_shard(destination: str, shards: list = None):
+    """
+    Returns the one of `shards` (default: `ROUTING["OTP_SHARDS"]`) storing the
+    OTP state of `destination`, or None when OTP state is not sharded.
+
+    The shard is picked by jump consistent hashing of the destination, so
+    every process agrees on it, and appending a shard to the list (or removing
+    the last one) only moves the records of about one shard in n; moving them
+    is up to `rebalance_otp_shards`.
+    """
+    if shards is None:
+        shards = get_otp_shards()
+    if not shards:
+        return None
+    key = int.from_bytes(hashlib.sha256(destination.encode()).digest()[:8], "big")
+    bucket, index = -1, 0
+    while index < len(shards):
+        bucket = index
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        index = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return shards[bucket]
+
+
+class DRFAuthRouter:
+    """
+    Database router for drf_auth's models, for `ROUTING["REPLICAS"]` and
+    `ROUTING["OTP_SHARDS"]`.
+
+    Reads default to the primary; the lookups allowed to use a replica ask
+    `get_read_db` for their alias. Writes always go to the primary, including
+    saves of instances read from a replica, and pin later reads to it. OTP
+    shards get the OTP table only when migrated. Add it to
+    `DATABASE_ROUTERS`::
+
+        DATABASE_ROUTERS = ["drf_auth.routers.DRFAuthRouter"]
+    """
+
+    def db_for_read(self, model, **hints):
+        if is_routed(model) and drf_auth_settings.ROUTING.REPLICAS:
+            return get_write_db()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if is_routed(model) and drf_auth_settings.ROUTING.REPLICAS:
+            pin_primary()
+            return get_write_db()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        routing = drf_auth_settings.ROUTING
+        aliases = {routing.PRIMARY, *(routing.REPLICAS or ())}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label != "drf_auth":
+            return None
+        routing = drf_auth_settings.ROUTING
+        # Replicas get the schema from the primary.
+        if db in (routing.REPLICAS or ()):
+            return False
+        # OTP shards other than the primary only store OTP state.
+        if db != routing.PRIMARY and db in (routing.OTP_SHARDS or ()):
+            return model_name == "otpvalidation"
+        return None
+
+
+class ReadYourWritesMiddleware(MiddlewareMixin):
+    """
+    Keeps a client's reads on the primary for a while after its writes.
+
+    A request that writes through `DRFAuthRouter` (registering, validating an
+    OTP...) sets the `STICKY_COOKIE` cookie, and requests carrying it read
+    from the primary until it expires, `STICKY_SECONDS` later. Writes made
+    `unpinned()`, such as `last_login` on login, do not.
+    """
+
+    def process_request(self, request):
+        routing = drf_auth_settings.ROUTING
+        now = time.time()
+        try:
+            until = float(request.COOKIES.get(routing.STICKY_COOKIE, 0))
+        except ValueError:
+            until = 0.0
+        # Capped, so a client cannot pin itself to the primary for longer.
+        if not now < until <= now + routing.STICKY_SECONDS:
+            until = 0.0
+        # Also drops a pin left in this thread by a previous request.
+        _primary_until.set(until)
+        request._drf_auth_primary_until = until
+
+    def process_response(self, request, response):
+        until = _primary_until.get()
+        if until > getattr(request, "_drf_auth_primary_until", until):
+            routing = drf_auth_settings.ROUTING
+            response.set_cookie(
+                routing.STICKY_COOKIE,
+                "%.3f" % until,
+                max_age=routing.STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
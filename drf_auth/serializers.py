@@ -1,35 +1,141 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.validators import EmailValidator, ValidationError
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
+from drf_auth.images import get_thumbnail_names, get_thumbnail_sizes, validate_image
 from drf_auth.models import OTPValidation
-from drf_auth.utils import check_validation
+from drf_auth.otp_store import get_otp_store
+from drf_auth.revocation import get_revocation_index
+from drf_auth.routers import get_read_db, read_get
+from drf_auth.tokens import get_token_factory
 from rest_framework import serializers
 from rest_framework.exceptions import NotFound
 from rest_framework.serializers import ModelSerializer
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+    TokenVerifySerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
 
 User = get_user_model()
 
+IDENTITY_FIELDS = ("username", "email", "mobile")
+
 
 class UserSerializer(ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
 
-    def validate_email(self, email):
-        if check_validation(value=email):
-            return email
-        else:
-            raise ValidationError(_("The email must be pre-validated via OTP."))
+    default_error_messages = {
+        "username_exists": _("A user with that username already exists."),
+        "email_exists": _("A user with that email already exists."),
+        "mobile_exists": _("A user with that mobile number already exists."),
+        "email_not_validated": _("The email must be pre-validated via OTP."),
+        "mobile_not_validated": _("The mobile number must be pre-validated via OTP."),
+    }
 
-    def validate_mobile(self, mobile):
-        if check_validation(value=mobile):
-            return mobile
-        else:
-            raise ValidationError(_("The mobile number must be pre-validated via OTP."))
+    def get_fields(self):
+        # Uniqueness is checked for all identity fields at once in validate()
+        # instead of one query per field.
+        fields = super().get_fields()
+        for name in IDENTITY_FIELDS:
+            fields[name].validators = [
+                validator
+                for validator in fields[name].validators
+                if not isinstance(validator, UniqueValidator)
+            ]
+        return fields
+
+    def find_conflicts(self, attrs: dict, using: str = None) -> dict:
+        """
+        Returns errors for identity fields already used by another user.
+
+        Looks them up in the `using` database, by default the one of the
+        `CONFLICT_CHECKS` routing policy.
+        """
+        lookups = {field: attrs[field] for field in IDENTITY_FIELDS if attrs.get(field)}
+        if not lookups:
+            return {}
+
+        query = Q()
+        for field, value in lookups.items():
+            query |= Q(**{field: value})
+        queryset = User.objects.using(using or get_read_db("CONFLICT_CHECKS"))
+        queryset = queryset.filter(query)
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+
+        errors = {}
+        for row in queryset.values(*lookups)[: len(lookups)]:
+            for field, value in lookups.items():
+                if row[field] == value:
+                    errors[field] = [self.error_messages[field + "_exists"]]
+        return errors
+
+    def validate(self, attrs):
+        errors = self.find_conflicts(attrs)
+
+        # Only new values need an OTP: the validated OTPs of the current ones
+        # may have been purged or expired.
+        destinations = {
+            field: attrs[field]
+            for field in ("email", "mobile")
+            if attrs.get(field)
+            and field not in errors
+            and not (
+                self.instance is not None
+                and attrs[field] == getattr(self.instance, field)
+            )
+        }
+        if destinations:
+            validated = get_otp_store().validated_destinations(destinations.values())
+            for field, value in destinations.items():
+                if value not in validated:
+                    errors[field] = [self.error_messages[field + "_not_validated"]]
+
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
 
     def validate_password(self, password):
         validate_password(password)
         return password
 
+    def validate_image(self, image):
+        if not image:
+            return image
+        return validate_image(image)
+
+    def get_thumbnails(self, obj) -> dict:
+        """
+        URLs of the thumbnails of `image`, by size.
+
+        Thumbnails are generated in the background after an upload, so they
+        may briefly be missing.
+        """
+        # RegisterView renders its validated data rather than a saved user.
+        image = getattr(obj, "image", None)
+        if not image:
+            return {}
+        request = self.context.get("request")
+        thumbnails = {}
+        for size in get_thumbnail_sizes():
+            urls = {
+                variant: image.storage.url(name)
+                for variant, name in get_thumbnail_names(image.name, size).items()
+            }
+            if request is not None:
+                urls = {
+                    variant: request.build_absolute_uri(url)
+                    for variant, url in urls.items()
+                }
+            thumbnails[str(size)] = urls
+        return thumbnails
+
     class Meta:
         model = User
         fields = (
@@ -39,7 +145,8 @@ class UserSerializer(ModelSerializer):
             "email",
             "mobile",
             "image",
-            "password"
+            "thumbnails",
+            "password",
         )
         extra_kwargs = {"password": {"write_only": True}}
 
@@ -51,19 +158,42 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
     @classmethod
     def get_token(cls, user):
-        token = super().get_token(user)
-
-        # Add custom claims
-        if hasattr(user, "email"):
-            token["email"] = user.email
-
-        if hasattr(user, "mobile"):
-            token["mobile"] = user.mobile
-
-        if hasattr(user, "name"):
-            token["name"] = user.name
-
-        return token
+        return get_token_factory().get_token(user)
+
+    def validate(self, attrs):
+        # Authenticate through TokenObtainSerializer, then issue both tokens
+        # with the shared factory instead of encoding them separately.
+        data = super(TokenObtainPairSerializer, self).validate(attrs)
+        data.update(get_token_factory().for_user(self.user))
+        return data
+
+
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        index = get_revocation_index()
+        reason = index.check(refresh.payload)
+        # The token is revoked before it is rotated, so of concurrent requests
+        # with the same token only one gets new tokens.
+        if reason is None and api_settings.ROTATE_REFRESH_TOKENS:
+            if not index.revoke(refresh.payload):
+                reason = "jti"
+        if reason is not None:
+            if reason == "jti":
+                # An already rotated token was replayed, so it may have been
+                # stolen: revoke everything rotated from the same login.
+                index.revoke_family(refresh.payload)
+            raise InvalidToken(_("Token is revoked"))
+
+        return super().validate(attrs)
+
+
+class RevocationAwareTokenVerifySerializer(TokenVerifySerializer):
+    def validate(self, attrs):
+        token = UntypedToken(attrs["token"])
+        if get_revocation_index().check(token.payload) is not None:
+            raise InvalidToken(_("Token is revoked"))
+        return super().validate(attrs)
 
 
 class JWTSerializer(serializers.Serializer):
@@ -85,12 +215,12 @@ class OTPSerializer(serializers.Serializer):
     def get_user(self, prop, destination):
         if prop == OTPValidation.MOBILE:
             try:
-                user = User.objects.get(mobile=destination)
+                user = read_get(User.objects, "OTP_USER", mobile=destination)
             except User.DoesNotExist:
                 user = None
         else:
             try:
-                user = User.objects.get(email=destination)
+                user = read_get(User.objects, "OTP_USER", email=destination)
             except User.DoesNotExist:
                 user = None
 
@@ -1,9 +1,37 @@
 """Config for django signals"""
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from drf_auth.app_settings import DRF_AUTH_SETTINGS
-from drf_auth.utils import send_message
+from drf_auth.app_settings import drf_auth_settings
+
+# This module is imported when the app loads; the receivers import the
+# delivery, auth and authentication modules (and with them simplejwt) on first
+# use, so commands and workers that never save a user do not pay for them.
+
+
+def get_registration_messages(user: get_user_model()) -> list:
+    """Returns the `queue_message` arguments of the messages sent to a new user"""
+
+    registration = drf_auth_settings.REGISTRATION
+    messages = []
+    if registration.SEND_MAIL and user.email:
+        messages.append(
+            {
+                "message": registration.TEXT_MAIL_BODY,
+                "subject": registration.MAIL_SUBJECT,
+                "recip": user.email,
+                "html_message": registration.HTML_MAIL_BODY,
+            }
+        )
+    if registration.SEND_MESSAGE and user.mobile:
+        messages.append(
+            {
+                "message": registration.SMS_BODY,
+                "subject": registration.MAIL_SUBJECT,
+                "recip": user.mobile,
+            }
+        )
+    return messages
 
 
 @receiver(post_save, sender=get_user_model())
@@ -20,16 +48,30 @@ def post_register(sender, instance: get_user_model(), created, **kwargs):
     """
 
     if created:
-        if DRF_AUTH_SETTINGS["REGISTRATION"]["SEND_MAIL"] and instance.email:
-            send_message(
-                message=DRF_AUTH_SETTINGS["REGISTRATION"]["TEXT_MAIL_BODY"],
-                subject=DRF_AUTH_SETTINGS["REGISTRATION"]["MAIL_SUBJECT"],
-                recip=instance.email,
-                html_message=DRF_AUTH_SETTINGS["REGISTRATION"]["HTML_MAIL_BODY"],
-            )
-        if DRF_AUTH_SETTINGS["REGISTRATION"]["SEND_MESSAGE"] and instance.mobile:
-            send_message(
-                message=DRF_AUTH_SETTINGS["REGISTRATION"]["SMS_BODY"],
-                subject=DRF_AUTH_SETTINGS["REGISTRATION"]["MAIL_SUBJECT"],
-                recip=instance.mobile,
-            )
+        messages = get_registration_messages(instance)
+        if messages:
+            from drf_auth.delivery import queue_message
+
+            for message in messages:
+                queue_message(**message)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_negative_lookups(sender, instance: get_user_model(), **kwargs):
+    """Lets a new or renamed user log in before the negative cache expires"""
+    from drf_auth.auth import forget_unknown_user
+
+    forget_unknown_user(
+        instance.get_username(),
+        getattr(instance, "email", None),
+        getattr(instance, "mobile", None),
+    )
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_cache(sender, instance: get_user_model(), **kwargs):
+    """Drops the user from the token authentication user cache"""
+    from drf_auth.authentication import user_cache
+
+    user_cache.delete(instance.pk)
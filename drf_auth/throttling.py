@@ -0,0 +1,194 @@
+"""Rate limiting and lockout for login and OTP requests"""
+import hashlib
+import time
+
+from django.core.cache import caches
+from drf_auth.app_settings import drf_auth_settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: str):
+    """Parses a DRF style rate such as "5/min" into (requests, seconds)."""
+    num, period = rate.split("/")
+    return int(num), PERIODS[period[0]]
+
+
+def get_field(request, name: str):
+    if hasattr(request.data, "get"):
+        return request.data.get(name)
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding window rate limiter with progressive lockout, stored in a cache.
+
+    The request count is estimated from two fixed windows, weighting the
+    previous one by how much of it still overlaps the sliding window. A key
+    that exceeds its limit is locked out for `LOCKOUT_BASE` seconds, doubling
+    on every new lockout within `LOCKOUT_RESET` seconds, up to `LOCKOUT_MAX`.
+    """
+
+    prefix = "drf_auth:throttle"
+
+    def __init__(self):
+        self.cache = caches[drf_auth_settings.THROTTLE.CACHE_ALIAS]
+        self.lockout_base = drf_auth_settings.THROTTLE.LOCKOUT_BASE
+        self.lockout_max = drf_auth_settings.THROTTLE.LOCKOUT_MAX
+        self.lockout_reset = drf_auth_settings.THROTTLE.LOCKOUT_RESET
+
+    def check(self, key: str, limit: int, period: int):
+        """
+        Checks whether `key` may make a request, without counting it.
+
+        A key over its limit is locked out.
+
+        Returns
+        -------
+        result: tuple
+            Whether the request is allowed, and seconds to wait if it is not.
+        """
+        now = time.time()
+        locked_until = self.cache.get("%s:lock:%s" % (self.prefix, key))
+        if locked_until is not None and locked_until > now:
+            return False, locked_until - now
+
+        window = int(now // period)
+        current_key = "%s:%s:%d" % (self.prefix, key, window)
+        previous_key = "%s:%s:%d" % (self.prefix, key, window - 1)
+        counts = self.cache.get_many([current_key, previous_key])
+        overlap = 1 - (now % period) / period
+        count = counts.get(previous_key, 0) * overlap + counts.get(current_key, 0)
+
+        if count >= limit:
+            return False, self.lock(key, now)
+        return True, None
+
+    def count(self, key: str, period: int):
+        """Counts a request for `key`."""
+        current_key = "%s:%s:%d" % (self.prefix, key, int(time.time() // period))
+        if not self.cache.add(current_key, 1, period * 2):
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                self.cache.set(current_key, 1, period * 2)
+
+    def hit(self, key: str, limit: int, period: int):
+        """Checks a request for `key`, and counts it if it is allowed."""
+        allowed, wait = self.check(key, limit, period)
+        if allowed:
+            self.count(key, period)
+        return allowed, wait
+
+    def lock(self, key: str, now: float) -> float:
+        level_key = "%s:level:%s" % (self.prefix, key)
+        if self.cache.add(level_key, 1, self.lockout_reset):
+            level = 1
+        else:
+            try:
+                level = self.cache.incr(level_key)
+            except ValueError:
+                level = 1
+        duration = min(self.lockout_base * 2 ** (level - 1), self.lockout_max)
+        self.cache.set("%s:lock:%s" % (self.prefix, key), now + duration, duration)
+        return duration
+
+
+class DRFAuthRateThrottle(BaseThrottle):
+    """
+    Applies the `THROTTLE[scope]` policy, a mapping of key kind to rate.
+
+    Subclasses define the scope and which identities of a request (IP,
+    identifier, destination...) are limited.
+    """
+
+    scope = None
+    # Key kinds that only count failed authentications, recorded with
+    # `record_failure`, so that nobody can lock an account out by sending
+    # requests for it; the others count every request.
+    failure_kinds = ()
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_identities(self, request, view) -> dict:
+        """Returns a mapping of key kind to the request's identity for it."""
+        return {"IP": self.get_ident(request)}
+
+    def get_keys(self, request, view):
+        """Yields `(kind, key, limit, period)` for the limited identities."""
+        policy = drf_auth_settings.THROTTLE.get(self.scope, {})
+        for kind, identity in self.get_identities(request, view).items():
+            rate = policy.get(kind)
+            if not rate or not identity:
+                continue
+            limit, period = parse_rate(rate)
+            digest = hashlib.sha256(str(identity).encode()).hexdigest()
+            yield kind, "%s:%s:%s" % (self.scope, kind, digest), limit, period
+
+    def allow_request(self, request, view):
+        if not drf_auth_settings.THROTTLE.ENABLED:
+            return True
+
+        limiter = SlidingWindowLimiter()
+        for kind, key, limit, period in self.get_keys(request, view):
+            if kind in self.failure_kinds:
+                allowed, self.wait_time = limiter.check(key, limit, period)
+            else:
+                allowed, self.wait_time = limiter.hit(key, limit, period)
+            if not allowed:
+                return False
+        return True
+
+    def record_failure(self, request, view):
+        """Counts a failed authentication for the `failure_kinds` keys."""
+        if not drf_auth_settings.THROTTLE.ENABLED:
+            return
+
+        limiter = SlidingWindowLimiter()
+        for kind, key, limit, period in self.get_keys(request, view):
+            if kind in self.failure_kinds:
+                limiter.count(key, period)
+
+    def wait(self):
+        return self.wait_time
+
+
+class LoginRateThrottle(DRFAuthRateThrottle):
+    scope = "LOGIN"
+    failure_kinds = ("IDENTIFIER",)
+
+    def get_identities(self, request, view):
+        identities = super().get_identities(request, view)
+        identities["IDENTIFIER"] = get_field(request, "username")
+        return identities
+
+
+class OTPRateThrottle(DRFAuthRateThrottle):
+    scope = "OTP"
+    failure_kinds = ("DESTINATION",)
+
+    def get_identities(self, request, view):
+        identities = super().get_identities(request, view)
+        identities["DESTINATION"] = get_field(request, "destination")
+        return identities
+
+
+def record_failure(view, request, exc):
+    """Counts `exc`, if a failed authentication, with the view's throttles."""
+    if not isinstance(exc, AuthenticationFailed):
+        return
+    for throttle_class in view.throttle_classes:
+        throttle = throttle_class()
+        if isinstance(throttle, DRFAuthRateThrottle):
+            throttle.record_failure(request, view)
+
+
+class FailureThrottlingMixin:
+    """Counts the failed authentications of a view with its throttles."""
+
+    def handle_exception(self, exc):
+        record_failure(self, self.request, exc)
+        return super().handle_exception(exc)
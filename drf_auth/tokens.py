@@ -0,0 +1,148 @@
+"""JWT issuance shared by the login views"""
+import threading
+import uuid
+
+import jwt
+from django.core.signals import setting_changed
+from drf_auth.metrics import timed
+from drf_auth.revocation import FAMILY_CLAIM
+from jwt.algorithms import get_default_algorithms
+from rest_framework_simplejwt import settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class TokenFactory:
+    """
+    Issues refresh/access token pairs carrying the drf_auth user claims.
+
+    The signing key is parsed once, so asymmetric algorithms (RS256, ES256,
+    EdDSA...) do not re-load the PEM key for every token. simplejwt replaces
+    its `api_settings` when `SIMPLE_JWT` changes, so they are always read from
+    its settings module.
+    """
+
+    claims = ("email", "mobile", "name")
+
+    def __init__(self, algorithm: str = None, signing_key=None):
+        self.algorithm = algorithm or jwt_settings.api_settings.ALGORITHM
+        if signing_key is None:
+            signing_key = jwt_settings.api_settings.SIGNING_KEY
+        self.signing_key = get_default_algorithms()[self.algorithm].prepare_key(
+            signing_key
+        )
+
+    def get_claims(self, user) -> dict:
+        return {
+            claim: getattr(user, claim) for claim in self.claims if hasattr(user, claim)
+        }
+
+    @staticmethod
+    def get_user_claims(user) -> dict:
+        """Returns the claims `RefreshToken.for_user` adds for `user`."""
+        claims = {
+            jwt_settings.api_settings.USER_ID_CLAIM: str(
+                getattr(user, jwt_settings.api_settings.USER_ID_FIELD)
+            )
+        }
+        if getattr(jwt_settings.api_settings, "CHECK_REVOKE_TOKEN", False):
+            from rest_framework_simplejwt.utils import get_md5_hash_password
+
+            claims[jwt_settings.api_settings.REVOKE_TOKEN_CLAIM] = (
+                get_md5_hash_password(user.password)
+            )
+        return claims
+
+    def get_token(self, user) -> RefreshToken:
+        token = RefreshToken.for_user(user)
+        token[FAMILY_CLAIM] = uuid.uuid4().hex
+        for claim, value in self.get_claims(user).items():
+            token[claim] = value
+        return token
+
+    def encode(self, payload: dict) -> str:
+        payload = payload.copy()
+        if jwt_settings.api_settings.AUDIENCE is not None:
+            payload["aud"] = jwt_settings.api_settings.AUDIENCE
+        if jwt_settings.api_settings.ISSUER is not None:
+            payload["iss"] = jwt_settings.api_settings.ISSUER
+        token = jwt.encode(
+            payload,
+            self.signing_key,
+            algorithm=self.algorithm,
+            json_encoder=getattr(jwt_settings.api_settings, "JSON_ENCODER", None),
+        )
+        if isinstance(token, bytes):
+            return token.decode("utf-8")
+        return token
+
+    @timed("issue_token")
+    def for_user(self, user) -> dict:
+        """
+        Issues a token pair for `user`.
+
+        Returns
+        -------
+        tokens: dict
+            Encoded `refresh` and `access` tokens.
+        """
+        refresh = self.get_token(user)
+        return {
+            "refresh": self.encode(refresh.payload),
+            "access": self.encode(refresh.access_token.payload),
+        }
+
+    @timed("issue_tokens")
+    def for_users(self, users) -> list:
+        """
+        Issues token pairs for many users, e.g. service accounts.
+
+        The pairs share their issue and expiry times, so the token classes are
+        only built once and each pair is a copy of their payloads with the
+        user's claims and its own `jti` and family.
+
+        Returns
+        -------
+        tokens: list
+            Dicts of encoded `refresh` and `access` tokens, in the order of
+            `users`.
+        """
+        template = RefreshToken()
+        refresh_payload = template.payload
+        access_payload = template.access_token.payload
+
+        tokens = []
+        for user in users:
+            claims = self.get_user_claims(user)
+            claims.update(self.get_claims(user))
+            claims[FAMILY_CLAIM] = uuid.uuid4().hex
+            refresh = dict(refresh_payload, **claims)
+            refresh[jwt_settings.api_settings.JTI_CLAIM] = uuid.uuid4().hex
+            access = dict(access_payload, **claims)
+            access[jwt_settings.api_settings.JTI_CLAIM] = uuid.uuid4().hex
+            tokens.append(
+                {"refresh": self.encode(refresh), "access": self.encode(access)}
+            )
+        return tokens
+
+
+_factory = None
+_factory_lock = threading.Lock()
+
+
+def get_token_factory() -> TokenFactory:
+    global _factory
+    if _factory is None:
+        with _factory_lock:
+            if _factory is None:
+                _factory = TokenFactory()
+    return _factory
+
+
+def reset_token_factory(*, setting, **kwargs):
+    """Drops the cached instance when `SIMPLE_JWT` changes."""
+    global _factory
+    if setting == "SIMPLE_JWT":
+        _factory = None
+
+
+setting_changed.connect(reset_token_factory)
@@ -1,6 +1,5 @@
 from django.urls import path
 from drf_auth import views
-from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
 
 app_name = "drf_auth"
 
@@ -16,6 +15,22 @@ urlpatterns = [
 ]
 
 urlpatterns += [
-    path("token/verify/", TokenVerifyView.as_view(), name="token_verify"),
-    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path(
+        "token/verify/",
+        views.RevocationAwareTokenVerifyView.as_view(),
+        name="token_verify",
+    ),
+    path(
+        "token/refresh/",
+        views.RotatingTokenRefreshView.as_view(),
+        name="token_refresh",
+    ),
+    path(
+        "logout-everywhere/",
+        views.LogoutEverywhereView.as_view(),
+        name="logout_everywhere",
+    ),
+    path("users/import/", views.ImportUsersView.as_view(), name="import_users"),
+    path("users/export/", views.ExportUsersView.as_view(), name="export_users"),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
 ]
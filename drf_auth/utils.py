@@ -1,12 +1,15 @@
 import datetime
+import time
 
-import pytz
-from django.contrib.auth import get_user_model
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 from django.utils import timezone
+from django.utils.crypto import get_random_string
 from django.utils.translation import gettext_lazy as _
-from drf_auth.app_settings import DRF_AUTH_SETTINGS
-from drf_auth.models import OTPValidation
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.metrics import timed
+from drf_auth.otp_store import get_otp_store
 from rest_framework.exceptions import (
     APIException,
     AuthenticationFailed,
@@ -14,155 +17,270 @@ from rest_framework.exceptions import (
     PermissionDenied,
 )
 
-otp_settings = DRF_AUTH_SETTINGS.get("OTP", {})
-
-User = get_user_model()
+NO_PENDING_OTP = _(
+    "No pending OTP validation request found for provided "
+    "destination. Kindly send an OTP first"
+)
 
 
 def check_validation(value):
-    try:
-        otp_object = OTPValidation.objects.get(destination=value)
-        return otp_object.is_validated
-    except OTPValidation.DoesNotExist:
-        return False
+    return get_otp_store().is_validated(value)
 
 
+@timed("validate_otp")
 def validate_otp(value, otp):
-    try:
-        otp_object = OTPValidation.objects.get(destination=value, is_validated=False)
+    """
+    Validates `otp` for the destination `value`.
+
+    The store checks and consumes attempts atomically, so concurrent requests
+    validate an OTP at most once and each wrong one consumes its own attempt.
+    """
+    store = get_otp_store()
+    otp_object = store.get(value)
 
-        otp_object.validate_attempt -= 1
+    if otp_object is None or otp_object.is_validated:
+        raise NotFound(detail=NO_PENDING_OTP)
 
-        if str(otp_object.otp) == str(otp):
-            otp_object.is_validated = True
-            otp_object.save()
+    if str(otp_object.otp) == str(otp):
+        if store.mark_validated(otp_object):
             return True
+        # Validated, replaced or out of attempts since it was read.
+        raise NotFound(detail=NO_PENDING_OTP)
 
-        elif otp_object.validate_attempt <= 0:
-            generate_otp(otp_object.prop, value)
-            raise AuthenticationFailed(
-                detail=_("Incorrect OTP. Attempt exceeded! OTP has been " "reset.")
-            )
+    attempts = store.decrement_attempts(otp_object)
+    if attempts is None:
+        raise NotFound(detail=NO_PENDING_OTP)
 
-        else:
-            otp_object.save()
-            raise AuthenticationFailed(
-                detail=_(
-                    "OTP Validation failed! "
-                    + str(otp_object.validate_attempt)
-                    + " attempts left!"
-                )
-            )
+    elif attempts <= 0:
+        generate_otp(otp_object.prop, value)
+        raise AuthenticationFailed(
+            detail=_("Incorrect OTP. Attempt exceeded! OTP has been " "reset.")
+        )
 
-    except OTPValidation.DoesNotExist:
-        raise NotFound(
-            detail=_(
-                "No pending OTP validation request found for provided "
-                "destination. Kindly send an OTP first"
-            )
+    else:
+        raise AuthenticationFailed(
+            detail=_("OTP Validation failed! " + str(attempts) + " attempts left!")
         )
 
 
-def generate_otp(prop, value):
-    random_number = User.objects.make_random_password(
-        length=otp_settings.get("LENGTH", 6),
-        allowed_chars=otp_settings.get("ALLOWED_CHARS", "1234567890"),
-    )
+@timed("validate_otp")
+async def avalidate_otp(value, otp):
+    """Async `validate_otp`."""
+    store = get_otp_store()
+    otp_object = await store.aget(value)
+
+    if otp_object is None or otp_object.is_validated:
+        raise NotFound(detail=NO_PENDING_OTP)
 
-    while OTPValidation.objects.filter(otp__exact=random_number).filter(
-        is_validated=False
-    ):
-        random_number = User.objects.make_random_password(
-            length=otp_settings.get("LENGTH", 6),
-            allowed_chars=otp_settings.get("ALLOWED_CHARS", "1234567890"),
+    if str(otp_object.otp) == str(otp):
+        if await store.amark_validated(otp_object):
+            return True
+        raise NotFound(detail=NO_PENDING_OTP)
+
+    attempts = await store.adecrement_attempts(otp_object)
+    if attempts is None:
+        raise NotFound(detail=NO_PENDING_OTP)
+
+    elif attempts <= 0:
+        await agenerate_otp(otp_object.prop, value)
+        raise AuthenticationFailed(
+            detail=_("Incorrect OTP. Attempt exceeded! OTP has been " "reset.")
         )
 
-    try:
-        otp_object = OTPValidation.objects.get(destination=value)
-    except OTPValidation.DoesNotExist:
-        otp_object = OTPValidation()
-        otp_object.destination = value
     else:
-        if not datetime_passed_now(otp_object.reactive_at):
-            return otp_object
+        raise AuthenticationFailed(
+            detail=_("OTP Validation failed! " + str(attempts) + " attempts left!")
+        )
+
+
+@timed("generate_otp")
+def generate_otp(prop, value):
+    store = get_otp_store()
+    otp_object = store.get(value)
+    if otp_object is not None and not datetime_passed_now(otp_object.reactive_at):
+        return otp_object
+
+    # OTPs are always looked up by destination, so they only need to be random,
+    # not globally unique.
+    otp_settings = drf_auth_settings.OTP
+    random_number = get_random_string(
+        length=otp_settings.LENGTH, allowed_chars=otp_settings.ALLOWED_CHARS
+    )
+
+    return store.reset(
+        destination=value,
+        prop=prop,
+        otp=random_number,
+        attempts=otp_settings.VALIDATION_ATTEMPTS,
+        reactive_at=timezone.now() - datetime.timedelta(minutes=1),
+        record=otp_object,
+    )
+
+
+@timed("generate_otp")
+async def agenerate_otp(prop, value):
+    """Async `generate_otp`."""
+    store = get_otp_store()
+    otp_object = await store.aget(value)
+    if otp_object is not None and not datetime_passed_now(otp_object.reactive_at):
+        return otp_object
+
+    otp_settings = drf_auth_settings.OTP
+    random_number = get_random_string(
+        length=otp_settings.LENGTH, allowed_chars=otp_settings.ALLOWED_CHARS
+    )
+
+    return await store.areset(
+        destination=value,
+        prop=prop,
+        otp=random_number,
+        attempts=otp_settings.VALIDATION_ATTEMPTS,
+        reactive_at=timezone.now() - datetime.timedelta(minutes=1),
+        record=otp_object,
+    )
 
-    otp_object.otp = random_number
-    otp_object.prop = prop
 
-    otp_object.is_validated = False
+def purge_otps(
+    pending_after: int = None,
+    validated_after: int = None,
+    batch_size: int = 1000,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Deletes stale OTP records in batches.
 
-    otp_object.validate_attempt = otp_settings["VALIDATION_ATTEMPTS"]
+    Parameters
+    ----------
+    pending_after: int
+        Minutes after which an unvalidated OTP is deleted.
+        Defaults to `OTP.PURGE_PENDING_AFTER`.
+    validated_after: int
+        Minutes after which a validated OTP is deleted.
+        Defaults to `OTP.PURGE_VALIDATED_AFTER`.
+    batch_size: int
+        Maximum number of rows deleted per statement.
+    dry_run: bool
+        Only count the records that would be deleted.
 
-    otp_object.reactive_at = timezone.now() - datetime.timedelta(minutes=1)
-    otp_object.save()
-    return otp_object
+    Returns
+    -------
+    result: dict
+        Number of pending and validated records deleted, and elapsed seconds.
+    """
+    if pending_after is None:
+        pending_after = drf_auth_settings.OTP.PURGE_PENDING_AFTER
+    if validated_after is None:
+        validated_after = drf_auth_settings.OTP.PURGE_VALIDATED_AFTER
+
+    now = timezone.now()
+    started = time.monotonic()
+    result = get_otp_store().purge(
+        pending_before=now - datetime.timedelta(minutes=pending_after),
+        validated_before=now - datetime.timedelta(minutes=validated_after),
+        batch_size=batch_size,
+        dry_run=dry_run,
+    )
+    result["seconds"] = time.monotonic() - started
+    return result
 
 
 def datetime_passed_now(source):
     if source.tzinfo is not None and source.tzinfo.utcoffset(source) is not None:
-        return source <= datetime.datetime.utcnow().replace(tzinfo=pytz.utc)
+        return source <= datetime.datetime.now(datetime.timezone.utc)
     else:
         return source <= datetime.datetime.now()
 
 
-def send_otp(value, otpobj):
-    otp = otpobj.otp
-
-    if not datetime_passed_now(otpobj.reactive_at):
-        raise PermissionDenied(
-            detail=_("OTP sending not allowed until: " + str(otpobj.reactive_at))
-        )
-
-    message = (
+def get_otp_message(value, otpobj) -> str:
+    return (
         "OTP for verifying "
         + otpobj.get_prop_display()
         + ": "
         + value
         + " is "
-        + otp
+        + otpobj.otp
         + ". Don't share this with anyone!"
     )
 
+
+def send_otp(value, otpobj):
+    if not datetime_passed_now(otpobj.reactive_at):
+        raise PermissionDenied(
+            detail=_("OTP sending not allowed until: " + str(otpobj.reactive_at))
+        )
+
+    message = get_otp_message(value, otpobj)
+
+    from drf_auth.delivery import queue_message
+
+    otp_settings = drf_auth_settings.OTP
     try:
-        rdata = send_message(message, otp_settings["SUBJECT"], value)
+        rdata = queue_message(message, otp_settings.SUBJECT, value)
     except ValueError as err:
         raise APIException(_("Server configuration error occured: %s") % str(err))
 
-    otpobj.reactive_at = timezone.now() + datetime.timedelta(
-        minutes=otp_settings["COOLING_PERIOD"]
+    reactive_at = timezone.now() + datetime.timedelta(
+        minutes=otp_settings.COOLING_PERIOD
     )
-    otpobj.save()
+    if rdata["success"]:
+        # The cooldown and the send counter, in one write.
+        get_otp_store().record_send(otpobj, reactive_at)
+    else:
+        get_otp_store().set_reactive_at(otpobj, reactive_at)
 
     return rdata
 
 
-def send_message(message: str, subject: str, recip: str, html_message: str = None):
+async def asend_otp(value, otpobj):
     """
-    Sends message to specified value.
-    Source: Himanshu Shankar (https://github.com/iamhssingh)
+    Async `send_otp`.
+
+    The message is queued from a thread, so a synchronous delivery backend
+    does not block the event loop.
+    """
+    if not datetime_passed_now(otpobj.reactive_at):
+        raise PermissionDenied(
+            detail=_("OTP sending not allowed until: " + str(otpobj.reactive_at))
+        )
+
+    message = get_otp_message(value, otpobj)
+
+    from drf_auth.delivery import queue_message
+
+    otp_settings = drf_auth_settings.OTP
+    try:
+        rdata = await sync_to_async(queue_message)(message, otp_settings.SUBJECT, value)
+    except ValueError as err:
+        raise APIException(_("Server configuration error occured: %s") % str(err))
+
+    reactive_at = timezone.now() + datetime.timedelta(
+        minutes=otp_settings.COOLING_PERIOD
+    )
+    if rdata["success"]:
+        # The cooldown and the send counter, in one write.
+        await get_otp_store().arecord_send(otpobj, reactive_at)
+    else:
+        await get_otp_store().aset_reactive_at(otpobj, reactive_at)
+
+    return rdata
+
+
+def check_recipient(recip: str) -> bool:
+    """
+    Validates recipient and the settings required to reach it.
+
     Parameters
     ----------
-    message: str
-        Message that is to be sent to user.
-    subject: str
-        Subject that is to be sent to user, in case prop is an email.
     recip: str
         Recipient to whom message is being sent.
-    html_message: str
-        HTML variant of message, if any.
 
     Returns
     -------
-    sent: dict
+    is_email: bool
+        Whether the recipient is an email address (otherwise a mobile number).
     """
 
-    import smtplib
-
     from django.conf import settings
-    from django.core.mail import send_mail
-    from sendsms import api
-
-    sent = {"success": False, "message": None}
 
     # Check if the value of recipient is valid (min length: a@b.c)
     if len(recip) < 5:
@@ -171,8 +289,8 @@ def send_message(message: str, subject: str, recip: str, html_message: str = Non
     is_email = True
     try:
         validate_email(recip)
-    except Exception as e:
-        print(e)
+    except ValidationError:
+        # Not an email address, so a mobile number.
         is_email = False
 
     if is_email:
@@ -185,15 +303,68 @@ def send_message(message: str, subject: str, recip: str, html_message: str = Non
                 "EMAIL_FROM must be defined in django setting "
                 "for sending mail. Who is sending email?"
             )
+    return is_email
+
+
+_transports = None
+
+
+def get_transports() -> tuple:
+    """
+    Returns `django.core.mail`, `sendsms.api` and `smtplib.SMTPException`.
+
+    They are imported on the first message rather than with this module, and
+    kept for later ones.
+    """
+    global _transports
+    if _transports is None:
+        import smtplib
+
+        from django.core import mail
+        from sendsms import api
+
+        _transports = (mail, api, smtplib.SMTPException)
+    return _transports
+
+
+@timed("send_message")
+def send_message(message: str, subject: str, recip: str, html_message: str = None):
+    """
+    Sends message to specified value.
+    Source: Himanshu Shankar (https://github.com/iamhssingh)
+    Parameters
+    ----------
+    message: str
+        Message that is to be sent to user.
+    subject: str
+        Subject that is to be sent to user, in case prop is an email.
+    recip: str
+        Recipient to whom message is being sent.
+    html_message: str
+        HTML variant of message, if any.
+
+    Returns
+    -------
+    sent: dict
+    """
+
+    from django.conf import settings
+
+    mail, api, SMTPException = get_transports()
+    sent = {"success": False, "message": None}
+
+    is_email = check_recipient(recip)
+
+    if is_email:
         try:
-            send_mail(
+            mail.send_mail(
                 subject=subject,
                 message=message,
                 html_message=html_message,
                 from_email=settings.EMAIL_FROM,
                 recipient_list=[recip],
             )
-        except smtplib.SMTPException as ex:
+        except SMTPException as ex:
             sent["message"] = "Message sending failed!" + str(ex.args)
             sent["success"] = False
         else:
@@ -1,59 +1,114 @@
+import codecs
+import json
+import tempfile
+from contextlib import contextmanager
+
 from django.contrib.auth import get_user_model
-from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils.translation import gettext_lazy as _
-from drf_auth.app_settings import DRF_AUTH_SETTINGS
+from drf_auth.app_settings import drf_auth_settings
+from drf_auth.authentication import get_model_user
+from drf_auth.export import CONTENT_TYPES, export_users, parse_bound
+from drf_auth.hashers import run_hasher
+from drf_auth.images import schedule_thumbnails
+from drf_auth.login_tracking import update_last_login
+from drf_auth.metrics import InstrumentedViewMixin, get_sink, is_enabled
+from drf_auth.provisioning import FORMATS, get_shared_executor, import_users
+from drf_auth.revocation import get_revocation_index
+from drf_auth.routers import get_write_db
 from drf_auth.serializers import (
     CustomTokenObtainPairSerializer,
     JWTSerializer,
     OTPSerializer,
+    RevocationAwareTokenVerifySerializer,
+    RotatingTokenRefreshSerializer,
     UserSerializer,
 )
+from drf_auth.throttling import (
+    FailureThrottlingMixin,
+    LoginRateThrottle,
+    OTPRateThrottle,
+)
+from drf_auth.tokens import get_token_factory
 from drf_auth.utils import generate_otp, send_otp, validate_otp
 from rest_framework import status
 from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.generics import CreateAPIView, GenericAPIView, RetrieveUpdateAPIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
 
 User = get_user_model()
 
 
-class RegisterView(CreateAPIView):
+def get_conflict_error(serializer) -> ValidationError:
+    """The validation error for a unique constraint violation on save."""
+    # The conflicting user was just saved; a replica may not have it yet.
+    errors = serializer.find_conflicts(serializer.validated_data, get_write_db())
+    return ValidationError(
+        errors or {"non_field_errors": [_("A user with these details already exists.")]}
+    )
+
+
+@contextmanager
+def map_integrity_error(serializer):
+    """
+    Turns a unique constraint violation into a validation error.
+
+    UserSerializer already checks for duplicates; this only covers a concurrent
+    request inserting the same identity in between.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        raise get_conflict_error(serializer)
+
+
+def build_user(validated_data: dict):
+    """
+    Returns the unsaved user for a registration, without its password.
+
+    Raises
+    ------
+    ValidationError: If a required email or mobile number is missing.
+    """
+    if not drf_auth_settings.EMAIL_OPTIONAL:
+        if validated_data.get("email", None) is None:
+            raise ValidationError({"email": [_("Email is required.")]})
+    if not drf_auth_settings.MOBILE_OPTIONAL:
+        if validated_data.get("mobile", None) is None:
+            raise ValidationError({"mobile": [_("Mobile is required.")]})
+    email = validated_data.get("email", None)
+    # Not create_user(), which stores a missing email as "" and so makes the
+    # unique constraint reject every registration without one but the first.
+    return User(
+        username=User.normalize_username(validated_data["username"]),
+        name=validated_data["name"],
+        email=User.objects.normalize_email(email) if email else None,
+        mobile=validated_data.get("mobile", None),
+        is_active=True,
+    )
+
+
+class RegisterView(InstrumentedViewMixin, CreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = UserSerializer
 
     def perform_create(self, serializer):
-        if not DRF_AUTH_SETTINGS.get("EMAIL_OPTIONAL", True):
-            if serializer.validated_data.get("email", None) is None:
-                raise ValidationError({"email": [_("Email is required.")]})
-        if not DRF_AUTH_SETTINGS.get("MOBILE_OPTIONAL", False):
-            if serializer.validated_data.get("mobile", None) is None:
-                raise ValidationError({"mobile": [_("Mobile is required.")]})
-        if "email" in serializer.validated_data.keys():
-            if (
-                User.objects.filter(email=serializer.validated_data["email"])
-                .exclude(username=serializer.validated_data["username"])
-                .count()
-                > 0
-            ):
-                raise ValidationError(
-                    {"email": [_("A user with that email already exists.")]}
-                )
-        data = {
-            "username": serializer.validated_data["username"],
-            "name": serializer.validated_data["name"],
-            "password": serializer.validated_data["password"],
-            "email": serializer.validated_data.get("email", None),
-            "mobile": serializer.validated_data.get("mobile", None),
-            "is_active": True,
-        }
-        return User.objects.create_user(**data)
+        user = build_user(serializer.validated_data)
+        run_hasher(user.set_password, serializer.validated_data["password"])
+        with map_integrity_error(serializer):
+            user.save()
+        return user
 
 
-class LoginView(GenericAPIView):
+class LoginView(FailureThrottlingMixin, InstrumentedViewMixin, GenericAPIView):
     permission_classes = (AllowAny,)
+    throttle_classes = (LoginRateThrottle,)
     serializer_class = CustomTokenObtainPairSerializer
 
     def post(self, request, *args, **kwargs):
@@ -64,17 +119,16 @@ class LoginView(GenericAPIView):
             "access_token": serializer.validated_data.get("access"),
             "refresh_token": serializer.validated_data.get("refresh"),
         }
-        user = serializer.user
-        user.last_login = timezone.now()
-        user.save()
+        update_last_login(serializer.user)
         jwtserializer = JWTSerializer(
             instance=data, context=self.get_serializer_context()
         )
         return Response(jwtserializer.data, status=status.HTTP_200_OK)
 
 
-class OTPView(APIView):
+class OTPView(FailureThrottlingMixin, InstrumentedViewMixin, APIView):
     permission_classes = (AllowAny,)
+    throttle_classes = (OTPRateThrottle,)
     serializer_class = OTPSerializer
 
     def post(self, request, *args, **kwargs):
@@ -88,20 +142,13 @@ class OTPView(APIView):
         if "otp" in request.data.keys():
             if validate_otp(destination, request.data.get("otp")):
                 if is_login:
-                    user = serializer.user
-                    user.last_login = timezone.now()
-                    user.save()
-                    token = RefreshToken.for_user(user)
-                    if hasattr(user, "email"):
-                        token["email"] = user.email
-                    if hasattr(user, "mobile"):
-                        token["mobile"] = user.mobile
-                    if hasattr(user, "name"):
-                        token["name"] = user.name
+                    user = serializer.validated_data["user"]
+                    update_last_login(user)
+                    tokens = get_token_factory().for_user(user)
                     data = {
                         "user": user,
-                        "access_token": str(token.access_token),
-                        "refresh_token": str(token),
+                        "access_token": tokens["access"],
+                        "refresh_token": tokens["refresh"],
                     }
                     jwtserializer = JWTSerializer(instance=data)
                     return Response(jwtserializer.data, status=status.HTTP_202_ACCEPTED)
@@ -119,9 +166,6 @@ class OTPView(APIView):
             sentotp = send_otp(destination, otp_obj)
 
             if sentotp["success"]:
-                otp_obj.send_counter += 1
-                otp_obj.save()
-
                 return Response(sentotp, status=status.HTTP_201_CREATED)
             else:
                 raise APIException(
@@ -129,30 +173,147 @@ class OTPView(APIView):
                 )
 
 
-class RetrieveUpdateUserAccountView(RetrieveUpdateAPIView):
+class RetrieveUpdateUserAccountView(InstrumentedViewMixin, RetrieveUpdateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
 
     def get_object(self):
-        return self.request.user
+        return get_model_user(self.request.user)
 
-    def update(self, request, *args, **kwargs):
-        if "email" in request.data.keys():
-            if (
-                User.objects.filter(email=request.data["email"])
-                .exclude(id=self.request.user.id)
-                .count()
-                > 0
-            ):
-                raise ValidationError(
-                    {"email": ["A user with that email already exists."]}
-                )
+    def perform_update(self, serializer):
+        replaced = serializer.instance.image.name
+        with map_integrity_error(serializer):
+            super().perform_update(serializer)
+        if "image" in serializer.validated_data:
+            schedule_thumbnails(serializer.instance.image.name, replaced=replaced)
 
+    def update(self, request, *args, **kwargs):
         resp = super(RetrieveUpdateUserAccountView, self).update(
             request, *args, **kwargs
         )
         if "password" in request.data.keys():
-            request.user.set_password(request.data["password"])
+            run_hasher(request.user.set_password, request.data["password"])
             request.user.save()
         return resp
+
+
+class RotatingTokenRefreshView(InstrumentedViewMixin, TokenRefreshView):
+    serializer_class = RotatingTokenRefreshSerializer
+
+
+class RevocationAwareTokenVerifyView(InstrumentedViewMixin, TokenVerifyView):
+    serializer_class = RevocationAwareTokenVerifySerializer
+
+
+class LogoutEverywhereView(InstrumentedViewMixin, APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        get_revocation_index().revoke_user(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ImportUsersView(InstrumentedViewMixin, APIView):
+    """
+    Creates users from an uploaded CSV or JSON lines `file`.
+
+    The import runs in the view, so within `ATOMIC_REQUESTS` and the request
+    metrics, and a failure is an error response rather than a truncated one.
+    The rejected rows are written to a spooled temporary file as they are
+    found, and the response streams it: one JSON object per rejected row,
+    followed by the `created`/`failed` counts. Passwords are hashed in the
+    pool shared by all requests, of `PROVISIONING["VIEW_PROCESSES"]` workers,
+    rather than in a pool started per request.
+    """
+
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+    # Reports larger than this are moved from memory to disk.
+    report_max_memory = 1024 * 1024
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": [_("No file was submitted.")]})
+        fmt = request.data.get("format") or (
+            "jsonl" if upload.name.endswith((".jsonl", ".ndjson")) else "csv"
+        )
+        if fmt not in FORMATS:
+            raise ValidationError({"format": [_("Unknown import format.")]})
+
+        report = tempfile.SpooledTemporaryFile(
+            max_size=self.report_max_memory, mode="w+", encoding="utf-8"
+        )
+        try:
+            result = import_users(
+                codecs.iterdecode(upload, "utf-8-sig"),
+                fmt,
+                report=report,
+                processes=drf_auth_settings.PROVISIONING.VIEW_PROCESSES,
+                executor=get_shared_executor(),
+            )
+            report.write(json.dumps(result) + "\n")
+            report.seek(0)
+        except Exception:
+            report.close()
+            raise
+        # The response closes the file once sent.
+        return StreamingHttpResponse(report, content_type="application/x-ndjson")
+
+
+class ExportUsersView(InstrumentedViewMixin, APIView):
+    """
+    Streams the user table.
+
+    Query parameters: `export_format` (csv, jsonl or ndjson), `fields` (comma
+    separated), `joined_after`, `joined_before` and `gzip`. `format` is left
+    to DRF's renderer selection.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        fmt = params.get("export_format", "csv")
+        gzip = params.get("gzip", "").lower() in ("1", "true", "yes")
+        try:
+            chunks = export_users(
+                fmt=fmt,
+                fields=params["fields"].split(",") if params.get("fields") else None,
+                joined_after=params.get("joined_after")
+                and parse_bound(params["joined_after"]),
+                joined_before=params.get("joined_before")
+                and parse_bound(params["joined_before"]),
+                gzip=gzip,
+            )
+        except ValueError as e:
+            raise ValidationError({"non_field_errors": [str(e)]})
+
+        filename = "users.%s" % fmt
+        if gzip:
+            response = StreamingHttpResponse(chunks, content_type="application/gzip")
+            filename += ".gz"
+        else:
+            response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+        response["Content-Disposition"] = 'attachment; filename="%s"' % filename
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Exports the drf_auth histograms in the Prometheus text format.
+
+    Only available with `METRICS["ENABLED"]` and a sink that can render
+    itself, such as the default `PrometheusSink`.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        sink = get_sink()
+        if not is_enabled() or not hasattr(sink, "render"):
+            raise Http404
+        return HttpResponse(
+            sink.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )